@@ -0,0 +1,309 @@
+"""
+Keystroke analytics over the sessions history: error rates of the characters and
+bigrams, inter-key latency percentiles and speed by the token class (letters,
+brackets, operators, indentation ...). Keystrokes are loaded into NumPy arrays and
+every statistic is computed by the array operations, there is no Python loop over
+the keystrokes, so millions of them take seconds.
+
+    python -m analytics [--db ~/.typing_checker/history.sqlite3] [--top 15]
+
+Expected character of the wrong keystroke is the one which was typed correctly
+at the same place later. Latency is the time since the previous keystroke of the
+session, pauses and keys which came at once (paste) are not counted.
+"""
+
+import argparse
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from constants import Constants as const
+from history import SessionHistory
+from statistics import KeystrokeLog
+
+_ROW = np.dtype([("session", np.int64), ("time_ns", np.int64), ("char", np.int64), ("line", np.int64),
+                 ("col", np.int64), ("flag", np.int8)])
+
+LETTERS, DIGITS, SPACES, INDENTATION, NEWLINES, BRACKETS, OPERATORS, PUNCTUATION = range(8)
+CLASS_NAMES = ("letters", "digits", "spaces", "indentation", "newlines", "brackets", "operators", "punctuation")
+
+# Class of every ASCII character, the last item is for all the others
+_CLASS_TABLE = np.full(129, PUNCTUATION, dtype=np.int8)
+for _chars, _cls in (("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_", LETTERS), ("0123456789", DIGITS),
+                     (" ", SPACES), ("\n\r", NEWLINES), ("()[]{}", BRACKETS), ("+-*/%=<>!&|^~?:", OPERATORS)):
+    _CLASS_TABLE[[ord(char) for char in _chars]] = _cls
+_CLASS_TABLE[128] = LETTERS
+
+_CHAR_NAMES = {"\n": "Enter", "\r": "Enter", " ": "Space", "\t": "Tab"}
+
+
+def char_name(code: int) -> str:
+    char = chr(code)
+    return _CHAR_NAMES.get(char, char)
+
+
+def pack(columns: Sequence[np.ndarray], max_bits: int = 63) -> Optional[np.ndarray]:
+    """
+    Non-negative integer columns packed into one int64 key, its order is the lexicographic
+    order of the columns. Sorting the key is much faster than np.lexsort. None if they don't fit
+    """
+    bits = [int(column.max()).bit_length() if len(column) else 0 for column in columns]
+    if sum(bits) > max_bits:
+        return None
+    key = np.zeros(len(columns[0]), dtype=np.int64)
+    for column, column_bits in zip(columns, bits):
+        key <<= column_bits
+        key |= column
+    return key
+
+
+def dense_ids(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Distinct codes in ascending order and the index of every code in them, like np.unique without sorting """
+    present = np.flatnonzero(np.bincount(codes))
+    lookup = np.zeros(present[-1] + 1 if len(present) else 0, dtype=np.int64)
+    lookup[present] = np.arange(len(present))
+    return present, lookup[codes]
+
+
+class Keystrokes:
+    """ Column arrays of the keystrokes in the typing order, sessions one after another """
+
+    def __init__(self, session: np.ndarray, time_ns: np.ndarray, char: np.ndarray, line: np.ndarray,
+                 col: np.ndarray, flag: np.ndarray):
+        self.session = session
+        self.time_ns = time_ns
+        self.char = char
+        self.line = line
+        self.col = col
+        self.flag = flag
+
+    def __len__(self):
+        return len(self.flag)
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray) -> "Keystrokes":
+        return cls(rows["session"], rows["time_ns"], rows["char"], rows["line"], rows["col"], rows["flag"])
+
+    @classmethod
+    def from_log(cls, log: KeystrokeLog, session: int = 0) -> "Keystrokes":
+        """ Keystrokes of the ring buffer which are still there, the oldest first """
+        order = np.arange(log.total - len(log), log.total) % log.capacity
+        return cls(np.full(len(order), session, dtype=np.int64),
+                   np.frombuffer(log.time_ns, dtype=np.int64)[order],
+                   np.frombuffer(log.char, dtype=np.uint32)[order].astype(np.int64),
+                   np.frombuffer(log.line, dtype=np.uint32)[order].astype(np.int64),
+                   np.frombuffer(log.col, dtype=np.uint32)[order].astype(np.int64),
+                   np.frombuffer(log.flag, dtype=np.uint8)[order].astype(np.int8))
+
+    @classmethod
+    def from_history(cls, db_path: str) -> "Keystrokes":
+        """ All the keystrokes of the database, rows go to the array without the intermediate list """
+        with closing(sqlite3.connect(db_path)) as conn:
+            # Count and rows are read in one transaction, the writer thread may be adding keystrokes
+            conn.execute("BEGIN")
+            count = conn.execute("SELECT count(*) FROM keystrokes").fetchone()[0]
+            cursor = conn.execute("SELECT session_id, time_ns, char, line, col, flag FROM keystrokes "
+                                  "ORDER BY session_id, seq")
+            return cls.from_rows(np.fromiter(cursor, dtype=_ROW, count=count))
+
+
+@dataclass
+class Report:
+    keystrokes: int = 0
+    sessions: int = 0
+    errors: int = 0
+    # p50, p90, p99 of the inter-key latency
+    latency_ms: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    # (character, attempts, errors, error rate, p50 latency ms), the highest error rate first
+    chars: List[Tuple[str, int, int, float, float]] = field(default_factory=list)
+    # (bigram, attempts, errors, error rate, p50 latency ms), the highest error rate first
+    bigrams: List[Tuple[str, int, int, float, float]] = field(default_factory=list)
+    # (class, keystrokes, p50 latency ms, p90 latency ms, WPM at the p50 latency)
+    classes: List[Tuple[str, int, float, float, float]] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+
+    def format(self, top: int = 15) -> str:
+        lines = [f"{self.keystrokes} keystrokes in {self.sessions} sessions, {self.errors} errors, "
+                 f"analysed in {self.elapsed_sec:.2f} s",
+                 "Inter-key latency: p50 %.0f ms, p90 %.0f ms, p99 %.0f ms" % self.latency_ms, "",
+                 f"{'Class':<14}{'keys':>10}{'p50 ms':>10}{'p90 ms':>10}{'WPM':>8}"]
+        lines += [f"{name:<14}{count:>10}{p50:>10.0f}{p90:>10.0f}{wpm:>8.0f}" for name, count, p50, p90, wpm in self.classes]
+        for title, rows in (("Character", self.chars), ("Bigram", self.bigrams)):
+            lines += ["", f"{title:<14}{'typed':>10}{'errors':>10}{'rate':>8}{'p50 ms':>10}"]
+            lines += [f"{name:<14}{count:>10}{errors:>10}{rate:>8.1%}{p50:>10.0f}"
+                      for name, count, errors, rate, p50 in rows[:top]]
+        return "\n".join(lines)
+
+
+def expected_chars(keys: Keystrokes) -> np.ndarray:
+    """
+    Character the keystroke had to type: itself for the correct ones, the correct one which
+    was typed later at the same place for the wrong ones. -1 for the backspaces and the errors
+    which were never fixed.
+    """
+    n = len(keys)
+    index = np.arange(n)
+    # Keystrokes at the same place of the same session come together, in the typing order.
+    # Sessions are one after another, their numbers from 0 fit the key better than the ids
+    session = np.concatenate(([0], np.cumsum(keys.session[1:] != keys.session[:-1])))
+    index_bits = max(1, (n - 1).bit_length())
+    place = pack((session, keys.line, keys.col), 63 - index_bits)
+    if place is not None:
+        order = np.sort((place << index_bits) | index) & ((1 << index_bits) - 1)
+    else:
+        order = np.lexsort((index, keys.col, keys.line, keys.session))
+    correct = keys.flag[order] == KeystrokeLog.CORRECT
+    # For every keystroke the nearest correct one at or after it in this order
+    next_correct = np.minimum.accumulate(np.where(correct, index, n)[::-1])[::-1]
+    found = next_correct < n
+    next_correct = np.minimum(next_correct, n - 1)
+    sorted_ids = order[next_correct]
+    same_place = found & (keys.session[sorted_ids] == keys.session[order]) & \
+        (keys.line[sorted_ids] == keys.line[order]) & (keys.col[sorted_ids] == keys.col[order])
+    expected = np.empty(n, dtype=np.int64)
+    expected[order] = np.where(same_place, keys.char[sorted_ids], -1)
+    expected[keys.flag == KeystrokeLog.BACKSPACE] = -1
+    return expected
+
+
+def latencies(keys: Keystrokes, max_pause_ns: int = SessionHistory.MAX_BIGRAM_LATENCY_NS) -> np.ndarray:
+    """ Time since the previous keystroke of the session, -1 where it isn't a typing latency """
+    latency = np.full(len(keys), -1, dtype=np.int64)
+    if len(keys) < 2:
+        return latency
+    diff = np.diff(keys.time_ns)
+    valid = (keys.session[1:] == keys.session[:-1]) & (diff > 0) & (diff <= max_pause_ns)
+    latency[1:] = np.where(valid, diff, -1)
+    return latency
+
+
+def token_classes(keys: Keystrokes, expected: np.ndarray) -> np.ndarray:
+    """ Class of the expected character, spaces after the line start are the indentation. -1 for the unknown ones """
+    classes = np.where(expected >= 0, _CLASS_TABLE[np.clip(expected, 0, 128)], -1).astype(np.int8)
+    spaces = classes == SPACES
+    # The last keystroke before every one which wasn't a space or a backspace
+    index = np.arange(len(keys))
+    not_space = (expected >= 0) & ~spaces
+    last = np.maximum.accumulate(np.where(not_space, index, -1))
+    before = np.concatenate(([-1], last[:-1]))
+    prev = np.maximum(before, 0)
+    # Sessions saved before the Return was logged as "\n" have "\r" there
+    line_start = (before < 0) | (expected[prev] == ord("\n")) | (expected[prev] == ord("\r")) | \
+        (keys.session[prev] != keys.session)
+    classes[spaces & line_start] = INDENTATION
+    return classes
+
+
+def group_percentiles(groups: np.ndarray, values: np.ndarray, group_cnt: int, qs: Sequence[float]) -> List[np.ndarray]:
+    """ Nearest rank percentiles of the non-negative values of every group, NaN for the empty groups """
+    if not len(values):
+        return [np.full(group_cnt, np.nan) for _ in qs]
+    key = pack((groups, values))
+    if key is not None:
+        sorted_values = (np.sort(key) & ((1 << int(values.max()).bit_length()) - 1)).astype(np.float64)
+    else:
+        sorted_values = values[np.lexsort((values, groups))].astype(np.float64)
+    counts = np.bincount(groups, minlength=group_cnt)
+    starts = np.cumsum(counts) - counts
+    result = []
+    for q in qs:
+        positions = starts + np.rint(q * np.maximum(counts - 1, 0)).astype(np.int64)
+        picked = sorted_values[np.minimum(positions, len(sorted_values) - 1)]
+        result.append(np.where(counts > 0, picked, np.nan))
+    return result
+
+
+def error_table(codes: np.ndarray, wrong: np.ndarray, latency: np.ndarray, min_count: int, name) -> list:
+    """ Attempts, errors, error rate and p50 latency of the correct ones per code, the highest rate first """
+    unique, groups = dense_ids(codes)
+    attempts = np.bincount(groups, minlength=len(unique))
+    errors = np.bincount(groups, weights=wrong, minlength=len(unique)).astype(np.int64)
+    timed = ~wrong & (latency >= 0)
+    p50, = group_percentiles(groups[timed], latency[timed], len(unique), (0.5,))
+    rate = errors / np.maximum(attempts, 1)
+    shown = np.flatnonzero(attempts >= min_count)
+    shown = shown[np.lexsort((-attempts[shown], -rate[shown]))]
+    return [(name(int(unique[i])), int(attempts[i]), int(errors[i]), float(rate[i]), float(p50[i]) / 1e6)
+            for i in shown]
+
+
+def analyse(keys: Keystrokes, min_count: int = 20) -> Report:
+    start = time.perf_counter()
+    report = Report(keystrokes=len(keys))
+    if not len(keys):
+        return report
+    report.sessions = len(np.unique(keys.session))
+    wrong = keys.flag == KeystrokeLog.WRONG
+    report.errors = int(np.count_nonzero(wrong))
+
+    expected = expected_chars(keys)
+    latency = latencies(keys)
+    correct = keys.flag == KeystrokeLog.CORRECT
+    typed = correct & (latency >= 0)
+    if typed.any():
+        report.latency_ms = tuple(float(value) / 1e6 for value in np.percentile(latency[typed], (50, 90, 99)))
+
+    attempts = expected >= 0
+    report.chars = error_table(expected[attempts], wrong[attempts], latency[attempts], min_count, char_name)
+
+    # Bigram is the previous correct character and the expected one of this keystroke.
+    # Both are numbered among the typed characters, so the bigram code is small
+    prev_correct = np.concatenate(([False], correct[:-1] & (keys.session[1:] == keys.session[:-1])))
+    bigram = attempts & prev_correct
+    chars, char_ids = dense_ids(np.where(attempts, expected, keys.char))
+    prev_ids = np.concatenate(([0], char_ids[:-1]))
+    codes = prev_ids[bigram] * len(chars) + char_ids[bigram]
+    report.bigrams = error_table(codes, wrong[bigram], latency[bigram], min_count,
+                                 lambda code: char_name(chars[code // len(chars)]) + char_name(chars[code % len(chars)]))
+
+    classes = token_classes(keys, expected)
+    timed = typed & (classes >= 0)
+    counts = np.bincount(classes[timed], minlength=len(CLASS_NAMES))
+    p50, p90 = group_percentiles(classes[timed].astype(np.int64), latency[timed], len(CLASS_NAMES), (0.5, 0.9))
+    # 5 symbols per word: WPM = 60 s / latency / 5
+    report.classes = [(CLASS_NAMES[i], int(counts[i]), p50[i] / 1e6, p90[i] / 1e6, 12e9 / p50[i])
+                      for i in range(len(CLASS_NAMES)) if counts[i]]
+    report.elapsed_sec = time.perf_counter() - start
+    return report
+
+
+class HistoryReport(threading.Thread):
+    """ Loads and analyses the history on the thread, the formatted report or the error text comes to the queue """
+
+    def __init__(self, db_path: str = const.HISTORY_DB_PATH, top: int = 15):
+        super().__init__(name="analytics", daemon=True)
+        self.db_path = db_path
+        self.top = top
+        self.queue = queue.Queue()
+
+    def run(self):
+        try:
+            start = time.perf_counter()
+            keys = Keystrokes.from_history(self.db_path)
+            loaded = time.perf_counter() - start
+            self.queue.put(analyse(keys).format(self.top) + f"\n\nLoaded from {self.db_path} in {loaded:.2f} s")
+        except sqlite3.Error as err:
+            self.queue.put(f"History {self.db_path} can't be read: {err}")
+        except Exception as err:
+            # Anything else ends the thread too, the window waits for the queue
+            self.queue.put(f"History {self.db_path} can't be analysed: {err!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=const.HISTORY_DB_PATH, help="sessions history database")
+    parser.add_argument("--top", type=int, default=15, help="characters and bigrams with the highest error rate")
+    args = parser.parse_args()
+    worker = HistoryReport(args.db, args.top)
+    worker.run()
+    print(worker.queue.get())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Keystroke analytics of the generated sessions: analyse() of the arrays and
+Keystrokes.from_history() of the same keystrokes written to a history database.
+Keystrokes are C source typed at about 60 WPM with errors fixed by a backspace.
+
+Run from the repository root (needs NumPy):
+    python -m benchmarks.analytics [--keys 10000000] [--db-keys 1000000]
+"""
+
+import argparse
+import os.path
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+import numpy as np
+
+from analytics import Keystrokes, analyse
+from history import SCHEMA
+from statistics import KeystrokeLog
+
+from benchmarks.suite import SOURCE_LINES, WRONG_EVERY
+
+
+def generate_keystrokes(count: int, session_keys: int = 100000, seed: int = 1) -> Keystrokes:
+    """ Text is typed in order, every WRONG_EVERY-th symbol is typed wrong first and erased """
+    rng = np.random.default_rng(seed)
+    text = np.frombuffer("\n".join(SOURCE_LINES).encode() + b"\n", dtype=np.uint8).astype(np.int64)
+    symbols = count * WRONG_EVERY // (WRONG_EVERY + 2) + 1
+    offsets = np.arange(symbols) % len(text)
+    chars = text[offsets]
+    newline = np.concatenate(([0], (chars[:-1] == ord("\n")).astype(np.int64)))
+    line = np.cumsum(newline) + 1
+    line_start = np.maximum.accumulate(np.where(newline == 1, np.arange(symbols), 0))
+    col = np.arange(symbols) - line_start
+
+    # Wrong key and its backspace go right before every WRONG_EVERY-th symbol
+    erred = np.arange(symbols) % WRONG_EVERY == WRONG_EVERY - 1
+    per_symbol = np.where(erred, 3, 1)
+    first = np.cumsum(per_symbol) - per_symbol
+    total = int(per_symbol.sum())
+    char = np.empty(total, dtype=np.int64)
+    flag = np.full(total, KeystrokeLog.CORRECT, dtype=np.int8)
+    char[first + 2 * erred] = chars
+    wrong, backspace = first[erred], first[erred] + 1
+    char[wrong], flag[wrong] = ord("#"), KeystrokeLog.WRONG
+    char[backspace], flag[backspace] = 8, KeystrokeLog.BACKSPACE
+    positions = np.repeat(np.arange(symbols), per_symbol)
+
+    keys = Keystrokes(np.arange(total, dtype=np.int64) // session_keys,
+                      np.cumsum(rng.gamma(4, 50e6, total).astype(np.int64)), char, line[positions], col[positions], flag)
+    keys.col[backspace] += 1
+    return keys
+
+
+def write_history(path: str, keys: Keystrokes):
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO sessions (id, file, started_at) VALUES (?, 'generated.c', 0)",
+                         [(int(session),) for session in np.unique(keys.session)])
+        conn.executemany("INSERT INTO keystrokes VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                         zip(keys.session.tolist(), range(len(keys)), keys.time_ns.tolist(), keys.char.tolist(),
+                             keys.line.tolist(), keys.col.tolist(), keys.flag.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=10000000, help="keystrokes analysed from the arrays")
+    parser.add_argument("--db-keys", type=int, default=1000000, help="keystrokes loaded from the database, 0 to skip")
+    args = parser.parse_args()
+
+    keys = generate_keystrokes(args.keys)
+    start = time.perf_counter()
+    report = analyse(keys)
+    print(f"analyse        {len(keys):>10} keystrokes  {time.perf_counter() - start:6.2f} s")
+    print(report.format(5))
+
+    if args.db_keys:
+        with tempfile.TemporaryDirectory(prefix="typing-analytics-") as work_dir:
+            path = os.path.join(work_dir, "history.sqlite3")
+            write_history(path, generate_keystrokes(args.db_keys))
+            start = time.perf_counter()
+            loaded = Keystrokes.from_history(path)
+            print(f"from_history   {len(loaded):>10} keystrokes  {time.perf_counter() - start:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark for the per-keystroke highlight cost on different lines
+of a large document. The current TextProcessor (two tags configured once),
+the old per-line tags scheme and the CanvasProcessor (cells drawn on a canvas
+over the text widget) are measured, the typed prefix before the measured line
+is highlighted the same way a real session would leave it. Long lines are
+made of --line-len copies of the line.
+
+Run from the repository root (uses $DISPLAY or starts Xvfb):
+    python -m benchmarks.highlight [--lines 100000] [--keys 200] [--line-len 1]
+"""
+
+import argparse
+import time
+from tkinter import Tk, Text, TclError
+
+from canvas_processing import CanvasProcessor
+from constants import Constants as const
+from processing import TextProcessor
+from state_structure import Coord, RangeDelta
+
+from benchmarks.xvfb import virtual_display
+
+LINE = "for (int i = 0; i < count; i++) { total += values[i]; }"
+
+
+class LegacyTextProcessor:
+    """ Old highlighting scheme: one tag per line, configured on every keystroke """
+
+    def __init__(self, text):
+        self._text = text
+
+    def render(self, deltas):
+        for delta in deltas:
+            color = const._GOOD_COLOR if delta.state == const._CORRECT else const._BAD_COLOR
+            tag = f"{color}_tag_{delta.line}"
+            self._text.tag_add(tag, f"{delta.line}.{delta.start}", f"{delta.line}.{delta.end}")
+            self._text.tag_configure(tag, background=color)
+
+
+def prefill(proc, text, up_to_line: int, line_len: int):
+    # Emulate a session which typed everything before 'up_to_line' correctly
+    if isinstance(proc, TextProcessor):
+        text.tag_add(const._GOOD_TAG, "1.0", f"{up_to_line}.0")
+        return
+    if isinstance(proc, CanvasProcessor):
+        proc.render_range(const._CORRECT, Coord(1, 0), Coord(up_to_line, 0), lambda line: line_len)
+        return
+    for line in range(1, up_to_line):
+        proc.render((RangeDelta(const._CORRECT, line, 0, line_len, True),))
+
+
+def measure(root, text, proc_cls, line: int, keys: int, line_len: int) -> float:
+    tags = [tag for tag in text.tag_names() if tag != "sel"]
+    if tags:
+        text.tag_delete(*tags)
+    proc = proc_cls(text)
+    prefill(proc, text, line, line_len)
+    text.see(f"{line}.0")
+    root.update()
+
+    start = time.perf_counter()
+    for col in range(keys):
+        proc.render((RangeDelta(const._CORRECT, line, col % line_len, col % line_len + 1, True),))
+        root.update_idletasks()
+    elapsed = time.perf_counter() - start
+    if isinstance(proc, CanvasProcessor):
+        proc.canvas.destroy()
+    return elapsed / keys * 1e6
+
+
+def run(lines: int, keys: int, line_len: int):
+    root = Tk()
+    text = Text(root, wrap="none")
+    text.pack()
+    line_text = " ".join([LINE] * line_len)
+    text.insert("1.0", "\n".join([line_text] * lines))
+
+    checkpoints = sorted({1, lines // 100, lines // 10, lines // 2, lines} - {0})
+    print(f"{'line':>10} {'two tags, us/key':>18} {'per-line tags, us/key':>22} {'canvas, us/key':>16}")
+    for line in checkpoints:
+        current = measure(root, text, TextProcessor, line, keys, len(line_text))
+        legacy = measure(root, text, LegacyTextProcessor, line, keys, len(line_text))
+        canvas = measure(root, text, CanvasProcessor, line, keys, len(line_text))
+        print(f"{line:>10} {current:>18.1f} {legacy:>22.1f} {canvas:>16.1f}")
+
+    root.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--line-len", type=int, default=1, help="copies of the line in every document line")
+    args = parser.parse_args()
+
+    try:
+        with virtual_display():
+            run(args.lines, args.keys, args.line_len)
+    except (RuntimeError, TclError) as err:
+        raise SystemExit(f"Display is required: {err}")
+
+
+if __name__ == "__main__":
+    main()
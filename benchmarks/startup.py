@@ -0,0 +1,116 @@
+"""
+Startup time of the App, cold (the file was never opened) and warm (its snapshot is saved):
+
+    import         'import main' in a new interpreter
+    prepare        read_text, Document index and comments stripping of the file
+    snapshot       SnapshotCache.load of the same file
+    window.cold    'python main.py FILE --startup-probe' until the first frame, without snapshots (Tk)
+    window.warm    the same with the snapshot of the file (Tk)
+
+Every run of main.py gets its own empty home directory, so the history database and
+the snapshots of the user are not touched. Window benchmarks use $DISPLAY or start Xvfb.
+
+Run from the repository root:
+    python -m benchmarks.startup [--sizes 1000,100000] [--repeats 10]
+"""
+
+import argparse
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from corpus import prepare
+from document import Document
+from snapshot import SnapshotCache
+
+from benchmarks.suite import generate_document, summary
+from benchmarks.xvfb import virtual_display
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_import(repeats: int) -> List[int]:
+    code = "import time; start = time.perf_counter_ns(); import main; print(time.perf_counter_ns() - start)"
+    return [int(subprocess.check_output([sys.executable, "-c", code], cwd=ROOT)) for _ in range(repeats)]
+
+
+def run_prepare(path: str, cache: SnapshotCache, repeats: int) -> Dict[str, List[int]]:
+    samples = {"prepare": [], "snapshot": []}
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        prepared = prepare(path)
+        samples["prepare"].append(time.perf_counter_ns() - start)
+    doc = Document()
+    doc.copy_from(prepared.doc)
+    cache.save_later(path, os.stat(path), doc)
+    cache.wait()
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        cache.load(path)
+        samples["snapshot"].append(time.perf_counter_ns() - start)
+    return samples
+
+
+def run_window(path: str, home: str) -> int:
+    """ Time from the start of the process to its 'ready' line """
+    env = dict(os.environ, HOME=home)
+    start = time.perf_counter_ns()
+    proc = subprocess.Popen([sys.executable, "main.py", path, "--startup-probe"], cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    elapsed = time.perf_counter_ns() - start
+    # The process exits after the snapshot is written
+    proc.communicate()
+    if line.strip() != "ready":
+        raise RuntimeError(f"main.py didn't start, exit status {proc.returncode}")
+    return elapsed
+
+
+def run_windows(path: str, work_dir: str, repeats: int) -> Dict[str, List[int]]:
+    home = os.path.join(work_dir, "home")
+    snapshots = os.path.join(home, ".typing_checker", "snapshots")
+    samples = {"window.cold": [], "window.warm": []}
+    for _ in range(repeats):
+        shutil.rmtree(snapshots, ignore_errors=True)
+        samples["window.cold"].append(run_window(path, home))
+        samples["window.warm"].append(run_window(path, home))
+    return samples
+
+
+def print_row(name: str, samples: List[int]):
+    stats = summary(samples)
+    print(f"{name:<24} p50 {stats['p50'] / 1000:9.1f} ms   p99 {stats['p99'] / 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000", help="document sizes in lines, comma separated")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--no-tk", action="store_true", help="skip the benchmarks which start the window")
+    args = parser.parse_args()
+
+    print_row("import", run_import(args.repeats))
+    sizes = [int(size) for size in args.sizes.split(",")]
+    with tempfile.TemporaryDirectory(prefix="typing-startup-") as work_dir:
+        cache = SnapshotCache(os.path.join(work_dir, "snapshots"))
+        paths = {lines: generate_document(work_dir, lines) for lines in sizes}
+        for lines, path in paths.items():
+            for name, samples in run_prepare(path, cache, args.repeats).items():
+                print_row(f"{name}[{lines}]", samples)
+        if args.no_tk:
+            return
+        try:
+            with virtual_display():
+                for lines, path in paths.items():
+                    for name, samples in run_windows(path, work_dir, args.repeats).items():
+                        print_row(f"{name}[{lines}]", samples)
+        except RuntimeError as err:
+            print(f"Window benchmarks are skipped: {err}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Benchmarks of the per-keystroke hot path on generated documents of different sizes:
+
+    keystroke      TypingEngine.feed of one key (correct keys, errors and backspaces)
+    storage        StateStorage calls the engine makes for one key
+    find_comments  FileFilters.find_comments of the whole document, cold and cached
+    load.document  read_text and Document index of the file
+    upd_window     TextProcessor.upd_window of one key, the typed prefix is highlighted (Tk)
+    load.app       App.read_from_file of the file, without its snapshot (Tk)
+    load.app.warm  the same with the snapshot saved by the previous load (Tk)
+
+Tk benchmarks use $DISPLAY or start Xvfb, they are skipped if neither is available.
+Results are compared with the JSON baseline, the exit status is 1 if p50 or p99
+of any benchmark got slower than the baseline by more than the threshold.
+Baseline is made on the machine which runs the suite, the first run is with --save.
+Without the baseline the suite doesn't run and the exit status is 2.
+
+Run from the repository root:
+    python -m benchmarks.suite [--sizes 1000,100000,1000000] [--keys 2000]
+                               [--baseline benchmarks/baseline.json] [--save] [--threshold 0.25]
+"""
+
+import argparse
+import json
+import os.path
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from constants import Constants as const
+from document import Document, read_text
+from engine import TypingEngine
+from file_operations import FileFilters
+from state_structure import Coord, RangeDelta
+from statistics import Statistics
+
+from benchmarks.xvfb import virtual_display
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Generated documents repeat these lines, every comment kind and a tab are there
+SOURCE_LINES = (
+    "int total = 0; /* running sum */",
+    "for (int i = 0; i < count; i++) {",
+    "    total += values[i]; // add the next value",
+    "    if (values[i] < 0) { negative++; }",
+    "}",
+    "// Print the result of the whole pass",
+    'printf("%d values, total %d\\n", count, total);',
+    "    /* block comment",
+    "       on several lines */",
+    "\treturn total;",
+)
+
+# Every WRONG_EVERY key is typed wrong first and then erased
+WRONG_EVERY = 25
+
+
+def percentile(values: List[float], q: float) -> float:
+    """ Nearest rank percentile of the sorted values """
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summary(samples_ns: List[int]) -> Dict[str, float]:
+    values = sorted(sample / 1000 for sample in samples_ns)
+    return {
+        "samples": len(values),
+        "p50": percentile(values, 0.5),
+        "p99": percentile(values, 0.99),
+        "mean": sum(values) / len(values),
+    }
+
+
+def timed(func: Callable, repeats: int) -> List[int]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def whole_doc_repeats(lines: int) -> int:
+    # Whole document operations are slow on the large ones, take fewer samples there
+    return max(3, min(50, 2000000 // lines))
+
+
+def generate_document(directory: str, lines: int) -> str:
+    path = os.path.join(directory, f"generated_{lines}.c")
+    if not os.path.exists(path):
+        with open(path, "w") as file:
+            file.write("\n".join(SOURCE_LINES[i % len(SOURCE_LINES)] for i in range(lines)))
+    return path
+
+
+def typing_script(doc: Document, line: int, keys: int) -> List[str]:
+    """ Keys which type the document from the line start, with an error now and then """
+    script = []
+    offset = doc.get_offset(line, 0)
+    for i, char in enumerate(doc.text[offset:offset + keys]):
+        if i % WRONG_EVERY == WRONG_EVERY - 1:
+            script.append("~" if char != "~" else "`")
+            script.append(TypingEngine.BACKSPACE[0])
+        script.append(char)
+    return script
+
+
+def place_cursor(engine: TypingEngine, doc: Document, line: int):
+    """ Session which typed everything before the line and made an error on every tenth line """
+    storage = engine.storage
+    storage.save_state(const._CORRECT, Coord(1, 0), Coord(line, 0))
+    storage.save_state(const._INCORRECT, Coord(line, 0), Coord(line, 0))
+    for error_line in range(1, line, 10):
+        if doc.get_line_len(error_line):
+            storage.add_error(error_line, 0, 1)
+
+
+def bench_keystroke(doc: Document, keys: int) -> List[int]:
+    engine = TypingEngine(Statistics(), doc)
+    place_cursor(engine, doc, max(1, doc.line_cnt // 2))
+    samples = []
+    for char in typing_script(doc, engine.cursor.line, keys):
+        start = time.perf_counter_ns()
+        engine.feed(char)
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def bench_storage(doc: Document, keys: int) -> List[int]:
+    engine = TypingEngine(Statistics(), doc)
+    place_cursor(engine, doc, max(1, doc.line_cnt // 2))
+    storage = engine.storage
+    samples = []
+    for _ in typing_script(doc, engine.cursor.line, keys):
+        start = time.perf_counter_ns()
+        good_left, good_right = storage.get_state(const._CORRECT)
+        storage.get_state(const._INCORRECT)
+        storage.has_error()
+        storage.is_err_on_line(good_right.line)
+        storage.save_state(const._CORRECT, good_left, good_right)
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def bench_find_comments(path: str, doc: Document, cached: bool) -> List[int]:
+    txt_filter = FileFilters(None)
+    txt_filter.check_file_ext(path)
+    if cached:
+        txt_filter.find_comments(doc)
+    else:
+        txt_filter.CACHE_SIZE = 0
+    return timed(lambda: txt_filter.find_comments(doc), whole_doc_repeats(doc.line_cnt))
+
+
+def run_headless(paths: Dict[int, str], keys: int) -> Dict[str, dict]:
+    results = {}
+    for lines, path in paths.items():
+        doc = Document(read_text(path))
+        results[f"keystroke/{lines}"] = summary(bench_keystroke(doc, keys))
+        results[f"storage/{lines}"] = summary(bench_storage(doc, keys))
+        results[f"find_comments/{lines}"] = summary(bench_find_comments(path, doc, cached=False))
+        results[f"find_comments.cached/{lines}"] = summary(bench_find_comments(path, doc, cached=True))
+        results[f"load.document/{lines}"] = summary(timed(lambda: Document(read_text(path)),
+                                                          whole_doc_repeats(lines)))
+    return results
+
+
+def bench_load_app(app, path: str, repeats: int, warm: bool) -> List[int]:
+    """ Cold loads go without the snapshot, warm ones load the snapshot saved by the load before """
+    samples = []
+    for _ in range(repeats):
+        # Snapshot of the previous load is written on a thread, it must not run into the next one
+        app.snapshots.wait()
+        if not warm:
+            shutil.rmtree(const.SNAPSHOT_DIR, ignore_errors=True)
+        start = time.perf_counter_ns()
+        app.read_from_file(path)
+        samples.append(time.perf_counter_ns() - start)
+    app.snapshots.wait()
+    return samples
+
+
+def run_tk(paths: Dict[int, str], keys: int, work_dir: str) -> Dict[str, dict]:
+    from tkinter import Tk, TclError
+    from main import App
+
+    # Sessions and snapshots of the benchmark must not get into the user ones
+    const.HISTORY_DB_PATH = os.path.join(work_dir, "history.sqlite3")
+    const.SNAPSHOT_DIR = os.path.join(work_dir, "snapshots")
+    try:
+        root = Tk()
+    except TclError as err:
+        print(f"Tk benchmarks are skipped: {err}", file=sys.stderr)
+        return {}
+    root.geometry(f"{const.DEFAULT_WINDOW_WIDTH}x{const.DEFAULT_WINDOW_HEIGHT}")
+    app = App(root)
+    root.update()
+
+    results = {}
+    for lines, path in paths.items():
+        results[f"load.app/{lines}"] = summary(bench_load_app(app, path, whole_doc_repeats(lines), warm=False))
+        results[f"load.app.warm/{lines}"] = summary(bench_load_app(app, path, whole_doc_repeats(lines), warm=True))
+        app.text_setup()
+
+        line = max(1, lines // 2)
+        if app.mapped_doc is not None:
+            app.load_window(max(1, line - const.VIRTUAL_WINDOW_LINES // 2))
+        proc = app.txt_proc
+        app.text.tag_add(const._GOOD_TAG, "1.0", f"{app.to_widget_line(line)}.0")
+        app.text.see(f"{app.to_widget_line(line)}.0")
+        root.update()
+
+        line_len = max(1, app.get_line_len(line) if app.mapped_doc is None else app.mapped_doc.get_line_len(line))
+        samples = []
+        for i in range(keys):
+            col = i % line_len
+            # Wrong key and its backspace are two more updates as in the keystroke benchmark
+            if i % WRONG_EVERY == WRONG_EVERY - 1:
+                proc.upd_window(RangeDelta(const._INCORRECT, line, col, col + 1, True))
+                proc.upd_window(RangeDelta(const._INCORRECT, line, col, col + 1, False))
+            start = time.perf_counter_ns()
+            proc.upd_window(RangeDelta(const._CORRECT, line, col, col + 1, True))
+            root.update_idletasks()
+            samples.append(time.perf_counter_ns() - start)
+        results[f"upd_window/{lines}"] = summary(samples)
+
+    app.close()
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float, min_delta_us: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("p50", "p99"):
+            if result[key] > base[key] * (1 + threshold) and result[key] - base[key] > min_delta_us:
+                regressions.append(f"{name} {key}: {base[key]:.2f} -> {result[key]:.2f} us "
+                                   f"(+{(result[key] / base[key] - 1) * 100 if base[key] else float('inf'):.0f}%)")
+    return regressions
+
+
+def print_results(results: Dict[str, dict], baseline: Dict[str, dict]):
+    print(f"{'benchmark':<28} {'samples':>8} {'p50, us':>12} {'p99, us':>12} {'base p50':>12} {'base p99':>12}")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        print(f"{name:<28} {result['samples']:>8} {result['p50']:>12.2f} {result['p99']:>12.2f} "
+              f"{base.get('p50', float('nan')):>12.2f} {base.get('p99', float('nan')):>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="document sizes in lines, comma separated")
+    parser.add_argument("--keys", type=int, default=2000, help="keystrokes per benchmark")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--min-delta-us", type=float, default=1.0,
+                        help="smaller slowdowns are timer noise, not regressions")
+    parser.add_argument("--no-tk", action="store_true", help="skip the benchmarks which need the text widget")
+    args = parser.parse_args()
+    # Nothing to compare with is not a pass: the baseline is local, it isn't committed
+    if not args.save and not os.path.exists(args.baseline):
+        parser.error(f"no baseline in {args.baseline}, run with --save first to create it")
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    with tempfile.TemporaryDirectory(prefix="typing-bench-") as work_dir:
+        paths = {lines: generate_document(work_dir, lines) for lines in sizes}
+        results = run_headless(paths, args.keys)
+        if not args.no_tk:
+            try:
+                with virtual_display():
+                    results.update(run_tk(paths, args.keys, work_dir))
+            except RuntimeError as err:
+                print(f"Tk benchmarks are skipped: {err}", file=sys.stderr)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, file, indent=2)
+        print(f"Baseline is saved to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.threshold, args.min_delta_us)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Synthetic typist driving the real App: keys and mouse clicks are put to the Tk event
+queue with event_generate, so they go through press_event, the frame scheduler and
+the widget redisplay as the keys of a user do.
+
+The typist types the document from its start at the given WPM with gamma distributed
+intervals between the keys. Some keys are typed wrong and erased by a backspace after
+a reaction pause, some correct keys are erased and typed again, and now and then the
+text is clicked, so the next key takes the _restore_pos path.
+
+For every file size the run is done with and without "Hide comments" and reported:
+
+    latency   from the moment the typist pressed the key to the end of the redisplay
+              of the frame which drew it, ms
+    handled   from the same moment to the start of press_event, ms
+    backlog   keys generated but not handled yet, sampled on every key
+
+Sessions of the runs don't get into the user history. Uses $DISPLAY or starts Xvfb.
+
+Run from the repository root:
+    python -m benchmarks.typist [--sizes 1000,100000,1000000] [--duration 60] [--wpm 90]
+                                [--error-rate 0.04] [--backspace-rate 0.02] [--click-rate 0.002]
+                                [--renderer text|canvas] [--json results.json]
+"""
+
+import argparse
+import json
+import os.path
+import random
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from constants import Constants as const
+
+from benchmarks.suite import generate_document, percentile
+from benchmarks.xvfb import virtual_display
+
+BACKSPACE = "\b"
+CLICK = "click"
+
+# Keysyms of the characters which are not keysyms themselves
+KEYSYMS = {
+    " ": "space", "\n": "Return", "\t": "Tab", BACKSPACE: "BackSpace",
+    "!": "exclam", '"': "quotedbl", "#": "numbersign", "$": "dollar", "%": "percent",
+    "&": "ampersand", "'": "apostrophe", "(": "parenleft", ")": "parenright", "*": "asterisk",
+    "+": "plus", ",": "comma", "-": "minus", ".": "period", "/": "slash",
+    ":": "colon", ";": "semicolon", "<": "less", "=": "equal", ">": "greater",
+    "?": "question", "@": "at", "[": "bracketleft", "\\": "backslash", "]": "bracketright",
+    "^": "asciicircum", "_": "underscore", "`": "grave", "{": "braceleft", "|": "bar",
+    "}": "braceright", "~": "asciitilde",
+}
+
+WRONG_KEYS = "abcdefghijklmnopqrstuvwxyz"
+# Typist notices the wrong key after this many mean key intervals
+REACTION_KEYS = 2
+# Keys still in the queue after the run are waited for at most this long
+DRAIN_SEC = 30
+
+
+class Typist:
+    """ Keys of a typist who types the document from its start, with the pause before every key """
+
+    def __init__(self, doc, wpm: float, error_rate: float, backspace_rate: float, click_rate: float,
+                 seed: int = 1):
+        self.doc = doc
+        self.error_rate = error_rate
+        self.backspace_rate = backspace_rate
+        self.click_rate = click_rate
+        self._rng = random.Random(seed)
+        # Five characters per word
+        self._mean_delay = 60 / (wpm * 5)
+        self._line, self._col = 1, 0
+        self._planned: Deque[Tuple[float, str]] = deque()
+        self.errors = 0
+        self.clicks = 0
+
+    def _delay(self, keys: float = 1) -> float:
+        return self._rng.gammavariate(4, keys * self._mean_delay / 4)
+
+    def _next_char(self) -> Optional[str]:
+        line = self.doc.get_line(self._line)
+        if self._col < len(line):
+            self._col += 1
+            return line[self._col - 1]
+        if not self.doc.has_line(self._line + 1):
+            return None
+        self._line, self._col = self._line + 1, 0
+        return "\n"
+
+    def next(self) -> Optional[Tuple[float, str]]:
+        """ Pause in seconds and the key (or CLICK), None at the end of the document """
+        if not self._planned:
+            char = self._next_char()
+            if char is None:
+                return None
+            rng = self._rng
+            if rng.random() < self.click_rate:
+                self._planned.append((self._delay(), CLICK))
+                self.clicks += 1
+            if char != "\n" and rng.random() < self.error_rate:
+                self._planned.append((self._delay(), rng.choice(WRONG_KEYS.replace(char, ""))))
+                self._planned.append((self._delay(REACTION_KEYS), BACKSPACE))
+                self.errors += 1
+            self._planned.append((self._delay(), char))
+            if rng.random() < self.backspace_rate:
+                self._planned.append((self._delay(REACTION_KEYS), BACKSPACE))
+                self._planned.append((self._delay(), char))
+        return self._planned.popleft()
+
+
+class TypistRun:
+    """ Feeds the typist keys to the App for the duration and measures every key until it is drawn """
+
+    def __init__(self, root, app, typist: Typist, duration: float):
+        self.root = root
+        self.app = app
+        self.typist = typist
+        self.duration = duration
+        self._rng = random.Random(2)
+        # Moments the typist pressed the keys which are generated but not handled yet
+        self._intended: Deque[float] = deque()
+        # The same for the keys handled since the last frame
+        self._frame_keys: List[float] = []
+        # Next key of the typist and the moment it is pressed
+        self._next_key: Optional[str] = None
+        self._next_time = 0.0
+        self._stop_time = 0.0
+        self._finished = False
+        self.generated = 0
+        self.handled = 0
+        self.rendered = 0
+        self.latency_ms: List[float] = []
+        self.handled_ms: List[float] = []
+        self.backlog: List[int] = []
+        self.elapsed = 0.0
+
+        app.text.bind("<KeyPress>", func=self._on_key)
+        draw_stat = app.draw_stat
+
+        def draw_frame():
+            draw_stat()
+            keys, self._frame_keys = self._frame_keys, []
+            # Idle callbacks run in order, so this one comes after the redisplay of the frame
+            self.root.after_idle(self._on_rendered, keys)
+
+        app.scheduler.register("stats", draw_frame)
+
+    def run(self) -> Dict[str, object]:
+        self.app.text.focus_force()
+        self.root.update()
+        start = time.perf_counter()
+        self._next_time = start
+        self._stop_time = start + self.duration
+        self.root.after(0, self._tick)
+        self.root.mainloop()
+        self.elapsed = time.perf_counter() - start
+        return self.result()
+
+    def _tick(self):
+        now = time.perf_counter()
+        while not self._finished:
+            if self._next_key is None:
+                step = self.typist.next()
+                if step is None:
+                    self._finished = True
+                    break
+                delay, self._next_key = step
+                self._next_time += delay
+            if self._next_time >= self._stop_time:
+                self._finished = True
+            if self._finished or self._next_time > now:
+                break
+            self._generate(self._next_key)
+            self._next_key = None
+        if self._finished:
+            self._drain(now + DRAIN_SEC)
+        else:
+            self.root.after(max(0, int((self._next_time - now) * 1000)), self._tick)
+
+    def _generate(self, key: str):
+        text = self.app.text
+        if key == CLICK:
+            x = self._rng.randrange(max(1, text.winfo_width()))
+            y = self._rng.randrange(max(1, text.winfo_height()))
+            text.event_generate("<Button-1>", x=x, y=y, when="tail")
+            text.event_generate("<ButtonRelease-1>", x=x, y=y, when="tail")
+            return
+        self._intended.append(self._next_time)
+        self.generated += 1
+        text.event_generate("<KeyPress>", keysym=KEYSYMS.get(key, key), when="tail")
+        self.backlog.append(self.generated - self.handled)
+
+    def _on_key(self, event):
+        now = time.perf_counter()
+        intended = self._intended.popleft()
+        self.handled += 1
+        self.handled_ms.append((now - intended) * 1000)
+        self._frame_keys.append(intended)
+        self.backlog.append(self.generated - self.handled)
+        return self.app.press_event(event)
+
+    def _on_rendered(self, keys: List[float]):
+        now = time.perf_counter()
+        self.latency_ms.extend((now - intended) * 1000 for intended in keys)
+        self.rendered += len(keys)
+
+    def _drain(self, deadline: float):
+        if self.rendered < self.generated and time.perf_counter() < deadline:
+            self.root.after(const.FRAME_MS, self._drain, deadline)
+            return
+        self.root.quit()
+
+    def result(self) -> Dict[str, object]:
+        stat = self.app.txt_stat
+        return {
+            "keys": self.generated,
+            "lost": self.generated - self.rendered,
+            "wpm": stat.symbol_cnt / 5 / (self.elapsed / 60) if self.elapsed else 0.0,
+            "errors.planned": self.typist.errors,
+            "errors.seen": stat.errors,
+            "clicks": self.typist.clicks,
+            "frames": self.app.scheduler.frames,
+            "latency": distribution(self.latency_ms),
+            "handled": distribution(self.handled_ms),
+            "backlog": distribution(self.backlog),
+        }
+
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {"p50": 0, "p90": 0, "p99": 0, "max": 0}
+    return {
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "p99": percentile(values, 0.99),
+        "max": values[-1],
+    }
+
+
+def run_scenario(path: str, hide_comments: bool, args) -> Optional[Dict[str, object]]:
+    from tkinter import Tk
+    from main import App
+
+    root = Tk()
+    root.geometry(f"{const.DEFAULT_WINDOW_WIDTH}x{const.DEFAULT_WINDOW_HEIGHT}")
+    app = App(root, file_path=path, renderer=args.renderer)
+    try:
+        if hide_comments:
+            # Comments of the memory mapped files can't be hidden
+            if app.mapped_doc is not None:
+                return None
+            app.checkbox_value.set(1)
+            app.checkbox_cmd_off()
+        typist = Typist(app.txt_engine.doc, args.wpm, args.error_rate, args.backspace_rate, args.click_rate)
+        return TypistRun(root, app, typist, args.duration).run()
+    finally:
+        app.close()
+
+
+def print_report(results: Dict[str, Dict[str, object]]):
+    print(f"{'run':<24}{'keys':>7}{'lost':>6}{'wpm':>7}{'frames':>8}   "
+          f"{'latency ms p50/p90/p99/max':<30}{'handled ms p99':>15}   {'backlog p50/p99/max':<20}")
+    for name, result in results.items():
+        latency, handled, backlog = result["latency"], result["handled"], result["backlog"]
+        print(f"{name:<24}{result['keys']:>7}{result['lost']:>6}{result['wpm']:>7.1f}{result['frames']:>8}   "
+              f"{latency['p50']:>6.1f} {latency['p90']:>6.1f} {latency['p99']:>7.1f} {latency['max']:>7.1f}   "
+              f"{handled['p99']:>15.1f}   {backlog['p50']:>4} {backlog['p99']:>5} {backlog['max']:>6}")
+        if result["errors.seen"] != result["errors.planned"]:
+            print(f"{'':<24}the App counted {result['errors.seen']} errors of {result['errors.planned']} typed,"
+                  f" some keys weren't delivered as generated", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="document sizes in lines, comma separated")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of typing per run")
+    parser.add_argument("--wpm", type=float, default=90)
+    parser.add_argument("--error-rate", type=float, default=0.04, help="share of the keys typed wrong first")
+    parser.add_argument("--backspace-rate", type=float, default=0.02,
+                        help="share of the correct keys erased and typed again")
+    parser.add_argument("--click-rate", type=float, default=0.002, help="mouse clicks per key")
+    parser.add_argument("--renderer", choices=("text", "canvas"), default="text", help="highlighting backend of the App")
+    parser.add_argument("--json", help="save the results to this file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="typing-typist-") as work_dir:
+        # Sessions and snapshots of the runs must not get into the user ones
+        const.HISTORY_DB_PATH = os.path.join(work_dir, "history.sqlite3")
+        const.SNAPSHOT_DIR = os.path.join(work_dir, "snapshots")
+        try:
+            with virtual_display():
+                for lines in sizes:
+                    path = generate_document(work_dir, lines)
+                    for hide_comments in (False, True):
+                        result = run_scenario(path, hide_comments, args)
+                        if result is not None:
+                            results[f"{lines}{' hidden' if hide_comments else ''}"] = result
+        except RuntimeError as err:
+            print(f"Typist runs are skipped: {err}", file=sys.stderr)
+            return 1
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
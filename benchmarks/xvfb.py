@@ -0,0 +1,39 @@
+"""
+Virtual X display for the benchmarks which need Tk widgets
+"""
+
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+
+
+@contextmanager
+def virtual_display(screen: str = "1280x1024x24"):
+    """ Use $DISPLAY if it is set, otherwise run Xvfb for the block """
+    if os.environ.get("DISPLAY"):
+        yield os.environ["DISPLAY"]
+        return
+
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        raise RuntimeError("$DISPLAY is not set and Xvfb is not installed")
+
+    # Xvfb picks a free display number itself and writes it to the descriptor
+    read_fd, write_fd = os.pipe()
+    proc = subprocess.Popen([xvfb, "-displayfd", str(write_fd), "-screen", "0", screen, "-nolisten", "tcp"],
+                            pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        number = pipe.readline().strip()
+    if not number:
+        proc.kill()
+        raise RuntimeError("Xvfb didn't start")
+
+    os.environ["DISPLAY"] = f":{number}"
+    try:
+        yield os.environ["DISPLAY"]
+    finally:
+        del os.environ["DISPLAY"]
+        proc.terminate()
+        proc.wait()
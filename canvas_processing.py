@@ -0,0 +1,270 @@
+from tkinter import Canvas
+import tkinter.font as tkfont
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from engine import TypingEngine
+from processing import Highlighter
+from state_structure import Coord, RangeDelta
+from constants import Constants as const
+
+
+class CanvasProcessor(Highlighter):
+    """
+    Highlighting backend with the interface of TextProcessor, which draws the visible
+    part of the text widget on a Canvas placed over it. Text is drawn once per row on
+    a grid of fixed width cells and the highlighting is a rectangle per typed character,
+    so a keystroke changes the items of its own cells only and the canvas redraws just
+    their area, no matter how long the line is. States of the typed characters are kept
+    here by document lines, the whole grid is drawn again from them when the text
+    widget is scrolled, resized or its text is changed.
+    """
+    # Default tab stops of the text widget are every eight characters
+    TAB_COLS = 8
+    _GOOD, _BAD = 1, 2
+    _BITS = {
+        const._CORRECT: _GOOD,
+        const._INCORRECT: _BAD,
+    }
+
+    def __init__(self, text):
+        super().__init__(text)
+        # Document line -> state bits of its characters
+        self._cells: Dict[int, bytearray] = {}
+        # (document line, column) -> rectangle of the visible highlighted character
+        self._rects: Dict[Tuple[int, int], int] = {}
+        # Visible rows: document line -> its row number and character start columns if it has tabs
+        self._rows: Dict[int, Tuple[int, Optional[List[int]]]] = {}
+        # Scroll position and size the grid was drawn for
+        self._view = None
+        self._x0 = self._y0 = 0
+        # Columns of the visible characters, the lines with tabs are drawn whole
+        self._left = self._right = 0
+        self._sync_pending = False
+        # After the text was edited: highlights the typed ranges inside of [left, right)
+        # and the lines whose cells are rendered by it since then, see text_edited()
+        self._render_lines: Optional[Callable[[Coord, Coord], None]] = None
+        self._filled: Set[int] = set()
+
+        self.canvas = Canvas(text.master, borderwidth=0, highlightthickness=0, background=text.cget("background"))
+        self.canvas.place(in_=text, x=0, y=0, relwidth=1, relheight=1)
+        self.canvas.lift(text)
+        self._font = None
+        self._cell_width = self._cell_height = 0
+        self._foreground = text.cget("foreground")
+        self._colors = {self._GOOD: const._GOOD_COLOR, self._BAD: const._BAD_COLOR}
+        self._cursor = None
+
+        # Mouse is handled by the text widget as if there were no canvas, App.click included
+        for sequence in ("<Button-1>", "<ButtonRelease-1>", "<B1-Motion>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, lambda event, sequence=sequence: self._forward(sequence, event))
+        self.canvas.bind("<MouseWheel>", lambda event: self._text.event_generate(
+            "<MouseWheel>", x=event.x, y=event.y, delta=event.delta))
+        self.canvas.bind("<Configure>", lambda event: self.view_changed())
+
+    def _forward(self, sequence: str, event):
+        self._text.event_generate(sequence, x=event.x, y=event.y)
+
+    def reset(self):
+        self._pending.clear()
+        self._cells.clear()
+        self._render_lines = None
+        self._forget_view()
+        self.view_changed()
+
+    def set_window(self, first_line: int, last_line: int = None):
+        super().set_window(first_line, last_line)
+        # Window text is replaced, its typed lines are rendered again by the caller
+        self._cells.clear()
+        self._render_lines = None
+        self._forget_view()
+
+    def text_edited(self, spans: Iterable[Tuple[Coord, Coord]], render: Callable[[Coord, Coord], None]):
+        """
+        Lines were inserted or removed, so the cells of the document lines are not valid.
+        They are rendered again by 'render' only for the lines which are drawn, see _redraw()
+        """
+        self._cells.clear()
+        self._filled.clear()
+        self._render_lines = render
+        self._forget_view()
+        self.view_changed()
+
+    def _forget_view(self):
+        # Nothing is drawn until the grid is drawn for the new text
+        self._view = None
+        self._rows.clear()
+
+    def view_changed(self):
+        """ Text widget was scrolled, resized or changed, the grid is checked when Tk is idle """
+        if not self._sync_pending:
+            self._sync_pending = True
+            self.canvas.after_idle(self._sync)
+
+    def _sync(self):
+        self._sync_pending = False
+        self._sync_view()
+        self._draw_cursor()
+
+    def flush(self):
+        # Cursor is moved by every keystroke, even if nothing is queued
+        self._sync_view()
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self.render(TypingEngine.coalesce(pending))
+        self._draw_cursor()
+
+    def upd_window(self, delta: RangeDelta):
+        line = delta.line
+        if not self.in_window(line):
+            return
+        cells = self._cells.get(line)
+        if cells is None:
+            cells = self._cells[line] = bytearray()
+        if len(cells) < delta.end:
+            cells.extend(bytes(delta.end - len(cells)))
+
+        bit = self._BITS[delta.state]
+        row = self._rows.get(line)
+        for col in range(delta.start, delta.end):
+            old = cells[col]
+            new = old | bit if delta.added else old & ~bit
+            if new == old:
+                continue
+            cells[col] = new
+            if row is not None and (row[1] is not None or self._left <= col < self._right):
+                self._draw_cell(line, col, new, row)
+
+    def _color(self, bits: int) -> Optional[str]:
+        # Incorrect tag is above the correct one in the text widget too
+        if bits & self._BAD:
+            return self._colors[self._BAD]
+        if bits & self._GOOD:
+            return self._colors[self._GOOD]
+        return None
+
+    def _cell_x(self, col: int, tab_cols: Optional[List[int]]) -> Tuple[int, int]:
+        """ Left and right borders of the character on the canvas """
+        width = self._cell_width
+        if tab_cols is None:
+            return self._x0 + col * width, self._x0 + (col + 1) * width
+        if col + 1 >= len(tab_cols):
+            # After the line end, the character takes one cell
+            start = tab_cols[-1] + col + 1 - len(tab_cols)
+            return self._x0 + start * width, self._x0 + (start + 1) * width
+        return self._x0 + tab_cols[col] * width, self._x0 + tab_cols[col + 1] * width
+
+    def _draw_cell(self, line: int, col: int, bits: int, row: Tuple[int, Optional[List[int]]]):
+        key = (line, col)
+        rect = self._rects.get(key)
+        color = self._color(bits)
+        if color is None:
+            if rect is not None:
+                self.canvas.delete(rect)
+                del self._rects[key]
+            return
+        if rect is not None:
+            self.canvas.itemconfigure(rect, fill=color)
+            return
+        row_number, tab_cols = row
+        left, right = self._cell_x(col, tab_cols)
+        top = self._y0 + row_number * self._cell_height
+        rect = self.canvas.create_rectangle(left, top, right, top + self._cell_height, fill=color, width=0)
+        # Below the glyphs
+        self.canvas.tag_lower(rect)
+        self._rects[key] = rect
+
+    def _sync_view(self):
+        """ Draw the whole grid again if the text widget shows not what it was drawn for """
+        text = self._text
+        modified = text.edit_modified()
+        info = text.dlineinfo("@0,0")
+        top = int(text.index("@0,0").split(".")[0])
+        font = text.cget("font")
+        view = (top, info and info[0], info and info[1], self.canvas.winfo_width(), self.canvas.winfo_height(), font)
+        if view == self._view and not modified:
+            return
+        if modified:
+            text.edit_modified(False)
+        if self._view is None or font != self._view[-1]:
+            self._font = tkfont.Font(font=font)
+            self._cell_width, self._cell_height = self._font.measure("0"), self._font.metrics("linespace")
+        self._view = view
+        self._redraw(top, info)
+
+    def _redraw(self, top: int, info):
+        canvas = self.canvas
+        canvas.delete("all")
+        self._rects.clear()
+        self._rows.clear()
+        self._cursor = None
+        if info is None:
+            return
+        self._x0, self._y0 = info[0], info[1]
+        width, height = self._cell_width, self._cell_height
+        rows = max(1, (canvas.winfo_height() - self._y0) // height + 1)
+        if self._render_lines is not None:
+            self._fill(self.first_line + top - 1, self.first_line + top + rows - 2)
+        left = max(0, -self._x0 // width)
+        cols = canvas.winfo_width() // width + 2
+        self._left, self._right = left, left + cols
+
+        text = self._text.get(f"{top}.0", f"{top + rows - 1}.end").split("\n")
+        for row_number, line_text in enumerate(text):
+            line = self.first_line + top + row_number - 1
+            tab_cols = None
+            if "\t" in line_text:
+                tab_cols = self.tab_columns(line_text, self.TAB_COLS)
+                line_text = line_text.expandtabs(self.TAB_COLS)
+            self._rows[line] = (row_number, tab_cols)
+            visible = line_text[left:left + cols]
+            if visible.strip():
+                canvas.create_text(self._x0 + left * width, self._y0 + row_number * height, anchor="nw",
+                                   text=visible, font=self._font, fill=self._foreground, tags="glyph")
+
+            cells = self._cells.get(line)
+            if cells is None:
+                continue
+            first, last = (0, len(cells)) if tab_cols is not None else (left, min(len(cells), left + cols))
+            for col in range(first, last):
+                if cells[col]:
+                    self._draw_cell(line, col, cells[col], self._rows[line])
+
+    def _fill(self, first: int, last: int):
+        """ Render the cells of the lines [first, last] which weren't rendered since the text was edited """
+        line = first
+        while line <= last:
+            if line in self._filled:
+                line += 1
+                continue
+            end = line
+            while end + 1 <= last and end + 1 not in self._filled:
+                end += 1
+            # Keystrokes could change the cells since, the typed ranges have them all
+            for stale in range(line, end + 1):
+                self._cells.pop(stale, None)
+            self._filled.update(range(line, end + 1))
+            self._render_lines(Coord(line, 0), Coord(end + 1, 0))
+            line = end + 1
+
+    def _draw_cursor(self):
+        bbox = self._text.bbox("insert")
+        if bbox is None:
+            if self._cursor is not None:
+                self.canvas.delete(self._cursor)
+                self._cursor = None
+            return
+        x, y, _, height = bbox
+        if self._cursor is None:
+            self._cursor = self.canvas.create_rectangle(x, y, x + 2, y + height, fill=self._foreground, width=0)
+        else:
+            self.canvas.coords(self._cursor, x, y, x + 2, y + height)
+
+    @staticmethod
+    def tab_columns(line: str, tab_cols: int) -> List[int]:
+        """ Grid column of every character start and of the line end """
+        columns = [0]
+        col = 0
+        for char in line:
+            col = (col // tab_cols + 1) * tab_cols if char == "\t" else col + 1
+            columns.append(col)
+        return columns
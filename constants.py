@@ -1,9 +1,14 @@
 
+import os.path
+
+
 class Constants:
     _CORRECT = "correct_typing"
     _INCORRECT = "incorrect_typing"
     _GOOD_COLOR = "green"
     _BAD_COLOR = "red"
+    _GOOD_TAG = "green_tag"
+    _BAD_TAG = "red_tag"
 
     DEFAULT_WINDOW_TITLE = "TypingChecker"
     DEFAULT_WINDOW_WIDTH = 640
@@ -15,3 +20,51 @@ class Constants:
     WINDOW_Y_PAD_WIDTH = 50
     STAT_FRAME_WIDTH_SYMBOLS = "18"
     TAB_SIZE_SYMBOLS = 4
+    # Files from this size are memory mapped and only a window of lines
+    # around the cursor is kept in the text widget
+    LARGE_FILE_SIZE_BYTES = 32 * 1024 * 1024
+    VIRTUAL_WINDOW_LINES = 600
+    # Window is moved when the cursor comes closer than this to its border
+    VIRTUAL_WINDOW_MARGIN_LINES = 100
+    # Keystrokes kept in Statistics.log, older ones are overwritten
+    KEYSTROKE_LOG_SIZE = 65536
+    # Rolling speed is calculated over the last seconds of typing
+    ROLLING_WINDOW_SEC = 10
+    # Typing sessions history, keystrokes are sent to its writer thread every HISTORY_FLUSH_MS
+    HISTORY_DB_PATH = os.path.join(os.path.expanduser("~"), ".typing_checker", "history.sqlite3")
+    HISTORY_FLUSH_MS = 2000
+    # Highlighting and statistics are redrawn at most once per this interval
+    FRAME_MS = 16
+    # Tracing of the keystroke handling, see tracing.py
+    TRACE_ENV = "TYPING_TRACE"
+    TRACE_MAX_SPANS = 500000
+    # Latency percentiles are calculated over this number of the last keystrokes
+    TRACE_LATENCY_KEYS = 1000
+    # Corpus mode, see corpus.py. Prepared documents are kept in memory up to CORPUS_CACHE_BYTES
+    CORPUS_EXTENSIONS = (".c", ".h", ".py", ".txt")
+    CORPUS_WORKERS = 4
+    CORPUS_CACHE_BYTES = 256 * 1024 * 1024
+    # Files are read on the worker thread and inserted into the text widget
+    # by LOAD_INSERT_LINES lines every LOAD_POLL_MS
+    LOAD_INSERT_LINES = 2000
+    LOAD_POLL_MS = 10
+    # Typing races server, see race_server.py
+    RACE_PORT = 8765
+    RACE_TICK_MS = 250
+    # Keystrokes kept per player, enough for the rolling speed
+    RACE_KEYSTROKE_LOG_SIZE = 256
+    # Player which doesn't read its ticks is disconnected when this much is not sent yet
+    RACE_MAX_CLIENT_BUFFER = 1024 * 1024
+    # Prepared documents saved for the next start, see snapshot.py
+    SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".typing_checker", "snapshots")
+    SNAPSHOT_CACHE_BYTES = 512 * 1024 * 1024
+    # Drills of the weak bigrams from the lines of a code corpus, see drill.py
+    DRILL_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".typing_checker", "drill.idx")
+    DRILL_NGRAM = 2
+    DRILL_LINES = 20
+    DRILL_TARGETS = 12
+    # Lines shorter or longer than these (without the indentation) are not indexed
+    DRILL_MIN_LINE_LEN = 8
+    DRILL_MAX_LINE_LEN = 100
+    # At most this many lines of every target n-gram are scored, from a random place of its postings
+    DRILL_POSTINGS_SAMPLE = 500
@@ -0,0 +1,207 @@
+"""
+Corpus mode: typing practice over a directory tree of source files.
+The tree is scanned and every file is prepared by the thread pool in the background:
+tabs are expanded, the line index is built and comments are stripped. Prepared
+documents are kept in the LRU cache bounded by their memory size, and the next
+file is prefetched, so moving to it doesn't read or parse anything on the UI thread.
+"""
+
+import logging
+import os.path
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from constants import Constants as const
+from document import Document, read_text
+from file_operations import FileFilters, FilteredText
+
+
+@dataclass
+class CorpusEntry:
+    path: str
+    size: int
+    line_cnt: int
+    max_line_len: int
+    language: str
+    # Lines left after the comments are stripped, None if the language has no comments filter
+    filtered_line_cnt: Optional[int] = None
+
+
+@dataclass
+class PreparedDocument:
+    entry: CorpusEntry
+    doc: Document
+    filtered: Optional[FilteredText]
+
+    @property
+    def path(self) -> str:
+        return self.entry.path
+
+    def memory_size(self) -> int:
+        """ Estimation: the texts and the line index arrays """
+        size = sys.getsizeof(self.doc.text) + (len(self.doc.line_len) + len(self.doc.line_start)) * 4
+        if self.filtered is not None:
+            size += sys.getsizeof(self.filtered.text) + sum(map(sys.getsizeof, self.filtered.removed)) + \
+                    (len(self.filtered.offsets.filtered_start) + len(self.filtered.offsets.original_start)) * 4
+        return size
+
+
+def language_of(path: str) -> str:
+    lexer = FileFilters.LEXERS.get(os.path.splitext(path)[1])
+    if lexer is None:
+        return "Text"
+    return type(lexer).__name__[:-len("Lexer")]
+
+
+def prepare(path: str) -> PreparedDocument:
+    """ Everything App does when it opens the file, without Tk """
+    text = read_text(path)
+    doc = Document(text)
+    lexer = FileFilters.LEXERS.get(os.path.splitext(path)[1])
+    filtered = FileFilters.strip_comments(text, lexer) if lexer is not None else None
+    entry = CorpusEntry(path, os.path.getsize(path), doc.line_cnt, doc.max_line_len, language_of(path),
+                        filtered.text.count("\n") + 1 if filtered is not None else None)
+    return PreparedDocument(entry, doc, filtered)
+
+
+def source_files(root: str) -> Iterator[str]:
+    """ Files of the corpus extensions under the root in the sorted order, hidden directories are skipped """
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith("."))
+        for name in sorted(file_names):
+            if os.path.splitext(name)[1] not in const.CORPUS_EXTENSIONS:
+                continue
+            path = os.path.join(dir_path, name)
+            try:
+                # Large files are opened memory mapped one by one, see App.open_large_file()
+                if os.path.getsize(path) >= const.LARGE_FILE_SIZE_BYTES:
+                    continue
+            except OSError:
+                continue
+            yield path
+
+
+class DocumentCache:
+    """ LRU of prepared documents bounded by their estimated memory size. Thread safe """
+
+    def __init__(self, max_bytes: int = const.CORPUS_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, path: str):
+        return path in self._items
+
+    def get(self, path: str) -> Optional[PreparedDocument]:
+        with self._lock:
+            item = self._items.get(path)
+            if item is None:
+                return None
+            self._items.move_to_end(path)
+            return item[0]
+
+    def put(self, prepared: PreparedDocument):
+        size = prepared.memory_size()
+        with self._lock:
+            old = self._items.pop(prepared.path, None)
+            if old is not None:
+                self.used_bytes -= old[1]
+            self._items[prepared.path] = (prepared, size)
+            self.used_bytes += size
+            # The newest one is kept even if it alone is larger than the limit
+            while self.used_bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.used_bytes -= evicted_size
+
+
+class Corpus:
+
+    def __init__(self, root: str, workers: int = const.CORPUS_WORKERS, cache_bytes: int = const.CORPUS_CACHE_BYTES):
+        self.root = os.path.realpath(root)
+        self.logger = logging.getLogger(__name__)
+        self.cache = DocumentCache(cache_bytes)
+        # Filled by the indexing as files are prepared
+        self.entries: Dict[str, CorpusEntry] = {}
+        # Files in the scan order, which is the order of the practice
+        self._paths: List[str] = []
+        self._position: Dict[str, int] = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.scanned = False
+        # Imported here, it's one of the slowest imports and only the corpus mode needs it
+        from concurrent.futures import ThreadPoolExecutor
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="corpus")
+        self._pool.submit(self._scan)
+
+    def close(self):
+        self._closed = True
+        self._pool.shutdown(wait=False)
+
+    @property
+    def file_cnt(self) -> int:
+        return len(self._paths)
+
+    @property
+    def indexed_cnt(self) -> int:
+        return len(self.entries)
+
+    def _scan(self):
+        for path in source_files(self.root):
+            if self._closed:
+                return
+            with self._lock:
+                self._position[path] = len(self._paths)
+                self._paths.append(path)
+            self._submit(path)
+        self.scanned = True
+
+    def _submit(self, path: str):
+        with self._lock:
+            if self._closed or path in self._pending or path in self.cache:
+                return
+            self._pending.add(path)
+        self._pool.submit(self._index, path)
+
+    def _index(self, path: str):
+        try:
+            if not self._closed:
+                self._add(prepare(path))
+        except (OSError, UnicodeDecodeError) as err:
+            self.logger.warning("%s is skipped: %s", path, err)
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def _add(self, prepared: PreparedDocument):
+        self.entries[prepared.path] = prepared.entry
+        self.cache.put(prepared)
+
+    def first_path(self) -> Optional[str]:
+        with self._lock:
+            return self._paths[0] if self._paths else None
+
+    def next_path(self, path: str, step: int = 1) -> Optional[str]:
+        """ File after (or before for the negative step) the path, around the corpus """
+        with self._lock:
+            if not self._paths:
+                return None
+            return self._paths[(self._position.get(path, -step) + step) % len(self._paths)]
+
+    def get(self, path: str) -> PreparedDocument:
+        """ Prepared document, from the cache if it's there. Prefetches the next file """
+        prepared = self.cache.get(path)
+        if prepared is None:
+            prepared = prepare(path)
+            self._add(prepared)
+        next_path = self.next_path(path)
+        if next_path is not None:
+            self._submit(next_path)
+        return prepared
@@ -0,0 +1,171 @@
+"""
+Loaded document with the precomputed line index, so line lengths and
+(line, col) -> offset conversions don't need any Tk call.
+MappedDocument gives the same lookups for the files which are too large to
+be read into memory at once.
+"""
+
+import mmap
+import os
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate, count
+from typing import Tuple
+
+from constants import Constants as const
+
+
+def read_text(file_path: str) -> str:
+    """ Text of the file as it is shown for typing: tabs are replaced with spaces """
+    with open(file_path) as file:
+        return file.read().replace('\t', ' ' * const.TAB_SIZE_SYMBOLS)
+
+
+class Document:
+    # Versions are unique among all the documents, so a version alone identifies the text
+    _versions = count()
+
+    def __init__(self, text: str = ""):
+        self.text = ""
+        # Changed with every change of the text
+        self.version = next(self._versions)
+        self.line_len = array('I')
+        self.line_start = array('I')
+        self.max_line_len = 0
+        self.line_cnt = 0
+        self.set_text(text)
+
+    def set_text(self, text: str):
+        """ Replace the document text and rebuild the line index """
+        self.text = text
+        self.version = next(self._versions)
+        self.line_len = array('I', map(len, text.split("\n")))
+        # Each line starts after the previous one and its '\n'
+        self.line_start = array('I', accumulate(self.line_len, lambda start, length: start + length + 1, initial=0))
+        self.line_start.pop()
+        self.max_line_len = max(self.line_len)
+        self.line_cnt = len(self.line_len)
+
+    def append_text(self, text: str):
+        """ Add the text to the end, only the new lines are indexed """
+        lengths = list(map(len, text.split("\n")))
+        # The first piece continues the current last line
+        self.line_len[-1] += lengths[0]
+        start = self.line_start[-1] + self.line_len[-1] + 1
+        for length in lengths[1:]:
+            self.line_start.append(start)
+            self.line_len.append(length)
+            start += length + 1
+        self.text += text
+        self.version = next(self._versions)
+        self.max_line_len = max(self.max_line_len, max(self.line_len[-len(lengths):]))
+        self.line_cnt = len(self.line_len)
+
+    def copy_from(self, other: "Document"):
+        """ Take the text and the already built line index of the other document """
+        self.text = other.text
+        self.version = next(self._versions)
+        self.line_len = array('I', other.line_len)
+        self.line_start = array('I', other.line_start)
+        self.max_line_len = other.max_line_len
+        self.line_cnt = other.line_cnt
+
+    def get_line_len(self, line: int) -> int:
+        return self.line_len[line - 1]
+
+    def has_line(self, line: int) -> bool:
+        return 1 <= line <= self.line_cnt
+
+    def get_offset(self, line: int, col: int) -> int:
+        return self.line_start[line - 1] + col
+
+    def get_coord(self, offset: int) -> Tuple[int, int]:
+        """ (line, col) of the offset, line numbers start from 1 """
+        line = bisect_right(self.line_start, offset)
+        return line, offset - self.line_start[line - 1]
+
+    def get_line(self, line: int) -> str:
+        start = self.line_start[line - 1]
+        return self.text[start:start + self.line_len[line - 1]]
+
+    def line_startswith(self, line: int, col: int, prefix: str) -> bool:
+        start = self.line_start[line - 1]
+        return self.text.startswith(prefix, start + col, start + self.line_len[line - 1])
+
+
+class MappedDocument:
+    """
+    Read only document over the memory mapped file. Line offsets are indexed
+    on demand while the user moves forward, lines are decoded and tab expanded
+    only when they are asked and a few of them are kept in the small cache.
+    """
+    _CACHE_LINES = 2048
+
+    def __init__(self, file_path: str, encoding: str = "utf-8"):
+        self.encoding = encoding
+        self._file = open(file_path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # Empty file can't be mapped
+            self._data = b""
+        # Byte offsets of the known line starts
+        self._line_start = array('Q', [0])
+        self._indexed_all = False
+        self._cache = OrderedDict()
+
+    def close(self):
+        self._cache.clear()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def _index_to(self, line: int):
+        starts = self._line_start
+        while len(starts) < line and not self._indexed_all:
+            pos = self._data.find(b"\n", starts[-1])
+            if pos < 0:
+                self._indexed_all = True
+            else:
+                starts.append(pos + 1)
+
+    @property
+    def line_cnt(self) -> int:
+        """ Number of lines in the file. Indexes the whole file, so avoid it on the hot path """
+        self._index_to(2 ** 63)
+        return len(self._line_start)
+
+    def has_line(self, line: int) -> bool:
+        if line < 1:
+            return False
+        self._index_to(line)
+        return line <= len(self._line_start)
+
+    def get_line(self, line: int) -> str:
+        text = self._cache.get(line)
+        if text is not None:
+            self._cache.move_to_end(line)
+            return text
+
+        self._index_to(line + 1)
+        start = self._line_start[line - 1]
+        if line < len(self._line_start):
+            end = self._line_start[line] - 1
+        else:
+            end = len(self._data)
+        raw = self._data[start:end]
+        if raw.endswith(b"\r"):
+            raw = raw[:-1]
+        text = raw.decode(self.encoding, errors="replace").replace('\t', ' ' * const.TAB_SIZE_SYMBOLS)
+
+        self._cache[line] = text
+        if len(self._cache) > self._CACHE_LINES:
+            self._cache.popitem(last=False)
+        return text
+
+    def get_line_len(self, line: int) -> int:
+        return len(self.get_line(line))
+
+    def line_startswith(self, line: int, col: int, prefix: str) -> bool:
+        return self.get_line(line).startswith(prefix, col)
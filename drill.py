@@ -0,0 +1,354 @@
+"""
+Drills of the weak bigrams. Lines of real code are chosen from a corpus by the
+n-gram inverted index: n-gram -> lines which have it. The weakest bigrams come
+from the sessions history, every error costs as much as the keystrokes to fix it.
+
+    python -m drill build DIR [--index ~/.typing_checker/drill.idx] [--workers 4]
+    python -m drill show [--lines 20] [--ext .c]
+
+Files are indexed by the process pool the same way App opens them: tabs are
+expanded by read_text and comments are stripped by FileFilters, so the drill
+has only the code. Index is one file which is memory mapped for the queries:
+
+    header      magic, n, counts of the files, lines, n-grams and postings, text and paths bytes
+    keys        sorted n-gram codes, Q
+    post_start  start of every n-gram postings, Q, one more for the end
+    postings    line ids of every n-gram in ascending order, I
+    line_file   file id of every line, I
+    line_no     line number in the file, I
+    line_start  start of every line in the text, Q, one more for the end
+    path_start  start of every file path in the paths, Q, one more for the end
+    text        lines without the indentation, UTF-8
+    paths       file paths, UTF-8
+
+Every part starts at the multiple of 8 bytes.
+"""
+
+import argparse
+import heapq
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from constants import Constants as const
+from corpus import source_files
+from document import Document, read_text
+from file_operations import FileFilters
+
+_MAGIC = b"TCDRILL1"
+_HEADER = struct.Struct("<8sIIIIQQQ")
+# Every character of the n-gram takes 21 bits of its code, the largest code point fits
+_CHAR_BITS = 21
+# An error is the wrong key, the backspace and the key again: two keystrokes more
+ERROR_COST_KEYS = 2
+# Weight of the target goes down so much every time a chosen line has it, so the drill covers all of them
+REPEAT_DECAY = 0.5
+# Greedy choice of the drill lines goes over this many best scored lines per line of the drill
+CANDIDATES_PER_LINE = 20
+
+
+def ngram_code(ngram: str) -> int:
+    code = 0
+    for char in ngram:
+        code = (code << _CHAR_BITS) | ord(char)
+    return code
+
+
+def line_ngrams(line: str, n: int = const.DRILL_NGRAM) -> set:
+    return {line[i:i + n] for i in range(len(line) - n + 1)}
+
+
+def index_file(path: str, n: int = const.DRILL_NGRAM) -> Tuple[str, List[Tuple[int, str]], Dict[int, List[int]]]:
+    """ Runs in the pool: (path, [(line number, line)], n-gram -> numbers of its lines in the list) """
+    try:
+        text = read_text(path)
+    except (OSError, UnicodeDecodeError):
+        return path, [], {}
+    doc = Document(text)
+    lexer = FileFilters.LEXERS.get(os.path.splitext(path)[1])
+    filtered = FileFilters.strip_comments(text, lexer) if lexer is not None else None
+    code = filtered.text if filtered is not None else text
+
+    lines = []
+    postings: Dict[str, List[int]] = {}
+    seen = set()
+    offset = 0
+    for line in code.split("\n"):
+        stripped = line.strip()
+        if const.DRILL_MIN_LINE_LEN <= len(stripped) <= const.DRILL_MAX_LINE_LEN and stripped not in seen:
+            seen.add(stripped)
+            # Line number in the file as it is, not in the text without comments
+            original = filtered.offsets.to_original(offset, after_removed=True) if filtered is not None else offset
+            for ngram in line_ngrams(stripped, n):
+                postings.setdefault(ngram, []).append(len(lines))
+            lines.append((doc.get_coord(original)[0], stripped))
+        offset += len(line) + 1
+    # Strings are the keys while the file is read, every distinct one is encoded once
+    return path, lines, {ngram_code(ngram): ids for ngram, ids in postings.items()}
+
+
+def _write_part(file, data: bytes):
+    file.write(data)
+    file.write(bytes(-len(data) % 8))
+
+
+def build_index(root: str, index_path: str = const.DRILL_INDEX_PATH, workers: int = None,
+                n: int = const.DRILL_NGRAM) -> Tuple[int, int, int]:
+    """ Index of the corpus files, written to the temporary file first. Returns counts of the files, lines and n-grams """
+    paths = list(source_files(os.path.realpath(root)))
+    file_paths = []
+    line_file, line_no, line_start = array('I'), array('I'), array('Q', [0])
+    texts = []
+    text_len = 0
+    postings: Dict[int, array] = {}
+
+    with Pool(workers) as pool:
+        for path, lines, file_postings in pool.imap(index_file, paths, chunksize=8):
+            if not lines:
+                continue
+            base = len(line_file)
+            for number, line in lines:
+                encoded = line.encode(errors="surrogatepass")
+                texts.append(encoded)
+                text_len += len(encoded)
+                line_start.append(text_len)
+                line_file.append(len(file_paths))
+                line_no.append(number)
+            file_paths.append(path)
+            for ngram, ids in file_postings.items():
+                ngram_ids = postings.get(ngram)
+                if ngram_ids is None:
+                    ngram_ids = postings[ngram] = array('I')
+                ngram_ids.extend(map(base.__add__, ids))
+
+    keys = array('Q', sorted(postings))
+    post_start = array('Q', [0])
+    for ngram in keys:
+        post_start.append(post_start[-1] + len(postings[ngram]))
+    encoded_paths = [path.encode(errors="surrogatepass") for path in file_paths]
+    path_start = array('Q', [0])
+    for encoded in encoded_paths:
+        path_start.append(path_start[-1] + len(encoded))
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        _write_part(file, _HEADER.pack(_MAGIC, n, len(file_paths), len(line_file), len(keys), post_start[-1],
+                                       text_len, path_start[-1]))
+        _write_part(file, keys.tobytes())
+        _write_part(file, post_start.tobytes())
+        for ngram in keys:
+            file.write(postings[ngram].tobytes())
+        file.write(bytes(-post_start[-1] * 4 % 8))
+        for part in (line_file, line_no, line_start, path_start):
+            _write_part(file, part.tobytes())
+        _write_part(file, b"".join(texts))
+        _write_part(file, b"".join(encoded_paths))
+    os.replace(temp_path, index_path)
+    return len(file_paths), len(line_file), len(keys)
+
+
+class DrillIndex:
+    """ Memory mapped index, nothing is read before it is used but the file paths """
+
+    def __init__(self, path: str = const.DRILL_INDEX_PATH):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.n, files, lines, ngrams, postings, text_len, paths_len = _HEADER.unpack_from(self._data)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a drill index")
+        except (ValueError, struct.error):
+            self.close()
+            raise
+        view = memoryview(self._data)
+        pos = (_HEADER.size + 7) // 8 * 8
+
+        def take(count: int, item_format: str) -> memoryview:
+            nonlocal pos
+            size = count * struct.calcsize(item_format)
+            part = view[pos:pos + size]
+            if len(part) != size:
+                raise ValueError(f"{path} is truncated")
+            pos += (size + 7) // 8 * 8
+            return part.cast(item_format) if item_format != "B" else part
+
+        self._keys = take(ngrams, "Q")
+        self._post_start = take(ngrams + 1, "Q")
+        self._postings = take(postings, "I")
+        self._line_file = take(lines, "I")
+        self._line_no = take(lines, "I")
+        self._line_start = take(lines + 1, "Q")
+        path_start = take(files + 1, "Q")
+        self._text = take(text_len, "B")
+        paths = bytes(take(paths_len, "B"))
+        self.files = [str(paths[path_start[i]:path_start[i + 1]], "utf-8", "surrogatepass") for i in range(files)]
+        path_start.release()
+        self._file_ext = [os.path.splitext(path)[1] for path in self.files]
+
+    def close(self):
+        data = getattr(self, "_data", None)
+        for name in ("_keys", "_post_start", "_postings", "_line_file", "_line_no", "_line_start", "_text"):
+            part = getattr(self, name, None)
+            if part is not None:
+                part.release()
+        if data is not None:
+            data.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self._line_file)
+
+    def lines_with(self, ngram: str) -> memoryview:
+        """ Ids of the lines which have the n-gram, ascending """
+        code = ngram_code(ngram)
+        i = bisect_left(self._keys, code)
+        if i == len(self._keys) or self._keys[i] != code:
+            return self._postings[0:0]
+        return self._postings[self._post_start[i]:self._post_start[i + 1]]
+
+    def line(self, line_id: int) -> str:
+        return str(self._text[self._line_start[line_id]:self._line_start[line_id + 1]], "utf-8", "surrogatepass")
+
+    def location(self, line_id: int) -> Tuple[str, int]:
+        return self.files[self._line_file[line_id]], self._line_no[line_id]
+
+    def ext(self, line_id: int) -> str:
+        return self._file_ext[self._line_file[line_id]]
+
+    def choose(self, weights: Dict[str, float], count: int = const.DRILL_LINES, ext: str = None,
+               rng: random.Random = None) -> List[int]:
+        """
+        Lines which have the most of the weighted n-grams. Every chosen line makes the weights
+        of its n-grams lower, so the next lines bring the other ones. Only the lines of the
+        files with the 'ext' extension if it's given. Random lines if no n-gram is in the index
+        """
+        rng = rng or random.Random()
+        targets: Dict[str, float] = {}
+        scores: Dict[int, float] = {}
+        get_score = scores.get
+        for ngram, weight in weights.items():
+            ids = self.lines_with(ngram) if len(ngram) == self.n else self._postings[0:0]
+            if not len(ids):
+                continue
+            # Window from a random place, around the end, so the drills are different every time
+            start = rng.randrange(len(ids))
+            windows = (ids[start:start + const.DRILL_POSTINGS_SAMPLE],
+                       ids[:max(0, min(start, start + const.DRILL_POSTINGS_SAMPLE - len(ids)))])
+            for window in windows:
+                for line_id in window:
+                    scores[line_id] = get_score(line_id, 0) + weight
+            targets[ngram] = weight
+        if not targets:
+            return self._random_lines(count, ext, rng)
+
+        if ext is not None:
+            line_file, file_ext = self._line_file, self._file_ext
+            scores = {line_id: score for line_id, score in scores.items() if file_ext[line_file[line_id]] == ext}
+        # Greedy choice over the best lines with the lazy updates: a line score can only go down
+        heap = [(-score, line_id) for line_id, score in
+                heapq.nlargest(count * CANDIDATES_PER_LINE, scores.items(), key=itemgetter(1))]
+        heapq.heapify(heap)
+        line_targets: Dict[int, List[str]] = {}
+        chosen = []
+        chosen_text = set()
+        while heap and len(chosen) < count:
+            neg_score, line_id = heapq.heappop(heap)
+            text = self.line(line_id)
+            ngrams = line_targets.get(line_id)
+            if ngrams is None:
+                ngrams = line_targets[line_id] = [ngram for ngram in targets if ngram in text]
+            score = sum(targets[ngram] for ngram in ngrams)
+            if heap and score < -heap[0][0]:
+                heapq.heappush(heap, (-score, line_id))
+                continue
+            if text in chosen_text:
+                continue
+            chosen.append(line_id)
+            chosen_text.add(text)
+            for ngram in ngrams:
+                targets[ngram] *= REPEAT_DECAY
+        return chosen
+
+    def _random_lines(self, count: int, ext: Optional[str], rng: random.Random) -> List[int]:
+        chosen = []
+        for _ in range(count * 20):
+            if len(chosen) == count or not len(self):
+                break
+            line_id = rng.randrange(len(self))
+            if (ext is None or self.ext(line_id) == ext) and line_id not in chosen:
+                chosen.append(line_id)
+        return chosen
+
+
+def weak_bigrams(stats: Sequence[Tuple[str, int, float, int]], limit: int = const.DRILL_TARGETS) -> Dict[str, float]:
+    """
+    Bigrams of SessionHistory.bigram_stats() which cost more than the average one, by how much.
+    Cost is the mean latency, errors add the keystrokes to fix them
+    """
+    # Line breaks can't be drilled on one line, older sessions have Return as "\r"
+    stats = [row for row in stats if "\n" not in row[0] and "\r" not in row[0]]
+    typed = sum(cnt for _, cnt, _, _ in stats)
+    if not typed:
+        return {}
+    mean_latency = sum(cnt * latency for _, cnt, latency, _ in stats) / typed
+    error_cost = ERROR_COST_KEYS * mean_latency
+    mean_cost = mean_latency + sum(errors for _, _, _, errors in stats) / typed * error_cost
+    costs = {bigram: (latency + errors / cnt * error_cost) / mean_cost for bigram, cnt, latency, errors in stats}
+    return dict(sorted(((bigram, cost) for bigram, cost in costs.items() if cost > 1),
+                       key=lambda item: item[1], reverse=True)[:limit])
+
+
+def make_drill(index: DrillIndex, weights: Dict[str, float], count: int = const.DRILL_LINES, ext: str = None,
+               rng: random.Random = None) -> str:
+    return "\n".join(index.line(line_id) for line_id in index.choose(weights, count, ext, rng))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index the source files of the directory tree")
+    build.add_argument("dir")
+    build.add_argument("--workers", type=int, help="index processes, all the cores by default")
+    show = commands.add_parser("show", help="print the drill of the weak bigrams from the history")
+    show.add_argument("--lines", type=int, default=const.DRILL_LINES)
+    show.add_argument("--ext", help="only the lines of the files with the extension, e.g. .c")
+    show.add_argument("--db", default=const.HISTORY_DB_PATH, help="sessions history database")
+    parser.add_argument("--index", default=const.DRILL_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        files, lines, ngrams = build_index(args.dir, args.index, args.workers)
+        print(f"{files} files, {lines} lines, {ngrams} n-grams indexed in {time.perf_counter() - start:.1f} s, "
+              f"{os.path.getsize(args.index) / 1e6:.1f} MB")
+        return
+
+    from history import SessionHistory
+    history = SessionHistory(args.db)
+    try:
+        weights = weak_bigrams(history.bigram_stats())
+    finally:
+        history.close()
+    index = DrillIndex(args.index)
+    start = time.perf_counter()
+    chosen = index.choose(weights, args.lines, args.ext)
+    elapsed = time.perf_counter() - start
+    for line_id in chosen:
+        print(index.line(line_id))
+    print(f"\nweak bigrams: {', '.join(f'{bigram!r} {weight:.2f}' for bigram, weight in weights.items()) or 'none'}; "
+          f"{len(chosen)} lines chosen in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
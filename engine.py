@@ -0,0 +1,224 @@
+"""
+Headless typing core. It knows the target text, the cursor, good and bad
+ranges and the statistics, but nothing about Tk: every keystroke returns
+the list of highlight changes (RangeDelta) the frontend has to render.
+"""
+
+from typing import Iterable, List
+
+from constants import Constants as const
+from document import Document
+from state import StateStorage
+from state_structure import Coord, RangeDelta
+from statistics import KeystrokeLog, Statistics
+
+
+def common_prefix_len(text: str, chars: str, start: int) -> int:
+    """ Length of the common prefix of text and chars[start:]. Slices are compared in C """
+    limit = min(len(text), len(chars) - start)
+    # Galloping: a mismatch close to the start costs only short slices
+    matched, step = 0, 1
+    while matched < limit:
+        end = min(matched + step, limit)
+        if text[matched:end] != chars[start + matched:start + end]:
+            break
+        matched, step = end, step * 2
+    else:
+        return matched
+
+    # The mismatch is in [matched, end)
+    end -= 1
+    while matched < end:
+        mid = (matched + end + 1) // 2
+        if text[matched:mid] == chars[start + matched:start + mid]:
+            matched = mid
+        else:
+            end = mid - 1
+    return matched
+
+
+class TypingEngine:
+    BACKSPACE = ("\b", "\x7f")
+    RETURN = ("\r", "\n")
+    TAB = "\t"
+    SPACE = " "
+
+    def __init__(self, stat: Statistics = None, doc: Document = None):
+        self.storage = StateStorage()
+        self.stat = stat if stat is not None else Statistics()
+        self.doc = doc if doc is not None else Document()
+        self._tab_spaces = const.TAB_SIZE_SYMBOLS * self.SPACE
+
+    def load(self, text: str):
+        """ Set new target text (already tab expanded) and start from the beginning """
+        self.doc.set_text(text)
+        self.reset()
+
+    def reset(self):
+        self.storage.reset()
+        self.stat.reset()
+
+    @property
+    def cursor(self) -> Coord:
+        # The cursor is always the right border of the bad range
+        return self.storage.pos.bad.right
+
+    def set_document(self, doc):
+        """ Use another Document (or MappedDocument) and start from the beginning """
+        self.doc = doc
+        self.reset()
+
+    def get_line_len(self, line: int) -> int:
+        return self.doc.get_line_len(line)
+
+    def get_line_cnt(self) -> int:
+        return self.doc.line_cnt
+
+    def moved_key(self, char: str, keysym: str, line: int) -> str:
+        """ Key name for the scrolling after the cursor moved from the 'line' """
+        if self.cursor.line > line:
+            return "Return"
+        if char in self.BACKSPACE:
+            return "BackSpace"
+        return keysym
+
+    def feed(self, char: str) -> List[RangeDelta]:
+        deltas = []
+        self._feed(char, deltas)
+        return deltas
+
+    def feed_many(self, chars: Iterable[str]) -> List[RangeDelta]:
+        deltas = []
+        for char in chars:
+            self._feed(char, deltas)
+        return self.coalesce(deltas)
+
+    def feed_chunk(self, chars: str) -> List[RangeDelta]:
+        """
+        Many keys at once (paste, stenography, drills). While there is no error,
+        the chunk is compared with the text line by line in bulk and the matched
+        part is taken in one step. Keys from the first mismatch go one by one
+        until the error is fixed, then the bulk comparison goes on.
+        """
+        # One line break per Return, pasted text may have Windows or old Mac ones
+        chars = chars.replace("\r\n", "\n").replace("\r", "\n")
+        deltas = []
+        i = 0
+        while i < len(chars):
+            if not self.storage.has_error():
+                matched = self._feed_matching(chars, i, deltas)
+                if matched:
+                    i += matched
+                    continue
+            self._feed(chars[i], deltas)
+            i += 1
+        return self.coalesce(deltas)
+
+    def _feed_matching(self, chars: str, start: int, deltas: List[RangeDelta]) -> int:
+        """ Take the part of chars[start:] which matches the text from the cursor, return its length """
+        doc = self.doc
+        line, col = self.cursor
+        first_line, first_col = line, col
+        i = start
+        while i < len(chars):
+            rest = doc.get_line(line)[col:]
+            matched = common_prefix_len(rest, chars, i)
+            if matched:
+                deltas.append(RangeDelta(const._CORRECT, line, col, col + matched, True))
+                col += matched
+                i += matched
+            if matched < len(rest) or i == len(chars) or chars[i] != "\n" or not doc.has_line(line + 1):
+                break
+            # Return at the end of the line
+            line, col = line + 1, 0
+            i += 1
+
+        typed = chars[start:i]
+        if typed:
+            self.stat.record_run(typed, first_line, first_col)
+            self.stat.upd_speed(len(typed))
+            self.stat.one_word_typed(typed.count(self.SPACE))
+            self._move(Coord(line, col), True)
+        return len(typed)
+
+    @staticmethod
+    def coalesce(deltas: List[RangeDelta]) -> List[RangeDelta]:
+        """ Merge neighbour deltas of the same kind on the same line """
+        merged = []
+        for delta in deltas:
+            if merged:
+                last = merged[-1]
+                if last.state == delta.state and last.line == delta.line and last.added == delta.added:
+                    if delta.added and last.end == delta.start:
+                        last.end = delta.end
+                        continue
+                    if not delta.added and last.start == delta.end:
+                        last.start = delta.start
+                        continue
+            merged.append(delta)
+        return merged
+
+    def _move(self, new_pos: Coord, correct: bool):
+        pos = self.storage.pos
+        if correct:
+            pos.good.right = pos.bad.left = new_pos
+        pos.bad.right = new_pos
+
+    def _feed(self, char: str, deltas: List[RangeDelta]):
+        pos = self.storage.pos
+        line, col = pos.bad.right.line, pos.bad.right.col
+        has_err = self.storage.has_error()
+
+        if char in self.BACKSPACE:
+            if col == 0:
+                # Go back to the end of previous line. We are at the beginning of the file if line == 1
+                if line != 1:
+                    self.stat.record(char, line, col, KeystrokeLog.BACKSPACE)
+                    self._move(Coord(line - 1, self.get_line_len(line - 1)), not has_err)
+                return
+            self.stat.record(char, line, col, KeystrokeLog.BACKSPACE)
+            state = const._INCORRECT if has_err else const._CORRECT
+            deltas.append(RangeDelta(state, line, col - 1, col, False))
+            self._move(Coord(line, col - 1), not has_err)
+            return
+
+        doc = self.doc
+        # Tk delivers Return as "\r", the keystroke log and the history keep one line break
+        if char == "\r":
+            char = "\n"
+
+        # Key doesn't matter(except Backspace) if we reach end of line: it works as "Return"
+        if col >= doc.get_line_len(line):
+            if not doc.has_line(line + 1):
+                return
+            correct = char in self.RETURN and not has_err
+            self.stat.record(char, line, col, KeystrokeLog.CORRECT if correct else KeystrokeLog.WRONG)
+            self._move(Coord(line + 1, 0), correct)
+            if correct:
+                self.stat.upd_speed()
+            else:
+                self.stat.upd_err()
+            return
+
+        # Decline "Return" key if we are not on the last character
+        if char in self.RETURN:
+            return
+
+        key = char
+        # We can use tab instead of space sequence. See const.TAB_SIZE_SYMBOLS
+        if char == self.TAB and doc.line_startswith(line, col, self._tab_spaces):
+            char = self._tab_spaces
+
+        end = col + len(char)
+        correct = not has_err and doc.line_startswith(line, col, char)
+        deltas.append(RangeDelta(const._CORRECT if correct else const._INCORRECT, line, col, end, True))
+        self._move(Coord(line, end), correct)
+        self.stat.record(key, line, col, KeystrokeLog.CORRECT if correct else KeystrokeLog.WRONG)
+
+        if correct:
+            self.stat.upd_speed()
+        else:
+            self.stat.upd_err()
+            self.storage.add_error(line, col, end)
+        if char == self.SPACE:
+            self.stat.one_word_typed()
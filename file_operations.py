@@ -1,66 +1,292 @@
 import os.path
 import re
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class CommentLexer(ABC):
+    """
+    Finds comments in one pass over the text. Strings are matched by the same
+    pattern, so comment markers inside them are skipped.
+    """
+    extensions: Tuple[str, ...] = ()
+    _pattern: re.Pattern = None
+
+    def comment_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        for match in self._pattern.finditer(text):
+            if self.is_comment(match, text):
+                yield match.span()
+
+    @abstractmethod
+    def is_comment(self, match: re.Match, text: str) -> bool:
+        """ Is the matched token a comment, not a string """
+
+
+class CLexer(CommentLexer):
+    extensions = (".c", ".h")
+    _pattern = re.compile(r'//[^\n]*|/\*(?:.*?\*/|.*)|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+
+    def is_comment(self, match: re.Match, text: str) -> bool:
+        return match.group().startswith("/")
+
+
+class PythonLexer(CommentLexer):
+    extensions = (".py",)
+    _pattern = re.compile(r'#[^\n]*|[rRbBuUfF]{0,2}(?:"""(?:\\.|.)*?"""|\'\'\'(?:\\.|.)*?\'\'\')'
+                          r'|[rRbBuUfF]{0,2}(?:"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')', re.DOTALL)
+    _blank = re.compile(r'[ \t]*(?:\n|$)')
+
+    def is_comment(self, match: re.Match, text: str) -> bool:
+        token = match.group()
+        if token.startswith("#"):
+            return True
+        # Triple quoted string which takes its own lines is a docstring
+        if token.startswith(('"""', "'''")):
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            return not text[line_start:match.start()].strip() and bool(self._blank.match(text, match.end()))
+        return False
+
+
+class OffsetMap:
+    """
+    Maps offsets between the original and the filtered text. Every kept piece of
+    the original text is one segment: where it starts in both texts.
+    """
+
+    def __init__(self):
+        self.filtered_start = array('I')
+        self.original_start = array('I')
+
+    def add_segment(self, filtered: int, original: int):
+        self.filtered_start.append(filtered)
+        self.original_start.append(original)
+
+    def to_original(self, offset: int, after_removed: bool = False) -> int:
+        """
+        Offset on the border of the removed text is mapped before it, so the typing
+        progress doesn't jump over the comments when they are shown again.
+        With 'after_removed' it is mapped after it, e.g. for the line starts
+        """
+        if after_removed:
+            i = bisect_right(self.filtered_start, offset) - 1
+        else:
+            i = max(0, bisect_left(self.filtered_start, offset) - 1)
+        if i < 0 or not self.filtered_start:
+            return offset
+        return self.original_start[i] + offset - self.filtered_start[i]
+
+    def to_filtered(self, offset: int) -> int:
+        """ Offset inside of the removed text is mapped to the next kept symbol """
+        i = bisect_right(self.original_start, offset) - 1
+        if i < 0:
+            return 0
+        filtered = self.filtered_start[i] + offset - self.original_start[i]
+        if i + 1 < len(self.filtered_start):
+            return min(filtered, self.filtered_start[i + 1])
+        return filtered
+
+
+@dataclass
+class FilteredText:
+    """ Filtered text with the removed pieces: removed[i] goes right after the kept segment i """
+    text: str
+    offsets: OffsetMap
+    removed: List[str]
+
+    def removed_ranges(self) -> Iterator[Tuple[int, int, str]]:
+        """ (original offset, filtered offset, removed text) of every removed piece """
+        for i, piece in enumerate(self.removed):
+            yield self.offsets.original_start[i + 1] - len(piece), self.offsets.filtered_start[i + 1], piece
+
+    def original_text(self) -> str:
+        pieces = []
+        filtered_start = self.offsets.filtered_start
+        for i, piece in enumerate(self.removed):
+            pieces.append(self.text[filtered_start[i]:filtered_start[i + 1]])
+            pieces.append(piece)
+        pieces.append(self.text[filtered_start[-1]:])
+        return "".join(pieces)
 
 
 class FileFilters:
-    C_TYPE = ".c"
-    PY_TYPE = ".py"
     FILTER_COMMENTS = "filter_comments"
+    # How many filtered texts we keep for the toggling of the checkbox
+    CACHE_SIZE = 8
+    LEXERS: Dict[str, CommentLexer] = {}
 
     def __init__(self, parent):
         self.parent = parent
         self.curr_file_ext = None
-        self.file_ext = (self.C_TYPE, self.PY_TYPE)
-        self.original_text = ""
+        self.curr_file_path = None
+        # Set while comments are hidden, it's enough to get the original text back
+        self.filtered: Optional[FilteredText] = None
+        # Typing state when the comments were hidden: (original, filtered) offset of every range border,
+        # filtered -> original span of every error and the original spans of the errors inside of comments
+        self._hidden_borders: List[Tuple[int, int]] = []
+        self._hidden_errors: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self._removed_errors: List[Tuple[int, int]] = []
+        # Document.version -> filtered text of the document
+        self._cache: OrderedDict = OrderedDict()
+
+    @classmethod
+    def register_lexer(cls, lexer: CommentLexer):
+        for ext in lexer.extensions:
+            cls.LEXERS[ext] = lexer
 
     def check_file_ext(self, file_path: str):
         ext = os.path.splitext(file_path)[1]
+        self.curr_file_path = file_path
+        self.filtered = None
+        self.curr_file_ext = ext if ext in self.LEXERS else None
 
-        if ext in self.file_ext:
-            self.curr_file_ext = ext
-
-    def apply_filter(self, filter_type, value):
+    def apply_filter(self, filter_type, value) -> List[Tuple[int, int]]:
+        """ Offsets of the text which was returned back, see hide_range() """
         if self.curr_file_ext:
             if filter_type == self.FILTER_COMMENTS:
-                self.hide_range(value)
+                return self.hide_range(value)
+        return []
+
+    def find_comments(self, doc) -> Optional[FilteredText]:
+        lexer = self.LEXERS.get(self.curr_file_ext)
+        if lexer is None:
+            return None
 
-    def find_comments(self):
-        if self.curr_file_ext == self.C_TYPE:
-            text = self.parent.text.get("1.0", "end")
+        filtered = self._cache.get(doc.version)
+        if filtered is None:
+            filtered = self.strip_comments(doc.text, lexer)
+            self.preload(doc, filtered)
+        else:
+            self._cache.move_to_end(doc.version)
+        return filtered
 
-            # The code below was generated by chatGBT
-            # Remove multi-line comments
-            pattern = re.compile(r'/\*.*?\*/', re.DOTALL)
-            text = pattern.sub('', text)
+    def preload(self, doc, filtered: FilteredText):
+        """ Filtered text of the current document text, e.g. prepared by the corpus indexing """
+        self._cache[doc.version] = filtered
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
 
-            # Remove single-line comments
-            pattern = re.compile(r'^\s*//.*$', re.MULTILINE)
-            text = pattern.sub('', text)
+    @staticmethod
+    def strip_comments(text: str, lexer: CommentLexer) -> FilteredText:
+        """
+        Remove comments with the whitespaces before them. Lines which had only
+        comments are removed completely.
+        """
+        pieces = []
+        removed = []
+        offsets = OffsetMap()
+        filtered_len = 0
+        kept_from = 0
+        # Start of the pending removal range which can still be merged with the next comment
+        removal_start = None
+        removal_end = 0
 
-            # Remove empty lines
-            pattern = re.compile(r'^\s*\n', re.MULTILINE)
-            text = pattern.sub('', text)
+        for start, end in lexer.comment_spans(text):
+            # Extend to the left over the whitespaces, merge with the previous comment if we reach it
+            while start > 0 and text[start - 1] in " \t" and start > removal_end:
+                start -= 1
+            if removal_start is not None and start <= removal_end:
+                start = removal_start
+            elif removal_start is not None:
+                piece = text[kept_from:removal_start]
+                offsets.add_segment(filtered_len, kept_from)
+                pieces.append(piece)
+                removed.append(text[removal_start:removal_end])
+                filtered_len += len(piece)
+                kept_from = removal_end
 
-            self.parent.text.delete("1.0", "end")
-            self.parent.text.insert("1.0", text)
+            # Comment takes the whole line(s): remove the line break as well
+            if start == 0 or text[start - 1] == "\n":
+                blank_end = end
+                while blank_end < len(text) and text[blank_end] in " \t":
+                    blank_end += 1
+                if blank_end == len(text) or text[blank_end] == "\n":
+                    end = min(blank_end + 1, len(text))
 
-        elif self.curr_file_ext == self.PY_TYPE:
-            pattern = re.compile(r'#[^\'"]*$|""".*?"""|\'\'\'.*?\'\'\'|#[^\'"]*$', re.MULTILINE | re.DOTALL)
+            removal_start, removal_end = start, end
 
-            # Get the text from the Text widget
-            text = self.parent.text.get("1.0", "end")
+        if removal_start is not None:
+            piece = text[kept_from:removal_start]
+            offsets.add_segment(filtered_len, kept_from)
+            pieces.append(piece)
+            removed.append(text[removal_start:removal_end])
+            filtered_len += len(piece)
+            kept_from = removal_end
+        offsets.add_segment(filtered_len, kept_from)
+        pieces.append(text[kept_from:])
 
-            # Remove all the matches from the text
-            new_text = pattern.sub("", text)
+        return FilteredText("".join(pieces), offsets, removed)
 
-            # Set the updated text to the Text widget
-            self.parent.text.delete("1.0", "end")
-            self.parent.text.insert("1.0", new_text)
+    def hide_range(self, cmd) -> List[Tuple[int, int]]:
+        """
+        Remove or return back only the comments in the text widget, so highlighting of
+        the rest stays as is. Typing state is moved to the new text positions.
+        Parent without the text widget (text is None) gets only the document updated.
+        Returns [start, end) offsets of the comments which were returned back, they are
+        inserted without tags and have to be highlighted by the caller.
+        """
+        doc = self.parent.doc
+        storage = self.parent.txt_engine.storage
+        text = self.parent.text
+        borders, errors = storage.to_offsets(doc)
+        restored = []
 
-    def hide_range(self, cmd):
         if cmd:
-            self.original_text = self.parent.text.get("1.0", "end")
-            self.find_comments()
+            if self.filtered is not None:
+                return restored
+            self.filtered = self.find_comments(doc)
+            offset_map = self.filtered.offsets
+            if text is not None:
+                # From the end, so the positions before stay valid
+                for original, _, piece in reversed(list(self.filtered.removed_ranges())):
+                    text.delete("%d.%d" % doc.get_coord(original), "%d.%d" % doc.get_coord(original + len(piece)))
+            hidden_borders = [offset_map.to_filtered(offset) for offset in borders]
+            self._hidden_borders = list(zip(borders, hidden_borders))
+            self._hidden_errors.clear()
+            self._removed_errors.clear()
+            hidden_errors = []
+            for start, end in errors:
+                span = (offset_map.to_filtered(start), offset_map.to_filtered(end))
+                if span[0] == span[1]:
+                    # Error inside of a comment, it comes back with the comment
+                    self._removed_errors.append((start, end))
+                else:
+                    self._hidden_errors[span] = (start, end)
+                    hidden_errors.append(span)
+            borders, errors = hidden_borders, hidden_errors
+            doc.set_text(self.filtered.text)
         else:
-            self.parent.text.delete("1.0", "end")
-            self.parent.text.insert("1.0", self.original_text)
+            if self.filtered is None:
+                return restored
+            offset_map = self.filtered.offsets
+            if text is not None:
+                for _, filtered, piece in reversed(list(self.filtered.removed_ranges())):
+                    # Explicit empty tag list: the piece doesn't take the tags around it
+                    text.insert("%d.%d" % doc.get_coord(filtered), piece, ())
+            restored = [(original, original + len(piece)) for original, _, piece in self.filtered.removed_ranges()]
+            # Borders and errors which weren't changed while hidden go back exactly:
+            # several original offsets around the removed text have the same filtered one
+            borders = [original if offset == hidden else offset_map.to_original(offset)
+                       for offset, (original, hidden) in zip(borders, self._hidden_borders)]
+            original_errors = list(self._removed_errors)
+            for start, end in errors:
+                original = self._hidden_errors.get((start, end))
+                if original is None:
+                    # Typed while hidden: from its first to its last symbol, each is a kept one
+                    original = (offset_map.to_original(start, after_removed=True),
+                                offset_map.to_original(end - 1, after_removed=True) + 1)
+                original_errors.append(original)
+            errors = original_errors
+            doc.set_text(self.filtered.original_text())
+            # The original text has a new version, the comments are hidden again without the lexer
+            self.preload(doc, self.filtered)
+            self.filtered = None
+
+        storage.from_offsets(doc, borders, errors)
+        return restored
+
+FileFilters.register_lexer(CLexer())
+FileFilters.register_lexer(PythonLexer())
@@ -0,0 +1,202 @@
+"""
+Sessions history in the local SQLite database. All the writes are done by
+the background thread in batches, so the Tk event loop never waits for the disk.
+Keystrokes come from Statistics.log, bigram latencies are aggregated while
+writing, so the analytics queries don't scan the keystrokes table.
+"""
+
+import logging
+import os.path
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from itertools import count
+from typing import List, Optional, Tuple
+
+from statistics import KeystrokeLog, Statistics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    filtered INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    symbols INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    wpm REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_file_started ON sessions (file, started_at);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started_at);
+
+CREATE TABLE IF NOT EXISTS keystrokes (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    time_ns INTEGER NOT NULL,
+    char INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    flag INTEGER NOT NULL,
+    latency_ns INTEGER,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS bigrams (
+    bigram TEXT PRIMARY KEY,
+    cnt INTEGER NOT NULL,
+    latency_ns INTEGER NOT NULL,
+    errors INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SessionHistory:
+    BATCH_SIZE = 5000
+    # Longer pauses are not typing latency, they are not added to the bigrams
+    MAX_BIGRAM_LATENCY_NS = 2 * 1000000000
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+        self._queue = queue.Queue()
+        self._tokens = count(1)
+        # Session which is being typed now: its token, the file and how many keystrokes are already sent
+        self._session: Optional[int] = None
+        self._file = ""
+        self._filtered = False
+        self._sent = 0
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    # UI thread side
+
+    def start_session(self, file: str, filtered: bool = False):
+        """ New session starts in the database only with its first keystroke """
+        self._session = None
+        self._file = file
+        self._filtered = filtered
+        self._sent = 0
+
+    def collect(self, stat: Statistics):
+        """ Send new keystrokes from the log to the writer. Cheap, call it from time to time """
+        log = stat.log
+        if log.total <= self._sent:
+            return
+        if self._session is None:
+            self._session = next(self._tokens)
+            self._queue.put(("start", self._session, self._file, int(self._filtered), time.time()))
+        first = max(self._sent, log.total - log.capacity)
+        rows = [(number,) + tuple(log.get(number)) for number in range(first, log.total)]
+        self._sent = log.total
+        self._queue.put(("keys", self._session, rows))
+
+    def finish_session(self, stat: Statistics):
+        self.collect(stat)
+        if self._session is not None:
+            self._queue.put(("finish", self._session, time.time(), stat.symbol_cnt, stat.errors, stat.speed_wpm))
+        self._session = None
+
+    def close(self, stat: Statistics = None):
+        if stat is not None:
+            self.finish_session(stat)
+        self._queue.put(None)
+        self._writer.join()
+
+    # Writer thread side
+
+    def _write_loop(self):
+        try:
+            conn = self._connect()
+            conn.executescript(SCHEMA)
+        except (sqlite3.Error, OSError) as err:
+            self.logger.warning("History is disabled: %s", err)
+            # Keep draining, so the UI side never blocks on the queue
+            while self._queue.get() is not None:
+                pass
+            return
+
+        # token -> (session id, last keystroke time and char) for the latency of the next batch
+        sessions = {}
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                stop = True
+            try:
+                with conn:
+                    for item in batch:
+                        self._write(conn, sessions, item)
+            except (sqlite3.Error, KeyError) as err:
+                self.logger.warning("History write failed: %r", err)
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, sessions: dict, item: tuple):
+        kind, token = item[0], item[1]
+        if kind == "start":
+            _, _, file, filtered, started_at = item
+            cursor = conn.execute("INSERT INTO sessions (file, filtered, started_at) VALUES (?, ?, ?)",
+                                  (file, filtered, started_at))
+            sessions[token] = (cursor.lastrowid, None, None)
+        elif kind == "keys":
+            session_id, prev_time, prev_char = sessions[token]
+            rows = []
+            bigrams = {}
+            for number, time_ns, char, line, col, flag in item[2]:
+                latency = time_ns - prev_time if prev_time is not None else None
+                rows.append((session_id, number, time_ns, ord(char), line, col, flag, latency))
+                if flag != KeystrokeLog.BACKSPACE:
+                    if prev_char is not None and latency is not None and latency <= self.MAX_BIGRAM_LATENCY_NS:
+                        cnt, total, errors = bigrams.get(prev_char + char, (0, 0, 0))
+                        bigrams[prev_char + char] = (cnt + 1, total + latency, errors + (flag == KeystrokeLog.WRONG))
+                    prev_char = char
+                else:
+                    prev_char = None
+                prev_time = time_ns
+            sessions[token] = (session_id, prev_time, prev_char)
+            conn.executemany("INSERT OR REPLACE INTO keystrokes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO bigrams VALUES (?, ?, ?, ?) ON CONFLICT (bigram) DO UPDATE SET "
+                             "cnt = cnt + excluded.cnt, latency_ns = latency_ns + excluded.latency_ns, "
+                             "errors = errors + excluded.errors",
+                             [(bigram,) + values for bigram, values in bigrams.items()])
+        elif kind == "finish":
+            _, _, ended_at, symbols, errors, wpm = item
+            conn.execute("UPDATE sessions SET ended_at = ?, symbols = ?, errors = ?, wpm = ? WHERE id = ?",
+                         (ended_at, symbols, errors, wpm, sessions.pop(token)[0]))
+
+    # Analytics, they use their own connection (WAL lets it read next to the writer)
+
+    def wpm_trend(self, file: str, days: int = 90) -> List[Tuple[str, float, int]]:
+        """ (day, mean WPM, sessions) for the file over the last days """
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute("SELECT date(started_at, 'unixepoch', 'localtime') AS day, avg(wpm), count(*) "
+                                "FROM sessions WHERE file = ? AND started_at >= ? AND ended_at IS NOT NULL "
+                                "GROUP BY day ORDER BY day",
+                                (file, time.time() - days * 86400)).fetchall()
+
+    def slowest_bigrams(self, limit: int = 10, min_count: int = 20) -> List[Tuple[str, float, int, int]]:
+        """ (bigram, mean latency in ms, times typed, errors) over all the sessions """
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute("SELECT bigram, latency_ns / cnt / 1e6 AS latency_ms, cnt, errors FROM bigrams "
+                                "WHERE cnt >= ? ORDER BY latency_ms DESC LIMIT ?", (min_count, limit)).fetchall()
+
+    def bigram_stats(self, min_count: int = 20) -> List[Tuple[str, int, float, int]]:
+        """ (bigram, times typed, mean latency in ms, errors) of the bigrams typed at least min_count times """
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute("SELECT bigram, cnt, latency_ns / cnt / 1e6, errors FROM bigrams WHERE cnt >= ?",
+                                (min_count,)).fetchall()
@@ -0,0 +1,50 @@
+import queue
+import os.path
+import threading
+
+from constants import Constants as const
+
+
+class FileLoader(threading.Thread):
+    """
+    Reads and decodes the file on its own thread. The queue gets tab expanded
+    pieces of whole lines, then the rest of the file and None at the end,
+    or the exception if the file can't be read. First pieces are small, so the
+    first screen is ready soon, then they grow to keep the number of pieces low.
+    """
+    FIRST_CHUNK_SIZE = 64 * 1024
+    MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, file_path: str):
+        super().__init__(name="file-loader", daemon=True)
+        self.file_path = file_path
+        self.size = os.path.getsize(file_path)
+        self.queue = queue.Queue()
+        self.read_size = 0
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        tab_spaces = " " * const.TAB_SIZE_SYMBOLS
+        try:
+            # The same decoding as read_text() does
+            with open(self.file_path) as file:
+                rest = ""
+                chunk_size = self.FIRST_CHUNK_SIZE
+                while not self._cancelled:
+                    data = file.read(chunk_size)
+                    if not data:
+                        break
+                    self.read_size += len(data)
+                    data = rest + data
+                    cut = data.rfind("\n") + 1
+                    rest = data[cut:]
+                    if cut:
+                        self.queue.put(data[:cut].replace("\t", tab_spaces))
+                    chunk_size = min(chunk_size * 2, self.MAX_CHUNK_SIZE)
+                self.queue.put(rest.replace("\t", tab_spaces))
+            self.queue.put(None)
+        except (OSError, UnicodeDecodeError) as err:
+            self.queue.put(err)
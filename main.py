@@ -1,20 +1,33 @@
 import sys
 import os.path
-import math
+import time
+import queue
 import logging
+from itertools import count
 from logging import StreamHandler
 
-if sys.version_info < (3, 7, 0):
-    raise RuntimeError("Sorry, python 3.7.0 or later is required")
+if sys.version_info < (3, 8, 0):
+    raise RuntimeError("Sorry, python 3.8.0 or later is required")
 
-from tkinter import Tk, Text, Label, Scrollbar, Frame, Menu, filedialog, INSERT, ALL, END, Checkbutton, IntVar
+from tkinter import Tk, Toplevel, Text, Label, Scrollbar, Frame, Menu, END, Checkbutton, IntVar, TclError
 import tkinter.font as tkfont
 
 from statistics import Statistics
-from state import StateStorage
+from engine import TypingEngine
+from state_structure import Coord
+from document import Document, MappedDocument, read_text
+from viewport import Viewport
 from processing import TextProcessor
+from scheduler import FrameScheduler
 from constants import Constants as const
 from file_operations import FileFilters
+from history import SessionHistory
+from snapshot import SnapshotCache
+from tracing import Tracer
+
+# Modules which are needed only by some of the menu commands or options are imported
+# where they are used, so the window shows up sooner: tkinter.filedialog, recording, corpus, loader, analytics, drill,
+# canvas_processing
 
 
 class App:
@@ -23,52 +36,86 @@ class App:
     _frame_stat_pad = 10
     _text_bottom_symbols_pad = 5
 
-    def __init__(self, root_widget):
+    def __init__(self, root_widget, record_dir: str = None, trace_path: str = None, corpus_dir: str = None,
+                 file_path: str = None, renderer: str = "text"):
         self._restore_pos: bool = False
-        self._last_pos: str = self.START_POS
-        self._shifted_symbols_hor = 0
-        self._shifted_symbols_vert = 0
+        # Every session is recorded to its own file in the record_dir, see recording.py
+        self.record_dir = record_dir
+        self.recorder = None
+        # Spans of the keystroke handling, saved on close. Disabled without the path, see tracing.py
+        self.tracer = Tracer.from_env(trace_path)
+        self._text_font = None
+        self._window_move_pending = False
         self.max_symbols_per_line = 0
         self.file_ext = ""
+        self.file_path = ""
         self.logger = logging.getLogger(__name__)
         self.logger.addHandler(StreamHandler(stream=sys.stdout))
         self.logger.setLevel(logging.WARNING)
         self.checkbox_value = IntVar()
 
         # Setup processing core and state storage
-        self.txt_state_storage = StateStorage()
-        self.txt_proc = TextProcessor(self.txt_state_storage, self)
+        self.doc = Document()
+        # Used instead of self.doc by the engine for the large files, see open_large_file()
+        self.mapped_doc = None
         self.txt_stat = Statistics()
+        self.txt_engine = TypingEngine(self.txt_stat, self.doc)
         self.txt_filter = FileFilters(self)
+        self.viewport = Viewport()
+        self.history = SessionHistory(const.HISTORY_DB_PATH)
+        # Directory tree of files for the practice one after another, see corpus.py
+        self.corpus = None
+        # Worker which reads the file being loaded, see load_file()
+        self.loader = None
+        self._inserted_len = 0
+        self._loading_stat = None
+        # Prepared documents of the files which were opened before, see snapshot.py
+        self.snapshots = SnapshotCache(const.SNAPSHOT_DIR)
 
         self.create_menu(root_widget)
 
         # Setup text widget
         self.text = Text(root_widget, wrap="none")
+        # Highlighting with the tags of the text widget or on a canvas over it, see canvas_processing.py
+        if renderer == "canvas":
+            from canvas_processing import CanvasProcessor
+            self.txt_proc = CanvasProcessor(self.text)
+        else:
+            self.txt_proc = TextProcessor(self.text)
         self._root = root_widget
+        # Keystrokes are handled at once, their highlighting and statistics are drawn once per frame
+        self.scheduler = FrameScheduler(root_widget)
+        self.scheduler.register("highlight", self.draw_highlight)
+        self.scheduler.register("stats", self.draw_stat)
         self.text.bind("<KeyPress>", func=self.press_event)
         self.text.bind("<Button-1>", func=self.click)
-
-        self.read_from_file(f"{os.path.dirname(os.path.realpath(__file__))}/{self.DEFAULT_TEST_PATH}")
+        # Pasted text is verified as one chunk, see feed_chunk()
+        self.text.bind("<<Paste>>", func=self.paste_event)
+        self.text.bind("<Control-n>", func=lambda event: self.open_corpus_file(1) or "break")
+        self.text.bind("<Control-p>", func=lambda event: self.open_corpus_file(-1) or "break")
+        # Cached viewport sizes are valid until the widget is resized
+        self.text.bind("<Configure>", func=lambda event: self.viewport.invalidate())
+
+        self.read_from_file(file_path or f"{os.path.dirname(os.path.realpath(__file__))}/{self.DEFAULT_TEST_PATH}")
         self.text_setup()
 
         # Setup scrollbar
-        self.scroll_x = Scrollbar(root, orient="horizontal")
+        self.scroll_x = Scrollbar(root_widget, orient="horizontal")
         self.scroll_x.grid(row=1, column=0, sticky="ew")
 
-        self.scroll_y = Scrollbar(root)
+        self.scroll_y = Scrollbar(root_widget)
         self.scroll_y.grid(row=0, column=1, sticky="ns")
 
-        self.text.config(xscrollcommand=self.scroll_x.set, yscrollcommand=self.scroll_y.set)
+        self.text.config(xscrollcommand=self.on_xscroll, yscrollcommand=self.on_yscroll)
         self.text.grid(row=0, column=0, sticky="nsew")
         self.scroll_x.config(command=self.text.xview)
         self.scroll_y.config(command=self.text.yview)
 
-        root.rowconfigure(0, weight=1)
-        root.columnconfigure(0, weight=1)
+        root_widget.rowconfigure(0, weight=1)
+        root_widget.columnconfigure(0, weight=1)
 
         # Setup statistics frame ( Label name + values )
-        self.options_frame = Frame(root, width=const.STAT_FRAME_WIDTH_SYMBOLS)
+        self.options_frame = Frame(root_widget, width=const.STAT_FRAME_WIDTH_SYMBOLS)
         self.options_frame.grid(row=0, column=2, columnspan=1, sticky="nw", padx=self._frame_stat_pad,
                                 pady=self._frame_stat_pad)
 
@@ -82,270 +129,513 @@ class App:
         self.errors_val_label = Label(self.options_frame, width=const.STAT_FRAME_WIDTH_SYMBOLS, anchor="w")
         self.errors_val_label.grid(row=2, column=0, sticky="w")
 
+        self.rolling_val_label = Label(self.options_frame, width=const.STAT_FRAME_WIDTH_SYMBOLS, anchor="w")
+        self.rolling_val_label.grid(row=3, column=0, sticky="w")
+
+        self.latency_val_label = Label(self.options_frame, width=const.STAT_FRAME_WIDTH_SYMBOLS, anchor="w")
+        self.latency_val_label.grid(row=4, column=0, sticky="w")
+
         # Setup text options
         self.label_text_opt = Label(self.options_frame, text="Text options:", font=("TkDefaultFont", 10, "bold"),
                                            pady=self._frame_stat_pad)
-        self.label_text_opt.grid(row=3, column=0, sticky="w")
+        self.label_text_opt.grid(row=5, column=0, sticky="w")
 
         self.checkbox_comments_off = Checkbutton(self.options_frame, text="Hide comments:",
                                                  variable=self.checkbox_value, command=self.checkbox_cmd_off)
-        self.checkbox_comments_off.grid(row=4, column=0, sticky="w")
+        self.checkbox_comments_off.grid(row=6, column=0, sticky="w")
         self.checkbox_value.set(0)
 
+        self.progress_label = Label(self.options_frame, width=const.STAT_FRAME_WIDTH_SYMBOLS, anchor="w")
+        self.progress_label.grid(row=8, column=0, sticky="w")
+
+        # Live keystroke latency, only when tracing
+        self.trace_val_label = None
+        if self.tracer.enabled:
+            self.trace_val_label = Label(self.options_frame, width=const.STAT_FRAME_WIDTH_SYMBOLS, anchor="w")
+            self.trace_val_label.grid(row=7, column=0, sticky="w")
+
         self.upd_stat_gui()
 
+        root_widget.protocol("WM_DELETE_WINDOW", self.close)
+        root_widget.after(const.HISTORY_FLUSH_MS, self.flush_history)
+        if corpus_dir is not None:
+            self.open_corpus(corpus_dir)
+
+    def flush_history(self):
+        self.history.collect(self.txt_stat)
+        self._root.after(const.HISTORY_FLUSH_MS, self.flush_history)
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        self.cancel_loading()
+        self.tracer.save()
+        if self.corpus is not None:
+            self.corpus.close()
+        # Wait for the history writer, it has the last session keystrokes
+        self.history.close(self.txt_stat)
+        self.snapshots.wait()
+        self._root.destroy()
+
     def checkbox_cmd_off(self):
-        self.text_setup()
-        self.upd_stat_gui()
-        self.txt_filter.apply_filter(self.txt_filter.FILTER_COMMENTS, self.checkbox_value.get())
+        # Pending highlighting has the positions of the text before filtering
+        self.scheduler.flush()
+        # Typing progress is kept, the filter moves it to the new text positions
+        restored = self.txt_filter.apply_filter(self.txt_filter.FILTER_COMMENTS, self.checkbox_value.get())
+        # Highlighting of the rest of the text stays, only the returned comments are highlighted
+        self.txt_proc.text_edited(
+            [(Coord(*self.doc.get_coord(start)), Coord(*self.doc.get_coord(end))) for start, end in restored],
+            lambda left, right: self.render_progress(self.doc.get_line_len, left, right))
+        self.text.mark_set("insert", self.get_cursor_index())
+        self.text.see("insert")
+        self.sync_viewport()
+        if self.recorder is not None:
+            self.recorder.filter(self.checkbox_value.get(), self.viewport.shifted_hor, self.viewport.shifted_vert)
+        self.text.focus_set()
 
     def upd_stat_gui(self):
         errors, speed = self.txt_stat
-        self.speed_val_label.configure(text=f"Speed: %d WPM" % speed)
-        self.errors_val_label.configure(text=f"Errors: %d" % errors)
+        self.speed_val_label.configure(text="Speed: %d WPM" % speed)
+        self.errors_val_label.configure(text="Errors: %d" % errors)
+        # Both are kept up to date by Statistics.record(), nothing is recalculated here
+        self.rolling_val_label.configure(
+            text="Last %ds: %d WPM" % (const.ROLLING_WINDOW_SEC, self.txt_stat.rolling_wpm))
+        self.latency_val_label.configure(text="Interval: %d ms" % self.txt_stat.mean_latency_ms)
+        if self.trace_val_label is not None:
+            latency = self.tracer.latency_ms()
+            if latency is not None:
+                self.trace_val_label.configure(text="Lag p50/p99: %.1f/%.1f ms" % latency)
+
+    def draw_highlight(self):
+        with self.tracer.span("upd_window"):
+            self.txt_proc.flush()
+
+    def draw_stat(self):
+        # Statistics are marked dirty by every keystroke, so it's the last job of every frame
+        with self.tracer.span("stats"):
+            self.upd_stat_gui()
+        self.tracer.frame_drawn()
 
     def text_setup(self):
-        self.txt_state_storage.reset()
-        self.text.tag_delete(ALL)
-        self.txt_stat.reset()
+        self.history.finish_session(self.txt_stat)
+        self.history.start_session(self.file_path)
+        self.start_recording()
+        # Engine resets state storage and statistics as well
+        self.txt_engine.reset()
+        self.txt_proc.reset()
         self.text.mark_set("current", "1.0")
         self.text.mark_set("insert", "1.0")
-        self._last_pos: str = self.START_POS
+        self.text.xview_moveto(0)
+        self.text.yview_moveto(0)
+        self.viewport.reset_scroll()
         self.text.config(width=self.max_symbols_per_line)
         self.text.focus_set()
 
+    def start_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        # Large files are not kept in memory, their recordings can't be checked on replay
+        if self.record_dir is None or self.mapped_doc is not None:
+            return
+        from recording import Recorder
+        os.makedirs(self.record_dir, exist_ok=True)
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{os.path.basename(self.file_path)}"
+        # Sessions started in the same second get the numbered names
+        for number in count():
+            path = os.path.join(self.record_dir, f"{name}.rec" if not number else f"{name}.{number}.rec")
+            try:
+                self.recorder = Recorder(path, self.file_path, self.doc.text, bool(self.checkbox_value.get()))
+                break
+            except FileExistsError:
+                continue
+        # Viewport sizes are written to the recording when they are measured
+        self.viewport.invalidate()
+
+    def sync_viewport(self):
+        """ Take the scroll state from the widget after its text was changed not by typing """
+        top_line, left_col = map(int, self.text.index("@0,0").split("."))
+        self.viewport.shifted_vert = top_line - 1
+        self.viewport.shifted_hor = left_col
+
     def click(self, event):
         if event.num == 1:
             self._restore_pos = True
 
+    def get_cursor_index(self) -> str:
+        return f"{self.to_widget_line(self.txt_engine.cursor.line)}.{self.txt_engine.cursor.col}"
+
+    def to_widget_line(self, line: int) -> int:
+        # Widget shows document lines from the txt_proc.first_line only
+        return line - self.txt_proc.first_line + 1
+
     def get_line_len(self, line: int):
-        return len(self.text.get(f"{line}.0", f"{line}.end"))
+        return self.doc.get_line_len(line)
+
+    def set_text(self, text: str):
+        """ Replace the text widget contents and rebuild the document line index """
+        self.text.delete("1.0", END)
+        self.text.insert("1.0", text)
+        self.doc.set_text(text)
 
     def get_line_cnt(self):
-        return len(self.text.get('1.0', "end").split('\n')) - 1
+        return self.doc.line_cnt
 
     def press_event(self, event):
         if not event.char:
             return
+        tracer = self.tracer
+        tracer.key_started()
+        with tracer.span("keystroke"):
+            with tracer.span("normalize"):
+                # Click which moved the cursor away is replayed before the key
+                self.restore_cursor()
+                if self.recorder is not None:
+                    self.recorder.key(event.char, event.keysym)
+
+            line, column = self.txt_engine.cursor
+            with tracer.span("feed"):
+                self.txt_proc.queue(self.txt_engine.feed(event.char))
+            self.scheduler.mark("highlight")
+
+            if self.txt_engine.cursor != (line, column):
+                with tracer.span("scroll"):
+                    self.shift_if_need(column, self.to_widget_line(line),
+                                       self.txt_engine.moved_key(event.char, event.keysym, line))
+                    # Move cursor
+                    self.text.mark_set("insert", self.get_cursor_index())
+                    if self.mapped_doc is not None:
+                        self.follow_cursor()
+
+            self.scheduler.mark("stats")
 
-        # Restore cursor position if user clicked in the text
-        if self._restore_pos:
-            self.text.mark_set("insert", self._last_pos)
-
-        current_pos = self.text.index(INSERT)
-        line = int(current_pos.split(".")[0])
-        column = int(current_pos.split(".")[1])
-
-        # We can use tab instead of space sequence. See const.TAB_SIZE_SYMBOLS
-        if event.char == '\t' and const.TAB_SIZE_SYMBOLS * ' ' == self.text.get(current_pos, f"{current_pos}+4c"):
-            self.text.mark_set("insert", "%d.%d" % (line, column + const.TAB_SIZE_SYMBOLS))
-            column += const.TAB_SIZE_SYMBOLS - 1
-            event.char = ' '
-
-        if event.keysym == "BackSpace":
-            # Go back to the end of previous line
-            if column == 0 and line != 1:
-                self.shift_if_need(column, line, event.keysym)
-                line = line - 1
-                column = self.get_line_len(line)
-                self.text.mark_set("insert", "%d.%d" % (line, column + 1))
-                self._last_pos = self.text.index(INSERT)
-                return "break"
-            # We are at the beginning of the file
-            if column == 0 and line == 1:
-                return "break"
-        else:
-            # Key doesn't matter(except Backspace) if we reach end of line.
-            if self.get_line_len(line) == column:
-                event.keysym = "Return"
+        return "break"
 
-        # Decline "Return" key if we are not on the last character
-        if event.keysym == "Return" and self.get_line_len(line) != column:
-            self._last_pos = self.text.index(INSERT)
+    def paste_event(self, event):
+        try:
+            chars = self._root.clipboard_get()
+        except TclError:
             return "break"
-
-        # Colorize character if the line is not empty
-        if self.get_line_len(line) > 0 and column <= self.get_line_len(line):
-            self.colorize_character(event, line, column)
-
-        self.shift_if_need(column, line, event.keysym)
-
-        n_line = 0
-        n_char = 0
-        if event.keysym == "Return":
-            n_line = 1
-            n_char = 0
-            column = 0
-        elif event.keysym == "BackSpace":
-            n_char = -1
-        else:
-            n_char = 1
-
-        # Move cursor
-        self.text.mark_set("insert", "%d.%d" % (line + n_line, column + n_char))
-        # Save the last position
-        self._last_pos = self.text.index(INSERT)
-
-        # Update statistics
-        if event.keysym == 'space':
-            self.txt_stat.one_word_typed()
-        if event.keysym == 'Return':
-            self.txt_stat.upd_speed()
-        self.upd_stat_gui()
-
+        self.feed_chunk(chars)
         return "break"
 
-    def shift_if_need(self, column, line, event_key: str):
-        symbols_per_curr_line = self.get_line_len(line)
-        visible_symbols_per_line = self.text.winfo_width() // self.get_font_width()
-        visible_lines = self.text.winfo_height() // self.get_font_height()
-
-        # Calculate thresholds for the left, right, top and  bottom sides inside the window
-        right_side_lvl_in_letters = int(math.floor(visible_symbols_per_line *
-                                                   (1 - const.DEFAULT_SHIFT_FOCUS_TRIGGER/100)))
-        left_side_lvl_in_letters = math.ceil(visible_symbols_per_line * const.DEFAULT_SHIFT_FOCUS_TRIGGER/100)
-        bottom_side_lvl_in_lines = int(math.floor(visible_lines *
-                                                  (1 - const.DEFAULT_SHIFT_FOCUS_TRIGGER/100)))
-        top_side_lvl_in_letters = math.ceil(visible_lines * const.DEFAULT_SHIFT_FOCUS_TRIGGER / 100)
-
-        # Top and bottom shifts for the 2 events:
-        # 1 - end of the line when event_key='Enter' to go to the next line.
-        # 2 - Beginning of the line. event_key='Backspace' to go to the prev line.
-        #     Line can be empty!
-        if column == 0 or column == symbols_per_curr_line:
-            win_up_shift = math.floor(self._shifted_symbols_vert + visible_lines / 2 - line)
-
-            self.logger.debug(f"First line: 0\n"
-                             f"-\n"
-                             f"-\n"
-                             f"{self._shifted_symbols_vert} + (can up for {win_up_shift})[\n"
-                             f"...\n"
-                             f"top level   : {top_side_lvl_in_letters}\n"
-                             f"...\n"
-                             f"active line : {line}\n"
-                             f"...\n"
-                             f"bottom level: {bottom_side_lvl_in_lines}\n"
-                             f"...\n"
-                             f"]  {visible_lines + self._shifted_symbols_vert}\n"
-                             f"-\n"
-                             f"Last line: {self.get_line_cnt()} \n\n")
-
-            # Check bottom border
-            if ((line - self._shifted_symbols_vert) >= bottom_side_lvl_in_lines) and \
-                    (self._shifted_symbols_vert + visible_lines < self.get_line_cnt()):
-                win_down_shift = int(line - self._shifted_symbols_vert - visible_lines / 2) % \
-                          (self.get_line_cnt() - visible_lines)
-                self.shift_text_focus(y_symbols=win_down_shift)
-                self._shifted_symbols_vert += win_down_shift
-                self.logger.debug(f"Shifted down {win_down_shift}")
-
-            # Check top border
-            elif self._shifted_symbols_vert >= win_up_shift and\
-                    (line - self._shifted_symbols_vert <= top_side_lvl_in_letters):
-                self._shifted_symbols_vert -= win_up_shift
-                self.shift_text_focus(y_symbols=-win_up_shift)
-                self.logger.debug(f"Shifted top: {win_up_shift}")
-
-        self.logger.debug(f"Start: ... {self._shifted_symbols_hor} ... [ ..{left_side_lvl_in_letters}....{column}"
-                          f"....{right_side_lvl_in_letters}..] {visible_symbols_per_line} ... END "
-                          f"{symbols_per_curr_line}")
-        # Calc right border
-        win_left_shift = math.floor(self._shifted_symbols_hor + visible_lines / 2 - column)
-
-        # Check for special conditions
-
-        # End of line and we type Return
-        if event_key == "Return":
-            self.text.xview_moveto(0)
-            self._shifted_symbols_hor = 0
+    def feed_chunk(self, chars: str):
+        """
+        Many keys at once (paste, stenography or drill tools): the engine verifies
+        the whole chunk, then the view is scrolled and redrawn only once.
+        """
+        if not chars:
             return
+        if self.recorder is not None:
+            self.recorder.chunk(chars)
+        self.restore_cursor()
 
-        # Begin of line and we type BackSpace
-        if event_key == "BackSpace" and column == 0:
-            try:
-                shift = self.get_line_len(line - 1) - left_side_lvl_in_letters
-                if shift > 0:
-                    self.text.xview_moveto(shift / self.max_symbols_per_line)
-                    self._shifted_symbols_hor = shift
-                else:
-                    self._shifted_symbols_hor = 0
-            except():
-                self.logger.warning("Max line in the file iz 0 !")
-            return
+        self.txt_proc.queue(self.txt_engine.feed_chunk(chars))
+        self.scheduler.mark("highlight")
 
-        # Check left and right borders
+        self.measure_viewport()
+        cursor = self.txt_engine.cursor
+        view_shift = self.viewport.jump(cursor.col, self.to_widget_line(cursor.line), self.doc)
+        self.shift_text_focus(x_symbols=view_shift.x_units or None, y_symbols=view_shift.y_units or None)
+        self.text.mark_set("insert", self.get_cursor_index())
+        if self.mapped_doc is not None:
+            self.follow_cursor()
 
-        # Right border
-        if (column - self._shifted_symbols_hor) >= right_side_lvl_in_letters:
-            r_shift = 0
-            # TODO the line below sometime throw an error. After 'try' check error is gone (
-            try:
-                r_shift = math.floor((column - (self._shifted_symbols_hor + visible_symbols_per_line/2)) % symbols_per_curr_line)
-            except:
-                self.logger.warning(self._shifted_symbols_hor, visible_symbols_per_line, column)
-
-            self.shift_text_focus(x_symbols=r_shift)
-            self._shifted_symbols_hor += r_shift
-            self.logger.debug(f"Shifted right {r_shift}")
-
-        # Left border
-        elif (self._shifted_symbols_hor >= 1) and (win_left_shift > 0)\
-                and (column - self._shifted_symbols_hor <= left_side_lvl_in_letters):
-            self._shifted_symbols_hor -= win_left_shift
-            self.shift_text_focus(x_symbols=-win_left_shift)
-            self.logger.debug(f"Shifted left: {win_left_shift}")
-
-    def colorize_character(self, event, line: int, col: int):
-        if event.keysym == "BackSpace":
-            col -= 1
-            if self.txt_state_storage.is_err_on_line(line):
-                self.txt_proc.upd_window(const._INCORRECT, line, col)
-            else:
-                self.txt_proc.upd_window(const._CORRECT, line, col)
-            return
-        else:
-            char_pos = f"{line}.{col}"
+        self.scheduler.mark("stats")
 
-        col += 1
+    def restore_cursor(self):
+        """ Put the cursor back to the typing position if user clicked in the text """
+        if self._restore_pos:
+            self._restore_pos = False
+            self.text.mark_set("insert", self.get_cursor_index())
+            if self.recorder is not None:
+                self.recorder.click()
+
+    def measure_viewport(self):
+        if not self.viewport.valid:
+            self.viewport.resize(self.text.winfo_width() // self.get_font_width(),
+                                 self.text.winfo_height() // self.get_font_height())
+            if self.recorder is not None:
+                self.recorder.resize(self.viewport.visible_cols, self.viewport.visible_rows)
 
-        # Character is correct ?
-        if event.char == self.text.get(char_pos) and not self.txt_state_storage.is_err_on_line(line):
-            self.txt_proc.upd_window(const._CORRECT, line, col)
-            self.txt_stat.upd_speed()
-        else:
-            self.txt_proc.upd_window(const._INCORRECT, line, col)
-            self.txt_stat.upd_err()
+    def shift_if_need(self, column, line, event_key: str):
+        self.measure_viewport()
+        view_shift = self.viewport.shift(column, line, event_key, self.doc)
+        if view_shift.x_moveto is not None:
+            self.text.xview_moveto(view_shift.x_moveto)
+        if view_shift.x_units or view_shift.y_units:
+            self.shift_text_focus(x_symbols=view_shift.x_units or None, y_symbols=view_shift.y_units or None)
 
     def create_menu(self, root_menu):
         menubar = Menu(root_menu)
         root_menu.config(menu=menubar)
         file = Menu(menubar, tearoff=0)
         file.add_command(label="Open file ...", command=self.open_file_dialog)
+        file.add_command(label="Open corpus ...", command=self.open_corpus_dialog)
+        file.add_command(label="Next file", accelerator="Ctrl+N", command=lambda: self.open_corpus_file(1))
+        file.add_command(label="Previous file", accelerator="Ctrl+P", command=lambda: self.open_corpus_file(-1))
+        file.add_separator()
+        file.add_command(label="Drill weak bigrams", command=self.open_drill)
+        file.add_command(label="Keystroke analytics ...", command=self.show_analytics)
         menubar.add_cascade(menu=file, label="File")
 
     def open_file_dialog(self):
+        from tkinter import filedialog
         f_types = [('All files', '*')]
         filename = filedialog.askopenfilename(initialdir=os.path.dirname(os.path.realpath(__file__)),
                                               title="Select file", filetypes=f_types)
         if filename != '':
-            self.read_from_file(filename)
-            self.text_setup()
-            self.checkbox_value.set(0)
-            self.upd_stat_gui()
+            self.load_file(filename)
+
+    def file_opened(self):
+        """ Start the session for the file which was just read into the text widget """
+        self.checkbox_value.set(0)
+        self.text_setup()
+        self.checkbox_comments_off.config(state="disabled" if self.mapped_doc is not None else "normal")
+        self.upd_stat_gui()
+        self.fit_window()
+
+    def fit_window(self):
+        default_font_width = self.get_font_width()
+
+        # If file text doesn't fit to our default window we resize our window
+        # but be aware about padding and widgets align
+        # TODO screen boundaries
+        if default_font_width * self.max_symbols_per_line > (self._root.winfo_width() - self.options_frame.winfo_width()):
+            new_window_width = default_font_width * self.max_symbols_per_line + self.options_frame.winfo_width() + \
+                               self._frame_stat_pad * 2 + self.scroll_y.winfo_width()
+            self._root.geometry(f"{new_window_width}x{self._root.winfo_height()}+"
+                                f"{int((self._root.winfo_screenwidth() - int(new_window_width))/2)}+"
+                                f"{int((self._root.winfo_screenheight()-int(self._root.winfo_height()))/2)}")
+            self.text.config(width=self.max_symbols_per_line)
+            self.logger.debug("New window size: %d x %d", new_window_width, self._root.winfo_height())
+
+    def load_file(self, file_path):
+        """
+        Read the file on the worker thread and insert it into the widget by parts,
+        so the window stays responsive and typing can start with the first lines.
+        """
+        self.cancel_loading()
+        try:
+            stat = os.stat(file_path)
+        except OSError as err:
+            self.logger.warning(f"Can't open {file_path}: {err}")
+            return
+        if stat.st_size >= const.LARGE_FILE_SIZE_BYTES:
+            # Memory mapped file shows only a window of lines, it's fast already
+            self.read_from_file(file_path)
+            self.file_opened()
+            return
+        prepared = self.snapshots.load(file_path, stat)
+        if prepared is not None:
+            self.open_prepared(prepared)
+            return
 
-            default_font_width = self.get_font_width()
+        from loader import FileLoader
+
+        self.file_path = os.path.realpath(file_path)
+        self.close_large_file()
+        self.set_text("")
+        self._inserted_len = 0
+        self.max_symbols_per_line = 1
+        self.txt_filter.check_file_ext(file_path)
+        self._loading_stat = stat
+        self.loader = FileLoader(file_path)
+        self.loader.start()
+        self.file_opened()
+        # Comments filtering needs the whole text
+        self.checkbox_comments_off.config(state="disabled")
+        self.poll_loader(self.loader)
+
+    def poll_loader(self, loader):
+        # Poll of the cancelled or replaced loader is still scheduled, it stops here
+        if loader is not self.loader:
+            return
+        read_all = False
+        while True:
+            try:
+                item = loader.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                read_all = True
+                break
+            if isinstance(item, Exception):
+                self.logger.warning(f"Can't read {loader.file_path}: {item}")
+                # Partly read text must not be saved as the snapshot of the file
+                self._loading_stat = None
+                read_all = True
+                break
+            self.doc.append_text(item)
+
+        # Widget gets whole lines of the document, a limited number of them per call
+        doc = self.doc
+        last_line = doc.get_coord(self._inserted_len)[0] + const.LOAD_INSERT_LINES
+        end = len(doc.text) if read_all and last_line >= doc.line_cnt else doc.get_offset(min(last_line, doc.line_cnt), 0)
+        if end > self._inserted_len:
+            self.text.insert(END, doc.text[self._inserted_len:end])
+            self._inserted_len = end
+        self.max_symbols_per_line = doc.max_line_len + 1
+
+        if read_all and self._inserted_len == len(doc.text):
+            self.loading_finished()
+            return
+        if read_all:
+            # The queue is empty, only the widget insertion is left
+            loader.queue.put(None)
+        self.progress_label.configure(text="Loading: %d%%" % min(99, self._inserted_len * 100 // max(1, loader.size)))
+        self._root.after(const.LOAD_POLL_MS, self.poll_loader, loader)
+
+    def cancel_loading(self):
+        if self.loader is None:
+            return
+        self.loader.cancel()
+        self.loader = None
+        self.progress_label.configure(text="")
+
+    def loading_finished(self):
+        self.loader = None
+        self.progress_label.configure(text="")
+        self.checkbox_comments_off.config(state="normal")
+        if self.recorder is not None:
+            self.recorder.set_text(self.doc.text)
+        self.fit_window()
+        if self._loading_stat is not None:
+            self.save_snapshot(self._loading_stat)
+
+    def save_snapshot(self, stat: os.stat_result):
+        """ The engine keeps typing self.doc, the snapshot is written from its copy """
+        doc = Document()
+        doc.copy_from(self.doc)
+        self.snapshots.save_later(self.file_path, stat, doc)
+
+    def open_corpus_dialog(self):
+        from tkinter import filedialog
+        directory = filedialog.askdirectory(initialdir=os.path.dirname(os.path.realpath(__file__)),
+                                            title="Select corpus directory")
+        if directory:
+            self.open_corpus(directory)
+
+    def open_corpus(self, directory: str):
+        if self.corpus is not None:
+            self.corpus.close()
+        from corpus import Corpus
+        self.corpus = Corpus(directory)
+        self.open_first_corpus_file()
+
+    def open_first_corpus_file(self):
+        # Files are found by the background scan, wait for the first one
+        path = self.corpus.first_path()
+        if path is not None:
+            self.open_corpus_path(path, 1)
+        elif not self.corpus.scanned:
+            self._root.after(100, self.open_first_corpus_file)
+        else:
+            self.logger.warning("No files to type in %s", self.corpus.root)
+
+    def open_corpus_file(self, step: int):
+        if self.corpus is None:
+            return
+        path = self.corpus.next_path(self.file_path, step)
+        if path is not None:
+            self.open_corpus_path(path, step)
 
-            # If file text doesn't fit to our default window we resize our window
-            # but be aware about padding and widgets align
-            # TODO screen boundaries
-            if default_font_width * self.max_symbols_per_line > (self._root.winfo_width() - self.options_frame.winfo_width()):
-                new_window_width = default_font_width * self.max_symbols_per_line + self.options_frame.winfo_width() + \
-                                   self._frame_stat_pad * 2 + self.scroll_y.winfo_width()
-                self._root.geometry(f"{new_window_width}x{self._root.winfo_height()}+"
-                                    f"{int((root.winfo_screenwidth() - int(new_window_width))/2)}+"
-                                    f"{int((root.winfo_screenheight()-int(self._root.winfo_height()))/2)}")
-                self.text.config(width=self.max_symbols_per_line)
-                self.logger.debug(self._root.winfo_height(), new_window_width)
+    def open_corpus_path(self, path: str, step: int):
+        """ Open the corpus file, the ones which can't be read are skipped in the step direction """
+        for _ in range(self.corpus.file_cnt):
+            try:
+                prepared = self.corpus.get(path)
+            except (OSError, UnicodeDecodeError) as err:
+                self.logger.warning(f"{path} is skipped: {err}")
+                path = self.corpus.next_path(path, step)
+                continue
+            self.open_prepared(prepared)
+            return
+        self.logger.warning(f"No readable files in {self.corpus.root}")
+
+    def open_prepared(self, prepared):
+        """ Open the file which was already read, indexed and filtered: by the corpus or from the snapshot """
+        self.cancel_loading()
+        self.show_prepared(prepared)
+        self.file_opened()
+
+    def show_prepared(self, prepared):
+        self.file_path = prepared.path
+        self.close_large_file()
+        self.text.delete("1.0", END)
+        self.text.insert("1.0", prepared.doc.text)
+        self.doc.copy_from(prepared.doc)
+        self.max_symbols_per_line = self.doc.max_line_len + 1
+        self.txt_filter.check_file_ext(prepared.path)
+        if prepared.filtered is not None:
+            self.txt_filter.preload(self.doc, prepared.filtered)
+
+    def open_drill(self):
+        """ Lines of the corpus with the weakest bigrams of the history, in the language of the current file """
+        from drill import DrillIndex, make_drill, weak_bigrams
+        try:
+            index = DrillIndex(const.DRILL_INDEX_PATH)
+        except (OSError, ValueError) as err:
+            from tkinter import messagebox
+            messagebox.showinfo("Drill", f"Index the code to drill on first:\n\npython -m drill build DIR\n\n{err}",
+                                parent=self._root)
+            return
+        # Bigrams of the current session go to the database too, the writer may be still at them
+        self.history.collect(self.txt_stat)
+        ext = os.path.splitext(self.file_path)[1]
+        ext = ext if ext in FileFilters.LEXERS else None
+        try:
+            weights = weak_bigrams(self.history.bigram_stats())
+            text = make_drill(index, weights, ext=ext)
+            if not text and ext is not None:
+                # No code of this language in the index
+                ext = None
+                text = make_drill(index, weights)
+        finally:
+            index.close()
+        if not text:
+            self.logger.warning("Drill index %s has no lines", const.DRILL_INDEX_PATH)
+            return
+        # Drill is opened as a file of its language, so hiding of the comments works the same
+        path = os.path.join(os.path.dirname(const.DRILL_INDEX_PATH), "drill" + (ext or ".txt"))
+        with open(path, "w") as file:
+            file.write(text)
+        self.cancel_loading()
+        self.read_from_file(path)
+        self.file_opened()
+
+    def show_analytics(self):
+        """ Report over the sessions history. It is computed on the thread, large history takes seconds """
+        try:
+            from analytics import HistoryReport
+        except ImportError as err:
+            from tkinter import messagebox
+            messagebox.showwarning("Keystroke analytics", f"Analytics needs NumPy: {err}", parent=self._root)
+            return
+        window = Toplevel(self._root)
+        window.title("Keystroke analytics")
+        report_text = Text(window, wrap="none", font="TkFixedFont", width=60, height=50)
+        report_text.pack(fill="both", expand=True)
+        report_text.insert("1.0", "Analysing the sessions history ...")
+        report_text.config(state="disabled")
+        # Keystrokes of the current session go to the database too
+        self.history.collect(self.txt_stat)
+        worker = HistoryReport(const.HISTORY_DB_PATH)
+        worker.start()
+        self.poll_analytics(report_text, worker)
+
+    def poll_analytics(self, report_text: Text, worker):
+        if not report_text.winfo_exists():
+            return
+        try:
+            report = worker.queue.get_nowait()
+        except queue.Empty:
+            self._root.after(100, self.poll_analytics, report_text, worker)
+            return
+        report_text.config(state="normal")
+        report_text.delete("1.0", END)
+        report_text.insert("1.0", report)
+        report_text.config(state="disabled")
 
     def shift_text_focus(self, x_symbols=None, y_symbols=None):
         if x_symbols is not None:
@@ -353,36 +643,152 @@ class App:
         if y_symbols is not None:
             self.text.yview_scroll(y_symbols, "units")
 
+    def get_text_font(self) -> tkfont.Font:
+        # Font of the text widget is set once when it's created, so it's measured once too
+        if self._text_font is None:
+            self._text_font = tkfont.Font(font=self.text['font'])
+        return self._text_font
+
     def get_font_width(self):
         if self.text:
-            return tkfont.Font(font=self.text['font']).measure('.')
+            return self.get_text_font().measure('.')
         else:
             return 0
 
     def get_font_height(self):
         if self.text:
-            return tkfont.Font(font=self.text['font']).metrics('linespace')
+            return self.get_text_font().metrics('linespace')
+
+    def on_xscroll(self, first, last):
+        self.scroll_x.set(first, last)
+        self.txt_proc.view_changed()
+
+    def on_yscroll(self, first, last):
+        self.scroll_y.set(first, last)
+        self.txt_proc.view_changed()
+        # Large file: move the window of lines if the user scrolled to its border
+        if self.mapped_doc is None or self._window_move_pending:
+            return
+        if float(first) <= 0 and self.txt_proc.first_line > 1:
+            direction = -1
+        elif float(last) >= 1 and self.mapped_doc.has_line(self.txt_proc.last_line + 1):
+            direction = 1
+        else:
+            return
+        self._window_move_pending = True
+        self.text.after_idle(self.scroll_window, direction)
+
+    def scroll_window(self, direction: int):
+        self._window_move_pending = False
+        top_line = self.txt_proc.first_line + int(self.text.index("@0,0").split(".")[0]) - 1
+        self.load_window(max(1, self.txt_proc.first_line + direction * (const.VIRTUAL_WINDOW_LINES // 2)), top_line)
+
+    def follow_cursor(self):
+        """ Move the window of lines if the cursor came too close to its border """
+        line = self.txt_engine.cursor.line
+        if (line - self.txt_proc.first_line < const.VIRTUAL_WINDOW_MARGIN_LINES and self.txt_proc.first_line > 1) or \
+                (self.txt_proc.last_line - line < const.VIRTUAL_WINDOW_MARGIN_LINES and
+                 self.mapped_doc.has_line(self.txt_proc.last_line + 1)):
+            top_line = line - self.viewport.visible_rows // 2
+            self.load_window(max(1, line - const.VIRTUAL_WINDOW_LINES // 2), top_line)
+
+    def load_window(self, first_line: int, top_line: int = None):
+        """ Show VIRTUAL_WINDOW_LINES lines of the large file starting from the 'first_line' """
+        self.scheduler.flush()
+        lines = []
+        line = first_line
+        while len(lines) < const.VIRTUAL_WINDOW_LINES and self.mapped_doc.has_line(line):
+            lines.append(self.mapped_doc.get_line(line))
+            line += 1
+        self.set_text("\n".join(lines))
+        self.txt_proc.set_window(first_line, line - 1)
+
+        # Restore highlighting of the typed lines which are inside the window
+        self.render_progress(self.mapped_doc.get_line_len)
+        self.text.mark_set("insert", self.get_cursor_index())
+
+        if top_line is not None:
+            top_line = max(first_line, min(top_line, line - 1))
+            self.text.yview(f"{self.to_widget_line(top_line)}.0")
+            self.viewport.shifted_vert = top_line - first_line
+
+    def render_progress(self, get_line_len, start: Coord = None, end: Coord = None):
+        """
+        Highlight the typed ranges from the state storage, after the text widget lost them.
+        Only their parts inside of [start, end) if it is given
+        """
+        pos = self.txt_engine.storage.pos
+        for state, borders in ((const._CORRECT, pos.good), (const._INCORRECT, pos.bad)):
+            left = borders.left if start is None else max(borders.left, start)
+            right = borders.right if end is None else min(borders.right, end)
+            self.txt_proc.render_range(state, left, right, get_line_len)
+
+    def open_large_file(self, file_path):
+        self.close_large_file()
+        self.mapped_doc = MappedDocument(file_path)
+        self.txt_engine.set_document(self.mapped_doc)
+        self.load_window(1)
+        self.max_symbols_per_line = self.doc.max_line_len + 1
+        # Comments filtering needs the whole text, so it is not available for the large files
+        self.txt_filter.curr_file_ext = None
+
+    def close_large_file(self):
+        if self.mapped_doc is None:
+            return
+        self.mapped_doc.close()
+        self.mapped_doc = None
+        self.txt_engine.set_document(self.doc)
+        self.txt_proc.set_window(1)
 
     def read_from_file(self, file_path):
+        self.file_path = os.path.realpath(file_path)
         try:
-            with open(file_path) as file:
-                self.text.delete("1.0", END)
-                for line in file:
-                    if len(line) > self.max_symbols_per_line:
-                        self.max_symbols_per_line = len(line)
-                    self.text.insert("end", line.replace('\t', ' ' * const.TAB_SIZE_SYMBOLS))
-                self.txt_filter.check_file_ext(file_path)
+            stat = os.stat(file_path)
+            if stat.st_size >= const.LARGE_FILE_SIZE_BYTES:
+                self.open_large_file(file_path)
+                return
+            prepared = self.snapshots.load(file_path, stat)
+            if prepared is not None:
+                self.show_prepared(prepared)
+                return
+
+            text = read_text(file_path)
+            self.close_large_file()
+            self.set_text(text)
+            # One more symbol for the cursor at the end of the longest line
+            self.max_symbols_per_line = self.doc.max_line_len + 1
+            self.txt_filter.check_file_ext(file_path)
+            self.save_snapshot(stat)
 
         except FileNotFoundError:
-            self.logger.warning(f"Default file {file_path} not found")
+            self.logger.warning(f"File {file_path} not found")
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=const.DEFAULT_WINDOW_TITLE)
+    parser.add_argument("file", nargs="?", help=f"file to type, {App.DEFAULT_TEST_PATH} by default")
+    parser.add_argument("--record", metavar="DIR", help="record every typing session to the directory")
+    parser.add_argument("--trace", metavar="FILE",
+                        help=f"save Chrome trace of the keystroke handling, or set ${const.TRACE_ENV}")
+    parser.add_argument("--corpus", metavar="DIR", help="practice on the source files of the directory tree")
+    parser.add_argument("--renderer", choices=("text", "canvas"), default="text",
+                        help="highlight with the text widget tags or draw the text on a canvas")
+    parser.add_argument("--startup-probe", action="store_true",
+                        help="print 'ready' when the window with the file is drawn and exit, see benchmarks/startup.py")
+    args = parser.parse_args()
+
     root = Tk()
     width, height = const.DEFAULT_WINDOW_WIDTH, const.DEFAULT_WINDOW_HEIGHT
     root.geometry(f"{width}x{height}+{int((root.winfo_screenwidth()-width)/2)}+"
                   f"{int((root.winfo_screenheight()-height)/2)}")
     root.minsize(height=height, width=width)
     root.title(const.DEFAULT_WINDOW_TITLE)
-    app = App(root)
-    root.mainloop()
+    app = App(root, record_dir=args.record, trace_path=args.trace, corpus_dir=args.corpus, file_path=args.file,
+              renderer=args.renderer)
+    if args.startup_probe:
+        root.update()
+        print("ready", flush=True)
+        app.close()
+    else:
+        root.mainloop()
@@ -1,77 +1,99 @@
-from state import StateStorage
-from state_structure import Coord
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, List, Tuple
+
+from engine import TypingEngine
+from state_structure import Coord, RangeDelta
 from constants import Constants as const
 
 
-class TextProcessor:
+class Highlighter(ABC):
+    """
+    Part of the highlighting backends which doesn't depend on how they draw.
+    Line numbers are the document ones, the widget may show only a window
+    of document lines from 'first_line' to 'last_line' (to the end if it's None).
+    """
 
-    def __init__(self, storage: StateStorage, parent):
-        self._storage = storage
-        self._parent = parent
+    def __init__(self, text):
+        self._text = text
+        self.first_line = 1
+        self.last_line = None
+        self._pending: List[RangeDelta] = []
 
-    def upd_window(self, state: str, line_in: int, col_in: int):
-        left, right = self._storage.get_state(state)
-        if state == const._CORRECT:
-            color = const._GOOD_COLOR
-        else:
-            color = const._BAD_COLOR
-            if not self._storage.is_err_on_line(line_in):
-                # First error, use the const.CORRECT pointer as init value for the const.INCORRECT
-                left, right = self._storage.get_state(const._CORRECT)
-                # Check for the case, when full previous line was ok
-                if right.col >= self._parent.get_line_len(right.line):
-                    left.line = right.line = right.line + 1
-                    left.col = right.col = 0
-                else:
-                    left = right
-
-        # Out of the window
-        if line_in == left.line and col_in < left.col:
+    def set_window(self, first_line: int, last_line: int = None):
+        self.first_line = first_line
+        self.last_line = last_line
+
+    def in_window(self, line: int) -> bool:
+        return line >= self.first_line and (self.last_line is None or line <= self.last_line)
+
+    def render(self, deltas: Iterable[RangeDelta]):
+        for delta in deltas:
+            self.upd_window(delta)
+
+    def queue(self, deltas: Iterable[RangeDelta]):
+        self._pending.extend(deltas)
+
+    @abstractmethod
+    def upd_window(self, delta: RangeDelta):
+        """ Draw the delta if its line is in the window """
+
+    def render_range(self, state: str, left: Coord, right: Coord, get_line_len: Callable[[int], int]):
+        """ Highlight [left, right) line by line, line breaks stay without highlighting """
+        first = max(left.line, self.first_line)
+        last = right.line if self.last_line is None else min(right.line, self.last_line)
+        for line in range(first, last + 1):
+            start = left.col if line == left.line else 0
+            end = right.col if line == right.line else get_line_len(line)
+            if end > start:
+                self.upd_window(RangeDelta(state, line, start, end, True))
+
+
+class TextProcessor(Highlighter):
+    """
+    Highlights typed ranges with two tags only. Tags are configured once,
+    so every keystroke costs one tag_add/tag_remove for the changed characters
+    no matter how many lines were already typed.
+    Deltas may be queued and rendered later by flush(), all the keystrokes
+    between two flushes are merged into as few tag calls as possible.
+    """
+    _TAGS = {
+        const._CORRECT: (const._GOOD_TAG, const._GOOD_COLOR),
+        const._INCORRECT: (const._BAD_TAG, const._BAD_COLOR),
+    }
+
+    def __init__(self, text):
+        super().__init__(text)
+        for tag, color in self._TAGS.values():
+            self._text.tag_configure(tag, background=color)
+
+    def reset(self):
+        self._pending.clear()
+        for tag, _ in self._TAGS.values():
+            self._text.tag_remove(tag, "1.0", "end")
+
+    def view_changed(self):
+        """ Widget draws its tags itself wherever it is scrolled """
+
+    def text_edited(self, spans: Iterable[Tuple[Coord, Coord]], render: Callable[[Coord, Coord], None]):
+        """
+        Text of the spans was inserted without tags, the rest of the text keeps its own ones.
+        'render' highlights the typed ranges inside of [left, right)
+        """
+        for left, right in spans:
+            render(left, right)
+
+    def flush(self):
+        if not self._pending:
             return
+        pending, self._pending = self._pending, []
+        self.render(TypingEngine.coalesce(pending))
 
-        # Window continues on the next line
-        if col_in > self._parent.get_line_len(line_in):
-            line_in += 1
-            col_in = 0
-
-        # Try to shrink window
-        if col_in < right.col or line_in < right.line:
-            if line_in < right.line:
-                # Shrink on the PREVIOUS line for ONE letter from the RIGHT
-                saved_borders = self._parent.text.tag_ranges(f"{color}_tag_{line_in}")
-                if not saved_borders:
-                    self._parent.logger.error("No tag:{color}_tag_{line_in}")
-                    return
-                left_border_col = int(saved_borders[0].string.split(".")[1])
-                self._parent.text.tag_remove(f"{color}_tag_{line_in}", f"{line_in}.{col_in}")
-                self._parent.text.tag_configure(f"{color}_tag_{line_in}", background=f"{color}")
-                self._storage.save_state(state, Coord(line_in, left_border_col), Coord(line_in, col_in))
-                return
-            elif line_in == right.line:
-                # Shrink on the same line for ONE letter from the RIGHT
-                self._parent.text.tag_remove(f"{color}_tag_{right.line}", f"{right.line}.{right.col - 1}")
-                self._parent.text.tag_configure(f"{color}_tag_{right.line}", background=f"{color}")
-                self._storage.save_state(state, left, Coord(right.line, right.col - 1))
-                return
-
-        if line_in == right.line:
-            # Just extend window on the SAME line
-            # But the left side can be on another side!
-            # In this case just use for the left border, line from the right border
-            if left.line != right.line:
-                actual_left_line = right.line
-                actual_left_col = 0
-            else:
-                actual_left_line = left.line
-                actual_left_col = left.col
-
-            self._parent.text.tag_add(f"{color}_tag_{right.line}",
-                              f"{actual_left_line}.{actual_left_col}",
-                              f"{right.line}.{col_in}")
-            self._parent.text.tag_configure(f"{color}_tag_{right.line}", background=f"{color}")
-            self._storage.save_state(state, left, Coord(right.line, col_in))
+    def upd_window(self, delta: RangeDelta):
+        if not self.in_window(delta.line):
+            return
+        tag = self._TAGS[delta.state][0]
+        line = delta.line - self.first_line + 1
+        if delta.added:
+            self._text.tag_add(tag, f"{line}.{delta.start}", f"{line}.{delta.end}")
         else:
-            # Extend window on the NEXT line
-            self._parent.text.tag_add(f"{color}_tag_{line_in}", f"{line_in}.0", f"{line_in}.{col_in}")
-            self._parent.text.tag_configure(f"{color}_tag_{line_in}", background=f"{color}")
-            self._storage.save_state(state, left, Coord(line_in, col_in))
+            self._text.tag_remove(tag, f"{line}.{delta.start}", f"{line}.{delta.end}")
@@ -0,0 +1,276 @@
+"""
+Load generator for race_server.py: many simulated typists in races of the given size.
+Every typist types the text with some errors and their corrections and sends its keys
+in batches. Latency is the time from sending a batch to the tick which reported it.
+
+    python -m race_load --typists 5000 --file test.c [--race-size 20] [--wpm 80]
+                        [--batch-ms 200] [--duration 30] [--processes 4] [--spawn --docs tests]
+
+Typists are spread over the processes, keep at least one core for the server.
+
+The run fails (exit status 1) if the server doesn't keep its tick rate: the p99 lag
+of the ticks behind their schedule is over MAX_TICK_LAG_TICKS tick periods or the
+p99 ack latency is over ACK_P99_TICKS. A batch waits for one tick at most, so a
+longer tail means the server or the generator is out of CPU. 5k typists hold it with the server on its own
+core and the typists on --processes others; on a single core they don't.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence
+
+from constants import Constants as const
+from engine import TypingEngine
+from race_server import percentile, raise_open_files_limit
+
+# Ticks may come this many tick periods after their schedule
+MAX_TICK_LAG_TICKS = 1
+# p99 ack latency may be this many tick periods
+ACK_P99_TICKS = 2
+
+
+class Report:
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.tick_intervals: List[float] = []
+        # How late the ticks came, against the earliest one seen by the typist
+        self.tick_lags: List[float] = []
+        self.keys = 0
+        self.connected = 0
+        self.failed = 0
+        self.finished = 0
+        # Error message of the server -> typists it didn't let to join
+        self.refused: Counter = Counter()
+
+    def merge(self, other: "Report"):
+        self.latencies += other.latencies
+        self.tick_intervals += other.tick_intervals
+        self.tick_lags += other.tick_lags
+        self.keys += other.keys
+        self.connected += other.connected
+        self.failed += other.failed
+        self.finished += other.finished
+        self.refused += other.refused
+
+    def print(self, duration: float):
+        print(f"typists {self.connected} connected, {self.failed} failed, {self.finished} finished the text")
+        for message, count in self.refused.most_common():
+            print(f"{count} typists refused: {message}")
+        print(f"keys {self.keys} ({self.keys / duration:.0f}/s)")
+        for name, values in (("ack latency", self.latencies), ("tick interval", self.tick_intervals),
+                             ("tick lag", self.tick_lags)):
+            print(f"{name:>14}: p50 {percentile(values, 0.5) * 1000:7.1f} ms, p99 {percentile(values, 0.99) * 1000:7.1f} ms, "
+                  f"p99.9 {percentile(values, 0.999) * 1000:7.1f} ms, max {max(values, default=0) * 1000:7.1f} ms")
+
+    def failures(self, tick_ms: int) -> List[str]:
+        """ Why the server didn't keep its tick rate, empty if it did """
+        tick_sec = tick_ms / 1000
+        failures = []
+        lag = percentile(self.tick_lags, 0.99)
+        if lag > MAX_TICK_LAG_TICKS * tick_sec:
+            failures.append(f"ticks are late by {lag * 1000:.0f} ms at p99 with the {tick_ms} ms tick")
+        ack = percentile(self.latencies, 0.99)
+        if ack > ACK_P99_TICKS * tick_sec:
+            failures.append(f"ack latency p99 {ack * 1000:.0f} ms is over {ACK_P99_TICKS} ticks")
+        return failures
+
+
+class Typist:
+
+    def __init__(self, number: int, args, report: Report):
+        self.number = number
+        self.args = args
+        self.report = report
+        self.random = random.Random(number)
+        self.player_id = None
+        self.text = ""
+        self.typed = 0
+        # seq -> send time of the batches which are not reported by a tick yet
+        self.unacked = {}
+        # Arrival time of every tick minus its schedule from the server start
+        self.tick_offsets: List[float] = []
+
+    def next_keys(self, count: int) -> str:
+        keys = []
+        while count > 0 and self.typed < len(self.text):
+            if self.random.random() < self.args.error_rate:
+                keys.append("~")
+                keys.append(TypingEngine.BACKSPACE[0])
+                count -= 2
+            keys.append(self.text[self.typed])
+            self.typed += 1
+            count -= 1
+        return "".join(keys)
+
+    async def join(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """ Join the race, False if the server refused it """
+        args = self.args
+        writer.write((json.dumps({"op": "join", "race": f"race{self.number // args.race_size}", "file": args.file,
+                                  "name": f"typist{self.number}"}) + "\n").encode())
+        line = await reader.readline()
+        if not line:
+            raise ConnectionResetError("server closed the connection")
+        reply = json.loads(line)
+        if reply.get("op") != "joined":
+            self.report.refused[str(reply.get("message", reply.get("op")))] += 1
+            return False
+        self.player_id, self.text = reply["id"], reply["text"]
+        return True
+
+    async def run(self, stop_at: float):
+        args = self.args
+        try:
+            reader, writer = await asyncio.open_connection(args.host, args.port, limit=1 << 24)
+        except OSError:
+            self.report.failed += 1
+            return
+        self.report.connected += 1
+        receiver = None
+        try:
+            if not await self.join(reader, writer):
+                self.report.failed += 1
+                return
+            receiver = asyncio.create_task(self.receive(reader))
+            keys_per_sec = args.wpm * 5 / 60
+            batch_sec = args.batch_ms / 1000
+            seq = 0
+            # Typists don't send at the same moments
+            await asyncio.sleep(self.random.random() * batch_sec)
+            while time.monotonic() < stop_at and self.typed < len(self.text):
+                count = max(1, round(keys_per_sec * batch_sec * self.random.uniform(0.7, 1.3)))
+                seq += 1
+                self.unacked[seq] = time.monotonic()
+                chunk = self.next_keys(count)
+                writer.write((json.dumps({"op": "keys", "seq": seq, "chars": chunk}) + "\n").encode())
+                # Fewer keys than asked for are left at the end of the text
+                self.report.keys += len(chunk)
+                await writer.drain()
+                await asyncio.sleep(batch_sec)
+            if self.typed >= len(self.text):
+                self.report.finished += 1
+            # Wait for the last batches to be reported
+            await asyncio.sleep(2 * args.tick_ms / 1000)
+        except (ConnectionError, ValueError):
+            # ValueError is the broken JSON of the join reply
+            self.report.failed += 1
+        finally:
+            if receiver is not None:
+                receiver.cancel()
+            writer.close()
+            if self.tick_offsets:
+                # The earliest tick is taken for the one in time
+                origin = min(self.tick_offsets)
+                self.report.tick_lags += [offset - origin for offset in self.tick_offsets]
+
+    async def receive(self, reader: asyncio.StreamReader):
+        last_tick = last_n = None
+        tick_sec = self.args.tick_ms / 1000
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            if message["op"] != "tick":
+                continue
+            now = time.monotonic()
+            # Races without new keys skip ticks, the interval is taken between the adjacent ones
+            if last_n is not None and message["n"] == last_n + 1:
+                self.report.tick_intervals.append(now - last_tick)
+            last_tick, last_n = now, message["n"]
+            self.tick_offsets.append(now - last_n * tick_sec)
+            for player_id, _, _, _, acked, _ in message["players"]:
+                if player_id == self.player_id:
+                    for seq in [seq for seq in self.unacked if seq <= acked]:
+                        self.report.latencies.append(now - self.unacked.pop(seq))
+
+
+def wait_for_port(host: str, port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"Server on {host}:{port} didn't start")
+
+
+async def run(args, numbers: Sequence[int], report: Report):
+    stop_at = time.monotonic() + args.ramp + args.duration
+    tasks = []
+    # Connections are opened gradually, so the listen backlog doesn't overflow
+    per_step = max(1, len(numbers) * 50 // max(1, int(args.ramp * 1000)))
+    for i, number in enumerate(numbers):
+        tasks.append(asyncio.create_task(Typist(number, args, report).run(stop_at)))
+        if i % per_step == per_step - 1:
+            await asyncio.sleep(0.05)
+    await asyncio.gather(*tasks)
+
+
+def run_typists(args, numbers: Sequence[int]) -> Report:
+    raise_open_files_limit()
+    report = Report()
+    asyncio.run(run(args, numbers, report))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=const.RACE_PORT)
+    parser.add_argument("--file", required=True, help="file to race on, relative to the server documents")
+    parser.add_argument("--typists", type=int, default=5000)
+    parser.add_argument("--race-size", type=int, default=20)
+    parser.add_argument("--wpm", type=float, default=80)
+    parser.add_argument("--error-rate", type=float, default=0.03)
+    parser.add_argument("--batch-ms", type=int, default=200, help="typist sends its keys every batch-ms")
+    parser.add_argument("--tick-ms", type=int, default=const.RACE_TICK_MS, help="tick rate of the server")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of typing after all typists joined")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds to connect all the typists")
+    parser.add_argument("--processes", type=int, default=1, help="typists are spread over the processes")
+    parser.add_argument("--spawn", action="store_true", help="start the server as a subprocess")
+    parser.add_argument("--docs", help="documents directory of the spawned server")
+    args = parser.parse_args()
+
+    raise_open_files_limit()
+    server = None
+    if args.spawn:
+        if not args.docs:
+            parser.error("--spawn needs --docs")
+        server = subprocess.Popen([sys.executable, "-m", "race_server", "--docs", args.docs, "--host", args.host,
+                                   "--port", str(args.port), "--tick-ms", str(args.tick_ms)])
+        wait_for_port(args.host, args.port)
+
+    report = Report()
+    start = time.monotonic()
+    try:
+        if args.processes <= 1:
+            report = run_typists(args, range(args.typists))
+        else:
+            with ProcessPoolExecutor(args.processes) as pool:
+                futures = [pool.submit(run_typists, args, range(i, args.typists, args.processes))
+                           for i in range(args.processes)]
+                for future in futures:
+                    report.merge(future.result())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    report.print(time.monotonic() - start)
+    failures = report.failures(args.tick_ms)
+    for failure in failures:
+        print(f"FAILED: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
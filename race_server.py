@@ -0,0 +1,307 @@
+"""
+Typing races over TCP. Every player has its own headless TypingEngine, so the
+correctness rules are the same as in the Tk App. Players of the same file share
+one Document. Progress is broadcast to the race at a fixed tick rate, only for the
+players which typed something since the previous tick, and every tick is encoded
+once for all the players of the race.
+
+Protocol: one JSON object per line.
+    client  {"op": "join", "race": "r1", "file": "test.c", "name": "alice", "filtered": false}
+            {"op": "keys", "seq": 1, "chars": "int "}
+    server  {"op": "joined", "id": 0, "race": "r1", "text": "..."}
+            {"op": "player", "id": 1, "name": "bob"}
+            {"op": "tick", "n": 12, "players": [[id, progress permille, wpm, errors, last seq, finished], ...]}
+            {"op": "left", "id": 1}
+            {"op": "error", "message": "..."}
+
+    python -m race_server --docs tests [--host 127.0.0.1] [--port 8765] [--tick-ms 250]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os.path
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from constants import Constants as const
+from document import Document, read_text
+from engine import TypingEngine
+from file_operations import FileFilters
+from recording import text_digest
+from statistics import Statistics
+
+
+def raise_open_files_limit():
+    """ Every player is a socket, the default soft limit is often 1024 """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class DocumentStore:
+    """ Files under the root directory. The same text is one Document however many races type it """
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        # (path, filtered) -> (mtime, size, document)
+        self._by_file: Dict[Tuple[str, bool], Tuple[int, int, Document]] = {}
+        self._by_digest: Dict[bytes, Document] = {}
+
+    def resolve(self, name: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"{name} is outside of the documents directory")
+        return path
+
+    def get(self, path: str, filtered: bool = False) -> Document:
+        """ Blocking, call it from the executor """
+        stat = os.stat(path)
+        cached = self._by_file.get((path, filtered))
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        text = read_text(path)
+        lexer = FileFilters.LEXERS.get(os.path.splitext(path)[1])
+        if filtered and lexer is not None:
+            text = FileFilters.strip_comments(text, lexer).text
+        digest = text_digest(text)
+        doc = self._by_digest.get(digest)
+        if doc is None:
+            doc = self._by_digest[digest] = Document(text)
+        self._by_file[(path, filtered)] = (stat.st_mtime_ns, stat.st_size, doc)
+        return doc
+
+
+class Player:
+    __slots__ = ("id", "name", "race", "engine", "writer", "seq", "dirty", "finished")
+
+    def __init__(self, player_id: int, name: str, race: "Race", writer: asyncio.StreamWriter):
+        self.id = player_id
+        self.name = name
+        self.race = race
+        self.engine = TypingEngine(Statistics(const.RACE_KEYSTROKE_LOG_SIZE), race.doc)
+        self.writer = writer
+        self.seq = 0
+        self.dirty = False
+        self.finished = False
+
+    def feed(self, chars: str, seq: int):
+        self.engine.feed_chunk(chars)
+        self.seq = seq
+        self.dirty = True
+        self.race.dirty = True
+        if not self.finished and self.engine.storage.pos.good.right == self.race.end:
+            self.finished = True
+
+    def state(self) -> list:
+        good_right = self.engine.storage.pos.good.right
+        doc = self.race.doc
+        progress = doc.get_offset(good_right.line, good_right.col) * 1000 // max(1, len(doc.text))
+        stat = self.engine.stat
+        return [self.id, progress, int(stat.speed_wpm), stat.errors, self.seq, self.finished]
+
+
+class Race:
+
+    def __init__(self, name: str, doc: Document):
+        self.name = name
+        self.doc = doc
+        self.end = (doc.line_cnt, doc.get_line_len(doc.line_cnt))
+        self.players: Dict[int, Player] = {}
+        self.dirty = False
+        self._next_id = 0
+
+    def new_player_id(self) -> int:
+        self._next_id += 1
+        return self._next_id - 1
+
+
+class RaceServer:
+
+    def __init__(self, docs_dir: str, tick_ms: int = const.RACE_TICK_MS):
+        self.docs = DocumentStore(docs_dir)
+        self.tick_sec = tick_ms / 1000
+        self.races: Dict[str, Race] = {}
+        self.logger = logging.getLogger(__name__)
+        self.players = 0
+        self.key_messages = 0
+        # Number of the last tick, the n-th one is due n tick periods after the start
+        self.ticks = 0
+        # Recent handling times of the keys messages and of the ticks, for the periodic report
+        self.handle_ns = deque(maxlen=100000)
+        self.tick_ns = deque(maxlen=1000)
+
+    async def serve(self, host: str, port: int):
+        raise_open_files_limit()
+        server = await asyncio.start_server(self.handle_client, host, port, backlog=4096)
+        self.logger.info("Serving races on %s:%d, documents from %s", host, port, self.docs.root)
+        ticker = asyncio.create_task(self.tick_loop())
+        reporter = asyncio.create_task(self.report_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            ticker.cancel()
+            reporter.cancel()
+
+    @staticmethod
+    def encode(message: dict) -> bytes:
+        return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+    def send(self, player: Player, data: bytes):
+        if player.writer.transport.is_closing():
+            return
+        # Slow reader must not make the server buffer without limit, it is disconnected
+        if player.writer.transport.get_write_buffer_size() > const.RACE_MAX_CLIENT_BUFFER:
+            self.logger.warning("Player %s of %s is too slow, disconnected", player.name, player.race.name)
+            player.writer.transport.abort()
+            return
+        player.writer.write(data)
+
+    @staticmethod
+    async def read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+        """ Next message line, b"" at the end. None for the line over the reader limit, it is skipped """
+        too_long = False
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+                return None if too_long else line
+            except asyncio.IncompleteReadError as err:
+                return b"" if too_long else err.partial
+            except asyncio.LimitOverrunError as err:
+                too_long = True
+                # Drop what is before the line break, the next readuntil takes the line break itself
+                await reader.readexactly(err.consumed)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        player: Optional[Player] = None
+        try:
+            while True:
+                line = await self.read_line(reader)
+                if line is None:
+                    writer.write(self.encode({"op": "error", "message": "message is too long"}))
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    op = message["op"]
+                    if op == "keys" and player is not None:
+                        chars, seq = message["chars"], message.get("seq", player.seq)
+                        if not isinstance(chars, str) or not isinstance(seq, int):
+                            raise TypeError("chars must be a string and seq an integer")
+                        start = time.perf_counter_ns()
+                        player.feed(chars, seq)
+                        self.key_messages += 1
+                        self.handle_ns.append(time.perf_counter_ns() - start)
+                    elif op == "join" and player is None:
+                        player = await self.join(message, writer)
+                    else:
+                        raise ValueError(f"unexpected {op}")
+                except (ValueError, KeyError, TypeError, OSError) as err:
+                    writer.write(self.encode({"op": "error", "message": str(err)}))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if player is not None:
+                self.leave(player)
+            writer.close()
+
+    async def join(self, message: dict, writer: asyncio.StreamWriter) -> Player:
+        race_name = str(message["race"])
+        race = self.races.get(race_name)
+        if race is None:
+            path = self.docs.resolve(message["file"])
+            doc = await asyncio.get_running_loop().run_in_executor(
+                None, self.docs.get, path, bool(message.get("filtered", False)))
+            # Another player could create it while the file was read
+            race = self.races.setdefault(race_name, Race(race_name, doc))
+
+        player = Player(race.new_player_id(), str(message.get("name", "")), race, writer)
+        writer.write(self.encode({"op": "joined", "id": player.id, "race": race.name, "text": race.doc.text}))
+        for other in race.players.values():
+            writer.write(self.encode({"op": "player", "id": other.id, "name": other.name}))
+        announce = self.encode({"op": "player", "id": player.id, "name": player.name})
+        for other in race.players.values():
+            self.send(other, announce)
+        race.players[player.id] = player
+        self.players += 1
+        return player
+
+    def leave(self, player: Player):
+        race = player.race
+        race.players.pop(player.id, None)
+        self.players -= 1
+        if not race.players:
+            del self.races[race.name]
+            return
+        data = self.encode({"op": "left", "id": player.id})
+        for other in race.players.values():
+            self.send(other, data)
+
+    async def tick_loop(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick_sec
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            start = time.perf_counter_ns()
+            self.tick()
+            self.tick_ns.append(time.perf_counter_ns() - start)
+
+    def tick(self):
+        self.ticks += 1
+        for race in list(self.races.values()):
+            if not race.dirty:
+                continue
+            race.dirty = False
+            changed = []
+            for player in race.players.values():
+                if player.dirty:
+                    player.dirty = False
+                    changed.append(player.state())
+            data = self.encode({"op": "tick", "n": self.ticks, "players": changed})
+            for player in list(race.players.values()):
+                self.send(player, data)
+
+    async def report_loop(self, period_sec: float = 10):
+        last_messages = 0
+        while True:
+            await asyncio.sleep(period_sec)
+            self.logger.info("%d players in %d races, %.0f keys messages/s, handling p99 %.0f us, tick p99 %.1f ms",
+                             self.players, len(self.races), (self.key_messages - last_messages) / period_sec,
+                             percentile(self.handle_ns, 0.99) / 1000, percentile(self.tick_ns, 0.99) / 1e6)
+            last_messages = self.key_messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", required=True, help="directory of the files to race on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=const.RACE_PORT)
+    parser.add_argument("--tick-ms", type=int, default=const.RACE_TICK_MS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    try:
+        asyncio.run(RaceServer(args.docs, args.tick_ms).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
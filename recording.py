@@ -0,0 +1,287 @@
+"""
+Compact binary recording of a typing session and its deterministic replay.
+
+File layout: MAGIC, header (source file path, digest of the prepared text,
+comments filter state) and then append-only events. Every event starts with
+varint((time delta in us << 3) | kind), payload depends on the kind.
+Replay goes through the same TypingEngine, Viewport and FileFilters code
+as the Tk App, so correctness and scrolling decisions are reproduced exactly.
+
+    python -m recording session.rec [--source FILE] [--realtime]
+"""
+
+import argparse
+import hashlib
+import os.path
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from document import Document, read_text
+from engine import TypingEngine
+from file_operations import FileFilters
+from viewport import Viewport, ViewShift
+
+MAGIC = b"TCR\x02"
+# Filter events of the first version have no scroll position
+MAGIC_V1 = b"TCR\x01"
+
+KIND_KEY = 0
+KIND_CLICK = 1
+KIND_RESIZE = 2
+KIND_FILTER = 3
+KIND_KEYSYM = 4
+KIND_CHUNK = 5
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode(errors="surrogatepass"), digest_size=16).digest()
+
+
+def write_varint(buf: bytearray, value: int):
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def read_varint(stream: BinaryIO) -> Optional[int]:
+    """ None at the end of the stream """
+    value = shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            return None
+        value |= (byte[0] & 0x7f) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def read_string(stream: BinaryIO) -> str:
+    return stream.read(read_varint(stream)).decode()
+
+
+@dataclass
+class Header:
+    source: str
+    digest: bytes
+    filtered: bool
+
+
+@dataclass
+class Event:
+    time_us: int
+    kind: int
+    char: str = ""
+    # Keys of the KIND_CHUNK event
+    chars: str = ""
+    keysym: str = ""
+    cols: int = 0
+    rows: int = 0
+    value: int = 0
+    # Scroll position (columns, rows) the App had after the filter was toggled
+    scroll: Optional[Tuple[int, int]] = None
+
+
+class Recorder:
+    """
+    Writes the header of one session and then only appends its events.
+    Existing recording is never overwritten: FileExistsError is raised for its path
+    """
+    FLUSH_BYTES = 4096
+
+    def __init__(self, path: str, source: str, text: str, filtered: bool = False):
+        self._file = open(path, "xb")
+        self._buf = bytearray(MAGIC)
+        self._add_string(source)
+        self._digest_pos = len(self._buf)
+        self._buf += text_digest(text)
+        self._buf.append(int(filtered))
+        self._last_ns = time.perf_counter_ns()
+        # Key symbols are written once, then referenced by their number
+        self._keysyms = {}
+
+    def _add_string(self, value: str):
+        data = value.encode()
+        write_varint(self._buf, len(data))
+        self._buf += data
+
+    def _event(self, kind: int):
+        now = time.perf_counter_ns()
+        write_varint(self._buf, ((now - self._last_ns) // 1000) << 3 | kind)
+        self._last_ns = now
+
+    def key(self, char: str, keysym: str):
+        keysym_id = self._keysyms.get(keysym)
+        if keysym_id is None:
+            keysym_id = self._keysyms[keysym] = len(self._keysyms)
+            self._event(KIND_KEYSYM)
+            self._add_string(keysym)
+        self._event(KIND_KEY)
+        write_varint(self._buf, ord(char))
+        write_varint(self._buf, keysym_id)
+        if len(self._buf) >= self.FLUSH_BYTES:
+            self.flush()
+
+    def chunk(self, chars: str):
+        self._event(KIND_CHUNK)
+        self._add_string(chars)
+        if len(self._buf) >= self.FLUSH_BYTES:
+            self.flush()
+
+    def click(self):
+        self._event(KIND_CLICK)
+
+    def resize(self, cols: int, rows: int):
+        self._event(KIND_RESIZE)
+        write_varint(self._buf, cols)
+        write_varint(self._buf, rows)
+
+    def filter(self, value: int, shifted_hor: int, shifted_vert: int):
+        """ The App takes its scroll position from the widget after the toggle, it is written as well """
+        self._event(KIND_FILTER)
+        self._buf.append(value)
+        write_varint(self._buf, shifted_hor)
+        write_varint(self._buf, shifted_vert)
+
+    def set_text(self, text: str):
+        """ Text became known completely after the session started, e.g. the file was loaded in background """
+        self.flush()
+        self._file.seek(self._digest_pos)
+        self._file.write(text_digest(text))
+        self._file.seek(0, os.SEEK_END)
+
+    def flush(self):
+        self._file.write(self._buf)
+        self._file.flush()
+        self._buf.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def read_recording(path: str) -> Tuple[Header, Iterator[Event]]:
+    stream = open(path, "rb")
+    magic = stream.read(len(MAGIC))
+    if magic not in (MAGIC, MAGIC_V1):
+        stream.close()
+        raise ValueError(f"{path} is not a typing recording")
+    header = Header(read_string(stream), stream.read(16), bool(stream.read(1)[0]))
+
+    def events() -> Iterator[Event]:
+        keysyms: List[str] = []
+        time_us = 0
+        with stream:
+            while True:
+                head = read_varint(stream)
+                if head is None:
+                    return
+                time_us += head >> 3
+                kind = head & 0x7
+                if kind == KIND_KEYSYM:
+                    keysyms.append(read_string(stream))
+                elif kind == KIND_KEY:
+                    char = chr(read_varint(stream))
+                    yield Event(time_us, kind, char=char, keysym=keysyms[read_varint(stream)])
+                elif kind == KIND_RESIZE:
+                    cols = read_varint(stream)
+                    yield Event(time_us, kind, cols=cols, rows=read_varint(stream))
+                elif kind == KIND_FILTER:
+                    value = stream.read(1)[0]
+                    scroll = None
+                    if magic != MAGIC_V1:
+                        shifted_hor = read_varint(stream)
+                        scroll = (shifted_hor, read_varint(stream))
+                    yield Event(time_us, kind, value=value, scroll=scroll)
+                elif kind == KIND_CHUNK:
+                    yield Event(time_us, kind, chars=read_string(stream))
+                else:
+                    yield Event(time_us, kind)
+
+    return header, events()
+
+
+class Replayer:
+    """
+    Headless session: it has the same doc/txt_engine/viewport parts as the App,
+    so FileFilters work with it as with the App (without the text widget).
+    """
+    text = None
+
+    def __init__(self, path: str, source: str = None):
+        self.header, self._events = read_recording(path)
+        source = source or self.header.source
+        self.doc = Document(read_text(source))
+        if text_digest(self.doc.text) != self.header.digest:
+            raise ValueError(f"{source} is not the file which was recorded")
+        self.txt_engine = TypingEngine(doc=self.doc)
+        self.viewport = Viewport()
+        self.txt_filter = FileFilters(self)
+        self.txt_filter.check_file_ext(source)
+        if self.header.filtered:
+            self.txt_filter.apply_filter(FileFilters.FILTER_COMMENTS, 1)
+        self.keys = 0
+
+    def run(self, realtime: bool = False, on_key: Callable[[Event, ViewShift], None] = None):
+        start = time.perf_counter()
+        for event in self._events:
+            if realtime:
+                delay = event.time_us / 1e6 - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            if event.kind == KIND_KEY:
+                view_shift = self.press(event.char, event.keysym)
+                if on_key is not None:
+                    on_key(event, view_shift)
+            elif event.kind == KIND_CHUNK:
+                view_shift = self.press_chunk(event.chars)
+                if on_key is not None:
+                    on_key(event, view_shift)
+            elif event.kind == KIND_RESIZE:
+                self.viewport.resize(event.cols, event.rows)
+            elif event.kind == KIND_FILTER:
+                self.txt_filter.apply_filter(FileFilters.FILTER_COMMENTS, event.value)
+                if event.scroll is not None:
+                    self.viewport.shifted_hor, self.viewport.shifted_vert = event.scroll
+
+    def press(self, char: str, keysym: str) -> Optional[ViewShift]:
+        """ The same steps as App.press_event does without rendering """
+        line, column = self.txt_engine.cursor
+        self.txt_engine.feed(char)
+        self.keys += 1
+        if self.txt_engine.cursor == (line, column):
+            return None
+        return self.viewport.shift(column, line, self.txt_engine.moved_key(char, keysym, line), self.doc)
+
+    def press_chunk(self, chars: str) -> ViewShift:
+        """ The same steps as App.feed_chunk does without rendering """
+        self.txt_engine.feed_chunk(chars)
+        self.keys += len(chars)
+        cursor = self.txt_engine.cursor
+        return self.viewport.jump(cursor.col, cursor.line, self.doc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording")
+    parser.add_argument("--source", help="use this file instead of the recorded path")
+    parser.add_argument("--realtime", action="store_true", help="keep the recorded timing")
+    args = parser.parse_args()
+
+    replayer = Replayer(args.recording, args.source)
+    start = time.perf_counter()
+    replayer.run(args.realtime)
+    elapsed = time.perf_counter() - start
+
+    stat = replayer.txt_engine.stat
+    print(f"{os.path.basename(args.recording)}: {replayer.keys} keys in {elapsed:.3f}s "
+          f"({replayer.keys / elapsed if elapsed else 0:.0f} keys/s)")
+    print(f"cursor {tuple(replayer.txt_engine.cursor)}, errors {stat.errors}, "
+          f"scroll {replayer.viewport.shifted_hor}x{replayer.viewport.shifted_vert}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import time
+from typing import Callable, Dict, Set
+
+from constants import Constants as const
+
+
+class FrameScheduler:
+    """
+    Runs the registered redraw jobs at most once per frame. Input handlers only
+    mark jobs dirty, so a burst of keystrokes between two frames costs one redraw.
+    The first key after a pause is drawn right away, the next frame waits for its turn.
+    """
+
+    def __init__(self, widget, frame_ms: int = const.FRAME_MS):
+        self._widget = widget
+        self.frame_ms = frame_ms
+        # Jobs run in the registration order
+        self._jobs: Dict[str, Callable[[], None]] = {}
+        self._dirty: Set[str] = set()
+        self._after_id = None
+        self._last_frame = 0.0
+        self.frames = 0
+
+    def register(self, name: str, callback: Callable[[], None]):
+        self._jobs[name] = callback
+
+    def mark(self, name: str):
+        self._dirty.add(name)
+        if self._after_id is None:
+            delay_ms = self.frame_ms - (time.perf_counter() - self._last_frame) * 1000
+            self._after_id = self._widget.after(max(0, int(delay_ms)), self._on_frame)
+
+    def _on_frame(self):
+        self._after_id = None
+        self.flush()
+
+    def flush(self):
+        """ Run the dirty jobs now, e.g. before the text widget is changed not by typing """
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+            self._after_id = None
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        for name, callback in self._jobs.items():
+            if name in dirty:
+                callback()
+        self._last_frame = time.perf_counter()
+        self.frames += 1
+
+    def cancel(self):
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+            self._after_id = None
+        self._dirty.clear()
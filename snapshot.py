@@ -0,0 +1,186 @@
+"""
+On-disk cache of the prepared documents, so the file which was already practised
+is opened without expanding its tabs, indexing its lines and stripping its comments again.
+
+Snapshot is one file per document, read with one read() call:
+
+    header      magic, mtime and size of the document file, tab size, line count,
+                max line length, filtered line count and lengths of the parts below
+    path        real path of the document, UTF-8
+    text        tab-expanded text, UTF-8
+    line_len    array('I') of the line index
+    line_start  array('I') of the line index
+    filtered    text without comments, UTF-8, and its OffsetMap arrays, only if the language has a filter
+
+Removed comments are not stored, they are sliced from the text by the offsets.
+Snapshot is used only while mtime and size of the file are the same, and it is
+written by a background thread after the file was opened the usual way.
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import threading
+from array import array
+from typing import Optional
+
+from constants import Constants as const
+from corpus import CorpusEntry, PreparedDocument, language_of
+from document import Document
+from file_operations import FileFilters, FilteredText, OffsetMap
+
+_MAGIC = b"TCSNAP01"
+# magic, mtime_ns, size, tab size, line count, max line length, filtered line count (0 - no filter),
+# path bytes, text bytes, filtered text bytes, filtered segments
+_HEADER = struct.Struct("<8sqqIIIIIQQI")
+_INDEX_ITEM = array('I').itemsize
+
+
+def dump(prepared: PreparedDocument, mtime_ns: int, size: int) -> bytes:
+    doc, filtered = prepared.doc, prepared.filtered
+    path = prepared.path.encode(errors="surrogatepass")
+    text = doc.text.encode(errors="surrogatepass")
+    parts = [b"", path, text, doc.line_len.tobytes(), doc.line_start.tobytes()]
+    filtered_text = b""
+    segments = 0
+    if filtered is not None:
+        filtered_text = filtered.text.encode(errors="surrogatepass")
+        segments = len(filtered.offsets.filtered_start)
+        parts += [filtered_text, filtered.offsets.filtered_start.tobytes(), filtered.offsets.original_start.tobytes()]
+    parts[0] = _HEADER.pack(_MAGIC, mtime_ns, size, const.TAB_SIZE_SYMBOLS, doc.line_cnt, doc.max_line_len,
+                            prepared.entry.filtered_line_cnt or 0, len(path), len(text), len(filtered_text), segments)
+    return b"".join(parts)
+
+
+def parse(data: bytes, mtime_ns: int, size: int) -> Optional[PreparedDocument]:
+    """ Prepared document of the snapshot, None if it is not of this version of the file """
+    if len(data) < _HEADER.size:
+        return None
+    magic, snap_mtime_ns, snap_size, tab_size, line_cnt, max_line_len, filtered_line_cnt, path_len, text_len, \
+        filtered_len, segments = _HEADER.unpack_from(data)
+    if magic != _MAGIC or (snap_mtime_ns, snap_size, tab_size) != (mtime_ns, size, const.TAB_SIZE_SYMBOLS):
+        return None
+
+    view = memoryview(data)
+    pos = _HEADER.size
+
+    def take(length: int) -> memoryview:
+        nonlocal pos
+        pos += length
+        if pos > len(view):
+            raise ValueError("snapshot is truncated")
+        return view[pos - length:pos]
+
+    def take_index(count: int) -> array:
+        items = array('I')
+        items.frombytes(take(count * _INDEX_ITEM))
+        return items
+
+    path = str(take(path_len), "utf-8", "surrogatepass")
+    doc = Document()
+    doc.text = str(take(text_len), "utf-8", "surrogatepass")
+    doc.line_len = take_index(line_cnt)
+    doc.line_start = take_index(line_cnt)
+    doc.line_cnt = line_cnt
+    doc.max_line_len = max_line_len
+
+    filtered = None
+    if filtered_line_cnt:
+        offsets = OffsetMap()
+        filtered_text = str(take(filtered_len), "utf-8", "surrogatepass")
+        offsets.filtered_start = take_index(segments)
+        offsets.original_start = take_index(segments)
+        # Removed piece i is between the end of the kept segment i and the start of the next one
+        filtered_start, original_start = offsets.filtered_start, offsets.original_start
+        removed = [doc.text[original_start[i] + filtered_start[i + 1] - filtered_start[i]:original_start[i + 1]]
+                   for i in range(segments - 1)]
+        filtered = FilteredText(filtered_text, offsets, removed)
+
+    entry = CorpusEntry(path, size, line_cnt, max_line_len, language_of(path), filtered_line_cnt or None)
+    return PreparedDocument(entry, doc, filtered)
+
+
+class SnapshotCache:
+    """ Snapshots are removed oldest first when the directory grows over max_bytes """
+
+    def __init__(self, directory: str = const.SNAPSHOT_DIR, max_bytes: int = const.SNAPSHOT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self._writers = []
+
+    def snapshot_path(self, path: str) -> str:
+        name = hashlib.blake2b(os.path.realpath(path).encode(errors="surrogatepass"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, name + ".snap")
+
+    def load(self, path: str, stat: os.stat_result = None) -> Optional[PreparedDocument]:
+        try:
+            stat = stat or os.stat(path)
+            with open(self.snapshot_path(path), "rb") as file:
+                data = file.read()
+            prepared = parse(data, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as err:
+            self.logger.warning("Snapshot of %s is not used: %s", path, err)
+            return None
+        if prepared is not None and prepared.path != os.path.realpath(path):
+            return None
+        return prepared
+
+    def save(self, prepared: PreparedDocument, stat: os.stat_result):
+        """ The stat must be taken before the file was read, so a newer file never gets an older snapshot """
+        snapshot_path = self.snapshot_path(prepared.path)
+        temp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "wb") as file:
+                file.write(dump(prepared, stat.st_mtime_ns, stat.st_size))
+            os.replace(temp_path, snapshot_path)
+            self.prune()
+        except OSError as err:
+            self.logger.warning("Snapshot of %s is not saved: %s", prepared.path, err)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def save_later(self, path: str, stat: os.stat_result, doc: Document):
+        """
+        Strip the comments and save the snapshot on the thread. The doc must not be changed
+        afterwards, pass a copy of the one which is typed. The thread is not a daemon,
+        so the snapshot is finished even if the window is closed at once.
+        """
+        self._writers = [writer for writer in self._writers if writer.is_alive()]
+        writer = threading.Thread(target=self._prepare_and_save, args=(os.path.realpath(path), stat, doc),
+                                  name="snapshot")
+        self._writers.append(writer)
+        writer.start()
+
+    def _prepare_and_save(self, path: str, stat: os.stat_result, doc: Document):
+        lexer = FileFilters.LEXERS.get(os.path.splitext(path)[1])
+        filtered = FileFilters.strip_comments(doc.text, lexer) if lexer is not None else None
+        entry = CorpusEntry(path, stat.st_size, doc.line_cnt, doc.max_line_len, language_of(path),
+                            filtered.text.count("\n") + 1 if filtered is not None else None)
+        self.save(PreparedDocument(entry, doc, filtered), stat)
+
+    def wait(self):
+        for writer in self._writers:
+            writer.join()
+        self._writers.clear()
+
+    def prune(self):
+        snapshots = []
+        with os.scandir(self.directory) as entries:
+            for item in entries:
+                if item.name.endswith(".snap"):
+                    stat = item.stat()
+                    snapshots.append((stat.st_mtime, stat.st_size, item.path))
+        used = sum(size for _, size, _ in snapshots)
+        # The newest one is kept even if it alone is larger than the limit
+        for _, size, path in sorted(snapshots)[:-1]:
+            if used <= self.max_bytes:
+                break
+            os.remove(path)
+            used -= size
@@ -1,27 +1,72 @@
+from bisect import bisect_left, bisect_right
 from constants import Constants as const
-import copy
-from typing import Literal
+from typing import Iterable, Iterator, List, Literal, Tuple
 from state_structure import State, RangeBorders, Coord
 
 
+class ErrorIndex:
+    """
+    Sorted spans of every error made in the session. Each span is on one line,
+    neighbour errors typed one after another are merged into the same span.
+    """
+
+    def __init__(self):
+        self._starts: List[Coord] = []
+        self._ends: List[Coord] = []
+
+    def __len__(self):
+        return len(self._starts)
+
+    def clear(self):
+        self._starts.clear()
+        self._ends.clear()
+
+    def add(self, line: int, start: int, end: int):
+        left, right = Coord(line, start), Coord(line, end)
+        i = bisect_right(self._starts, left)
+        # Typing goes forward, so usually it is the continuation of the last span
+        if i and self._starts[i - 1].line == line and self._starts[i - 1] <= left <= self._ends[i - 1]:
+            self._ends[i - 1] = max(self._ends[i - 1], right)
+            return
+        self._starts.insert(i, left)
+        self._ends.insert(i, right)
+
+    def has_line(self, line: int) -> bool:
+        i = bisect_left(self._starts, Coord(line, 0))
+        return i < len(self._starts) and self._starts[i].line == line
+
+    def on_line(self, line: int) -> Iterator[Tuple[Coord, Coord]]:
+        i = bisect_left(self._starts, Coord(line, 0))
+        while i < len(self._starts) and self._starts[i].line == line:
+            yield self._starts[i], self._ends[i]
+            i += 1
+
+    def __iter__(self) -> Iterator[Tuple[Coord, Coord]]:
+        return zip(self._starts, self._ends)
+
+
 class StateStorage:
+    """
+    Good range is the correctly typed prefix of the text, bad range always
+    starts where the good one ends and finishes at the cursor.
+    Coordinates are immutable, so the borders are returned without copies.
+    """
 
     def __init__(self):
         self.pos = State(
             good=RangeBorders(left=Coord(line=1, col=0), right=Coord(line=1, col=0)),
             bad=RangeBorders(left=Coord(line=1, col=0), right=Coord(line=1, col=0))
         )
+        self.errors = ErrorIndex()
 
     def reset(self):
         self.pos.good.left = self.pos.good.right = Coord(line=1, col=0)
         self.pos.bad.left = self.pos.bad.right = Coord(line=1, col=0)
+        self.errors.clear()
 
     def save_state(self, st_name: Literal[const._CORRECT, const._INCORRECT], left: Coord, right: Coord):
         if st_name == const._INCORRECT:
-            # We always update right border. But left border we can update only
-            # if we are on the same line with right border
-            if (self.pos.bad.left.line == self.pos.bad.right.line) or self.pos.bad.left.line == right.line:
-                self.pos.bad.left = left
+            self.pos.bad.left = left
             self.pos.bad.right = right
         elif st_name == const._CORRECT:
             self.pos.good.left = left
@@ -29,26 +74,41 @@ class StateStorage:
 
     def get_state(self, st_name) -> [Coord, Coord]:
         if st_name == const._INCORRECT:
-            return copy.deepcopy(self.pos.bad.left), copy.deepcopy(self.pos.bad.right)
+            return self.pos.bad.left, self.pos.bad.right
         elif st_name == const._CORRECT:
-            return copy.deepcopy(self.pos.good.left), copy.deepcopy(self.pos.good.right)
+            return self.pos.good.left, self.pos.good.right
         else:
             return
 
-    # TODO make it simpler
-    def is_err_on_line(self, line):
-        # We need also rise an error on the 'line' if the end of previous line contains the error
-        if self.pos.bad.left.line == line and self.pos.bad.left.col != self.pos.bad.right.col:
-            return True
+    def to_offsets(self, doc) -> Tuple[List[int], List[Tuple[int, int]]]:
+        """ Offsets of good left/right, bad left/right borders and [start, end) offsets of the error spans """
+        borders = [doc.get_offset(coord.line, coord.col) for coord in
+                   (self.pos.good.left, self.pos.good.right, self.pos.bad.left, self.pos.bad.right)]
+        errors = [(doc.get_offset(start.line, start.col), doc.get_offset(end.line, end.col)) for start, end in self.errors]
+        return borders, errors
+
+    def from_offsets(self, doc, borders: List[int], errors: Iterable[Tuple[int, int]]):
+        """ Restore the state from to_offsets() result, e.g. after the text was filtered """
+        good_left, good_right, bad_left, bad_right = (Coord(*doc.get_coord(offset)) for offset in borders)
+        self.pos.good.left, self.pos.good.right = good_left, good_right
+        self.pos.bad.left, self.pos.bad.right = bad_left, bad_right
 
-        if self.pos.bad.left.line != self.pos.bad.right.line:
-            return True
+        self.errors.clear()
+        for start_offset, end_offset in errors:
+            line, start = doc.get_coord(start_offset)
+            end_line, end = doc.get_coord(end_offset)
+            # Spans stay on their line
+            if end_line != line:
+                end = doc.get_line_len(line)
+            if end > start:
+                self.errors.add(line, start, end)
 
-        if self.pos.bad.left.line != line and self.pos.bad.left.line == self.pos.bad.right.line and \
-                self.pos.bad.left.col != self.pos.bad.right.col:
-            return True
+    def has_error(self) -> bool:
+        return self.pos.bad.left != self.pos.bad.right
 
-        if self.pos.bad.left.line != line and self.pos.bad.left.line != self.pos.bad.right.line:
-            return True
+    def add_error(self, line: int, start: int, end: int):
+        self.errors.add(line, start, end)
 
-        return False
+    def is_err_on_line(self, line) -> bool:
+        """ Was any error made on the line during the session """
+        return self.errors.has_line(line)
@@ -4,21 +4,38 @@ that have two value coordinates for each side(left and right)
 """
 
 from dataclasses import dataclass
+from typing import NamedTuple
 
 
-@dataclass
-class Coord:
+class Coord(NamedTuple):
+    """ Immutable, so it can be shared without copies. Compared as (line, col) """
     line: int
     col: int
 
 
 @dataclass
 class RangeBorders:
+    __slots__ = ("left", "right")
     left: Coord
     right: Coord
 
 
 @dataclass
 class State:
+    __slots__ = ("good", "bad")
     good: RangeBorders
     bad: RangeBorders
+
+
+@dataclass
+class RangeDelta:
+    """
+    Change of one highlighted span on a single line: 'added' is False when
+    the span [start, end) has to be un-highlighted (BackSpace)
+    """
+    __slots__ = ("state", "line", "start", "end", "added")
+    state: str
+    line: int
+    start: int
+    end: int
+    added: bool
@@ -1,39 +1,190 @@
 import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterator, NamedTuple
 
+from constants import Constants as const
+
+
+class Keystroke(NamedTuple):
+    time_ns: int
+    char: str
+    line: int
+    col: int
+    flag: int
+
+
+class KeystrokeLog:
+    """
+    Ring buffer of the last 'capacity' keystrokes. Every field has its own
+    preallocated array, so append is O(1) and memory doesn't grow with the session.
+    """
+    WRONG = 0
+    CORRECT = 1
+    BACKSPACE = 2
+
+    def __init__(self, capacity: int = const.KEYSTROKE_LOG_SIZE):
+        self.capacity = capacity
+        self.time_ns = array('q', bytes(8 * capacity))
+        self.char = array('I', bytes(4 * capacity))
+        self.line = array('I', bytes(4 * capacity))
+        self.col = array('I', bytes(4 * capacity))
+        self.flag = array('B', bytes(capacity))
+        # Number of keystrokes appended since the reset, the oldest kept one is total - len(self)
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def clear(self):
+        self.total = 0
+
+    def append(self, time_ns: int, char: str, line: int, col: int, flag: int):
+        i = self.total % self.capacity
+        self.time_ns[i] = time_ns
+        self.char[i] = ord(char)
+        self.line[i] = line
+        self.col[i] = col
+        self.flag[i] = flag
+        self.total += 1
+
+    def get(self, number: int) -> Keystroke:
+        """ Keystroke by its number since the reset, it must be still in the buffer """
+        i = number % self.capacity
+        return Keystroke(self.time_ns[i], chr(self.char[i]), self.line[i], self.col[i], self.flag[i])
+
+    def __iter__(self) -> Iterator[Keystroke]:
+        for number in range(self.total - len(self), self.total):
+            yield self.get(number)
+
+
+class LatencyHistogram:
+    """ Inter-key latencies per typed character, counted into the fixed buckets """
+    BUCKETS_MS = (25, 50, 75, 100, 150, 200, 300, 500, 1000)
 
-class Statistics:
     def __init__(self):
+        self._edges_ns = [edge * 1000000 for edge in self.BUCKETS_MS]
+        # The last bucket is for everything longer than BUCKETS_MS[-1]
+        self.per_key: Dict[str, array] = {}
+
+    def clear(self):
+        self.per_key.clear()
+
+    def add(self, char: str, latency_ns: int):
+        counts = self.per_key.get(char)
+        if counts is None:
+            counts = self.per_key[char] = array('I', bytes(4 * (len(self.BUCKETS_MS) + 1)))
+        counts[bisect_right(self._edges_ns, latency_ns)] += 1
+
+    def total(self) -> array:
+        counts = array('I', bytes(4 * (len(self.BUCKETS_MS) + 1)))
+        for key_counts in self.per_key.values():
+            for i, count in enumerate(key_counts):
+                counts[i] += count
+        return counts
+
+
+class Statistics:
+    def __init__(self, log_size: int = const.KEYSTROKE_LOG_SIZE):
         self.errors = 0
         self.speed_cpm = 0
         self.speed_wpm = 0
         self.time_ms = None
         self.word_cnt = 0
         self.symbol_cnt = 0
+        self.log = KeystrokeLog(log_size)
+        self.latency = LatencyHistogram()
+        # Rolling window over the keystroke log: its first keystroke number and correct symbols inside
+        self._window_first = 0
+        self._window_correct = 0
 
     def upd_err(self):
         self.errors += 1
 
-    def upd_speed(self):
-        self.symbol_cnt += 1
+    def upd_speed(self, count: int = 1):
+        self.symbol_cnt += count
 
         if not self.time_ms:
-            self.time_ms = time.time()
+            self.time_ms = time.perf_counter()
         else:
             if self.word_cnt == 0:
                 return
-            elapsed_time_ms = time.time() - self.time_ms
+            elapsed_time_ms = time.perf_counter() - self.time_ms
             if elapsed_time_ms:
                 self.speed_cpm = int(self.symbol_cnt / elapsed_time_ms * 60)
                 self.speed_wpm = self.speed_cpm / 5
 
+    def record(self, char: str, line: int, col: int, flag: int):
+        """ Add the keystroke to the log and move the rolling window """
+        now = time.perf_counter_ns()
+        log = self.log
+        if log.total:
+            self.latency.add(char, now - log.time_ns[(log.total - 1) % log.capacity])
+        log.append(now, char, line, col, flag)
+        if flag == KeystrokeLog.CORRECT:
+            self._window_correct += 1
+        self._move_window(now)
+
+    def record_run(self, text: str, line: int, col: int):
+        """
+        Correctly typed text which came at once (paste, burst). All its keystrokes
+        get the same time, only the first one has the latency.
+        """
+        now = time.perf_counter_ns()
+        log = self.log
+        if log.total:
+            self.latency.add(text[0], now - log.time_ns[(log.total - 1) % log.capacity])
+        for char in text:
+            log.append(now, char, line, col, KeystrokeLog.CORRECT)
+            if char == "\n":
+                line, col = line + 1, 0
+            else:
+                col += 1
+        self._window_correct += len(text)
+        self._move_window(now)
+
+    def _move_window(self, now: int):
+        """ Drop keystrokes which are out of the window or already overwritten in the log """
+        log = self.log
+        window_start = now - const.ROLLING_WINDOW_SEC * 1000000000
+        first = max(self._window_first, log.total - log.capacity)
+        while self._window_first < first or log.time_ns[self._window_first % log.capacity] < window_start:
+            if log.flag[self._window_first % log.capacity] == KeystrokeLog.CORRECT:
+                self._window_correct -= 1
+            self._window_first += 1
+
+    @property
+    def rolling_wpm(self) -> float:
+        """ Speed over the last const.ROLLING_WINDOW_SEC seconds """
+        log = self.log
+        if log.total - self._window_first < 2:
+            return 0
+        elapsed_ns = log.time_ns[(log.total - 1) % log.capacity] - log.time_ns[self._window_first % log.capacity]
+        if not elapsed_ns:
+            return 0
+        return self._window_correct / 5 / (elapsed_ns / 60000000000)
+
+    @property
+    def mean_latency_ms(self) -> float:
+        """ Mean time between the keystrokes inside of the rolling window """
+        log = self.log
+        keys = log.total - self._window_first
+        if keys < 2:
+            return 0
+        elapsed_ns = log.time_ns[(log.total - 1) % log.capacity] - log.time_ns[self._window_first % log.capacity]
+        return elapsed_ns / (keys - 1) / 1000000
+
     def reset(self):
         self.errors = 0
         self.time_ms = 0
         self.speed_cpm = self.speed_wpm = 0
         self.word_cnt = self.symbol_cnt = 0
+        self.log.clear()
+        self.latency.clear()
+        self._window_first = self._window_correct = 0
 
-    def one_word_typed(self):
-        self.word_cnt += 1
+    def one_word_typed(self, count: int = 1):
+        self.word_cnt += count
 
     def __iter__(self):
         return iter((self.errors, self.speed_wpm))
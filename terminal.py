@@ -0,0 +1,201 @@
+"""
+Terminal frontend. The same typing core as the Tk App: tabs are expanded by
+read_text, comments are hidden by FileFilters and the view follows the cursor
+by the Viewport rules. Only the changed cells get their colour updated, the
+whole screen is drawn again only when it is scrolled or resized.
+
+    python -m terminal FILE [--hide-comments]
+
+F2 hides or shows comments, F10 or Ctrl+C quits.
+"""
+
+import argparse
+import curses
+import os
+from typing import List
+
+from constants import Constants as const
+from document import Document, read_text
+from engine import TypingEngine
+from file_operations import FileFilters
+from state_structure import Coord, RangeDelta
+from viewport import Viewport
+
+_GOOD_PAIR = 1
+_BAD_PAIR = 2
+
+
+class TerminalApp:
+    """ Has the doc/txt_engine/viewport parts of the App, so FileFilters work with it without the text widget """
+    text = None
+
+    def __init__(self, screen, file_path: str):
+        self.screen = screen
+        self.file_path = os.path.realpath(file_path)
+        self.doc = Document(read_text(file_path))
+        self.txt_engine = TypingEngine(doc=self.doc)
+        self.viewport = Viewport()
+        self.txt_filter = FileFilters(self)
+        self.txt_filter.check_file_ext(file_path)
+        self.comments_hidden = False
+        self.rows = self.cols = 0
+        # Document position of the top left screen cell
+        self.top = self.left = 0
+
+        if curses.has_colors():
+            curses.start_color()
+            curses.use_default_colors()
+            curses.init_pair(_GOOD_PAIR, curses.COLOR_BLACK, curses.COLOR_GREEN)
+            curses.init_pair(_BAD_PAIR, curses.COLOR_WHITE, curses.COLOR_RED)
+            self._attrs = {
+                const._CORRECT: curses.color_pair(_GOOD_PAIR),
+                const._INCORRECT: curses.color_pair(_BAD_PAIR),
+            }
+        else:
+            # Monochrome terminal: typed text is reversed, errors are underlined
+            self._attrs = {
+                const._CORRECT: curses.A_REVERSE,
+                const._INCORRECT: curses.A_UNDERLINE,
+            }
+        screen.keypad(True)
+        self.resize()
+
+    def resize(self):
+        lines, cols = self.screen.getmaxyx()
+        # The last row is the status line
+        self.rows, self.cols = max(1, lines - 1), cols
+        self.viewport.resize(self.cols, self.rows)
+        self.draw()
+
+    def toggle_comments(self):
+        self.comments_hidden = not self.comments_hidden
+        self.txt_filter.apply_filter(FileFilters.FILTER_COMMENTS, int(self.comments_hidden))
+        cursor = self.txt_engine.cursor
+        self.viewport.jump(cursor.col, cursor.line, self.doc)
+        self.draw()
+
+    def scroll_origin(self):
+        """ Viewport may scroll past the text end, the terminal can't """
+        top = max(0, min(self.viewport.shifted_vert, self.doc.line_cnt - 1))
+        return top, max(0, self.viewport.shifted_hor)
+
+    def draw(self):
+        """ Whole screen: text, highlighting of the typed ranges and the status line """
+        self.top, self.left = self.scroll_origin()
+        screen = self.screen
+        screen.erase()
+        for row in range(self.rows):
+            line = self.top + row + 1
+            if not self.doc.has_line(line):
+                break
+            self._put(row, 0, self.doc.get_line(line)[self.left:self.left + self.cols], 0)
+        pos = self.txt_engine.storage.pos
+        self.draw_range(const._CORRECT, pos.good.left, pos.good.right)
+        self.draw_range(const._INCORRECT, pos.bad.left, pos.bad.right)
+        self.draw_status()
+
+    def draw_range(self, state: str, left: Coord, right: Coord):
+        first = max(left.line, self.top + 1)
+        last = min(right.line, self.top + self.rows)
+        for line in range(first, last + 1):
+            start = left.col if line == left.line else 0
+            end = right.col if line == right.line else self.doc.get_line_len(line)
+            self.paint(RangeDelta(state, line, start, end, True))
+
+    def paint(self, delta: RangeDelta):
+        """ Change colour of the delta cells which are on the screen """
+        row = delta.line - self.top - 1
+        start = max(delta.start, self.left)
+        end = min(delta.end, self.left + self.cols)
+        if not 0 <= row < self.rows or end <= start:
+            return
+        self.screen.chgat(row, start - self.left, end - start, self._attrs[delta.state] if delta.added else 0)
+
+    def draw_status(self):
+        stat = self.txt_engine.stat
+        status = f" {os.path.basename(self.file_path)}  {stat.speed_wpm:.0f} WPM  " \
+                 f"last {const.ROLLING_WINDOW_SEC}s {stat.rolling_wpm:.0f} WPM  errors {stat.errors}  " \
+                 f"F2 {'show' if self.comments_hidden else 'hide'} comments  F10 quit"
+        self._put(self.rows, 0, status[:self.cols].ljust(self.cols), curses.A_REVERSE)
+
+    def _put(self, row: int, col: int, text: str, attr: int):
+        try:
+            self.screen.addstr(row, col, text, attr)
+        except curses.error:
+            # Writing to the bottom right cell moves the cursor out of the screen, the text is there anyway
+            pass
+
+    def place_cursor(self):
+        cursor = self.txt_engine.cursor
+        row, col = cursor.line - self.top - 1, cursor.col - self.left
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            self.screen.move(row, col)
+
+    def press(self, char: str, deltas: List[RangeDelta]):
+        """ The same steps as App.press_event does, the rendering is done by the caller """
+        line, column = self.txt_engine.cursor
+        deltas += self.txt_engine.feed(char)
+        if self.txt_engine.cursor != (line, column):
+            self.viewport.shift(column, line, self.txt_engine.moved_key(char, char, line), self.doc)
+
+    def run(self):
+        while True:
+            self.place_cursor()
+            self.screen.refresh()
+            key = self.screen.get_wch()
+
+            # Keys which came together (key repeat, paste) are drawn once
+            deltas = []
+            redraw = False
+            self.screen.nodelay(True)
+            try:
+                while True:
+                    if key == curses.KEY_F10:
+                        return
+                    if key == curses.KEY_RESIZE:
+                        self.resize()
+                        redraw = True
+                    elif key == curses.KEY_F2 and self.txt_filter.curr_file_ext:
+                        self.toggle_comments()
+                        redraw = True
+                    elif key == curses.KEY_BACKSPACE:
+                        self.press(TypingEngine.BACKSPACE[0], deltas)
+                    elif isinstance(key, str):
+                        self.press(key, deltas)
+                    try:
+                        key = self.screen.get_wch()
+                    except curses.error:
+                        break
+            finally:
+                self.screen.nodelay(False)
+
+            if redraw or self.scroll_origin() != (self.top, self.left):
+                self.draw()
+                continue
+            for delta in TypingEngine.coalesce(deltas):
+                self.paint(delta)
+            self.draw_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file")
+    parser.add_argument("--hide-comments", action="store_true")
+    args = parser.parse_args()
+    # Esc sequences of the function keys come slower over SSH, but don't wait a second for them
+    os.environ.setdefault("ESCDELAY", "50")
+
+    def start(screen):
+        app = TerminalApp(screen, args.file)
+        if args.hide_comments and app.txt_filter.curr_file_ext:
+            app.toggle_comments()
+        app.run()
+
+    try:
+        curses.wrapper(start)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import math
+import unittest
+
+from analytics import Keystrokes, analyse
+from document import Document
+from engine import TypingEngine
+
+
+class AnalyseTest(unittest.TestCase):
+    """ Sessions without a single inter-key latency give a report with the empty percentiles """
+
+    def setUp(self):
+        self.engine = TypingEngine(doc=Document("ab\n  cd"))
+
+    def analyse(self):
+        return analyse(Keystrokes.from_log(self.engine.stat.log), min_count=1)
+
+    def test_empty_session(self):
+        report = self.analyse()
+        self.assertEqual((report.keystrokes, report.sessions, report.errors), (0, 0, 0))
+        self.assertEqual(report.chars, [])
+
+    def test_single_key(self):
+        self.engine.feed("x")
+        report = self.analyse()
+        self.assertEqual((report.keystrokes, report.errors), (1, 1))
+        self.assertEqual(report.latency_ms, (0.0, 0.0, 0.0))
+        self.assertEqual(report.classes, [])
+        report.format()
+
+    def test_pasted_chunk(self):
+        self.engine.feed_chunk("ab\n  cd")
+        self.assertEqual(self.engine.stat.log.total, 7)
+        report = self.analyse()
+        self.assertEqual(report.keystrokes, 7)
+        # Keys of the paste come at once, none of them has a latency
+        self.assertEqual(report.classes, [])
+        chars = {name: (attempts, errors, p50) for name, attempts, errors, _, p50 in report.chars}
+        self.assertEqual(chars["a"][:2], (1, 0))
+        self.assertTrue(math.isnan(chars["a"][2]))
+        report.format()
+
+    def test_timed_keys(self):
+        for char in "ab\n  cd":
+            self.engine.feed(char)
+        log = self.engine.stat.log
+        # 100 ms between the keys
+        for i in range(log.total):
+            log.time_ns[i] = i * 100_000_000
+        report = self.analyse()
+        self.assertEqual(report.latency_ms, (100.0, 100.0, 100.0))
+        classes = {name: count for name, count, *_ in report.classes}
+        self.assertEqual(classes, {"letters": 3, "newlines": 1, "indentation": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
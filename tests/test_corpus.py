@@ -0,0 +1,112 @@
+import os.path
+import tempfile
+import time
+import unittest
+
+from corpus import Corpus, DocumentCache, prepare
+
+FILES = {
+    "b.c": "int b; // b\n",
+    "a.py": "# a\nx = 1\n",
+    "sub/c.h": "/* c */\nint c;\n",
+    "notes.txt": "plain text\n",
+    "image.png": "not a source file",
+    ".hidden/d.c": "int d;\n",
+}
+
+
+class CorpusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.realpath(self.work_dir.name)
+        for name, text in FILES.items():
+            self.write(name, text)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def write(self, name: str, text, mode: str = "w") -> str:
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode) as file:
+            file.write(text)
+        return path
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def indexed(self, corpus: Corpus) -> Corpus:
+        deadline = time.monotonic() + 10
+        # Files are pending from their submit to the end of their indexing
+        while not corpus.scanned or corpus._pending:
+            self.assertLess(time.monotonic(), deadline, "corpus is not indexed")
+            time.sleep(0.01)
+        self.addCleanup(corpus.close)
+        return corpus
+
+    def test_scan_order(self):
+        corpus = self.indexed(Corpus(self.root, workers=2))
+        order = [self.path(name) for name in ("a.py", "b.c", "notes.txt", "sub/c.h")]
+        self.assertEqual([corpus.next_path(path) for path in order], order[1:] + order[:1])
+        self.assertEqual(corpus.next_path(order[0], -1), order[-1])
+        self.assertEqual(corpus.first_path(), order[0])
+        self.assertEqual(sorted(corpus.entries), order)
+
+    def test_prepared_documents(self):
+        corpus = self.indexed(Corpus(self.root))
+        entry = corpus.entries[self.path("sub/c.h")]
+        self.assertEqual((entry.language, entry.line_cnt, entry.filtered_line_cnt), ("C", 3, 2))
+        self.assertEqual(corpus.entries[self.path("notes.txt")].language, "Text")
+        prepared = corpus.get(self.path("a.py"))
+        self.assertEqual((prepared.doc.text, prepared.filtered.text), (FILES["a.py"], "x = 1\n"))
+
+    def test_unreadable_file_is_skipped(self):
+        self.write("broken.c", b"\xff\xfe\x00", "wb")
+        with self.assertLogs("corpus", "WARNING"):
+            corpus = self.indexed(Corpus(self.root))
+        self.assertIn(self.path("broken.c"), corpus._position)
+        self.assertNotIn(self.path("broken.c"), corpus.entries)
+        self.assertEqual(corpus.indexed_cnt, corpus.file_cnt - 1)
+
+
+class DocumentCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            prepared = []
+            for name in "abc":
+                path = os.path.join(work_dir, f"{name}.txt")
+                with open(path, "w") as file:
+                    file.write(name * 1000)
+                prepared.append(prepare(path))
+        a, b, c = prepared
+        cache = DocumentCache(a.memory_size() + b.memory_size() + 10)
+        cache.put(a)
+        cache.put(b)
+        self.assertIs(cache.get(a.path), a)
+        cache.put(c)
+        self.assertEqual((a.path in cache, b.path in cache, c.path in cache), (True, False, True))
+        self.assertEqual(cache.used_bytes, a.memory_size() + c.memory_size())
+
+        # The newest one stays even if it alone is over the limit
+        small = DocumentCache(1)
+        small.put(a)
+        small.put(b)
+        self.assertEqual((len(small), small.get(b.path)), (1, b))
+
+    def test_put_again_replaces(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            path = os.path.join(work_dir, "a.txt")
+            with open(path, "w") as file:
+                file.write("a")
+            first, second = prepare(path), prepare(path)
+        cache = DocumentCache()
+        cache.put(first)
+        cache.put(second)
+        self.assertEqual((len(cache), cache.used_bytes), (1, second.memory_size()))
+        self.assertIs(cache.get(path), second)
+
+
+if __name__ == "__main__":
+    unittest.main()
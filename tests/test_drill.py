@@ -0,0 +1,78 @@
+import os.path
+import random
+import tempfile
+import unittest
+
+from drill import DrillIndex, build_index, make_drill, weak_bigrams
+
+FILES = {
+    "a.c": "/* header comment line */\nint alpha = 1;\n// skipped comment here\nfloat beta_value = 2.5;\nint alpha = 1;\n",
+    "b.py": "def gamma(x):\n    return x * 2  # twice\nx\n",
+}
+
+
+class DrillIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.realpath(self.work_dir.name)
+        for name, text in FILES.items():
+            with open(os.path.join(self.root, name), "w") as file:
+                file.write(text)
+        self.index_path = os.path.join(self.root, "index", "drill.idx")
+        self.counts = build_index(self.root, self.index_path, workers=1)
+        self.index = DrillIndex(self.index_path)
+
+    def tearDown(self):
+        self.index.close()
+        self.work_dir.cleanup()
+
+    def test_lines_of_the_code(self):
+        # Comments, short and repeated lines are not indexed
+        self.assertEqual(self.counts[:2], (2, 4))
+        self.assertEqual([self.index.line(line_id) for line_id in range(len(self.index))],
+                         ["int alpha = 1;", "float beta_value = 2.5;", "def gamma(x):", "return x * 2"])
+        # Line numbers are of the file with the comments
+        self.assertEqual(self.index.location(1), (os.path.join(self.root, "a.c"), 4))
+        self.assertEqual(self.index.location(3), (os.path.join(self.root, "b.py"), 2))
+        self.assertEqual(self.index.ext(2), ".py")
+
+    def test_lines_with(self):
+        self.assertEqual(list(self.index.lines_with("al")), [0, 1])
+        self.assertEqual(list(self.index.lines_with("ga")), [2])
+        self.assertEqual(list(self.index.lines_with("zz")), [])
+
+    def test_choose(self):
+        rng = random.Random(1)
+        self.assertEqual(self.index.choose({"et": 1.0, "al": 0.5}, 1, rng=rng), [1])
+        # Weight of "et" goes down after the first line, the next one brings the other n-grams
+        self.assertEqual(self.index.choose({"et": 1.0, "= ": 0.6, "ma": 0.6}, 2, rng=rng), [1, 2])
+        self.assertEqual(self.index.choose({"al": 1.0, "x ": 0.1}, 2, ext=".py", rng=rng), [3])
+        self.assertEqual(make_drill(self.index, {"et": 1.0}, 1, rng=rng), "float beta_value = 2.5;")
+        # No n-gram is in the index
+        self.assertEqual(len(self.index.choose({"qq": 1.0}, 3, rng=rng)), 3)
+
+    def test_broken_index(self):
+        with open(self.index_path, "rb") as file:
+            data = file.read()
+        for broken in (b"NOTDRILL" + data[8:], data[:-16]):
+            with open(self.index_path, "wb") as file:
+                file.write(broken)
+            with self.assertRaises(ValueError):
+                DrillIndex(self.index_path).close()
+
+
+class WeakBigramsTest(unittest.TestCase):
+
+    def test_cost_of_errors(self):
+        stats = [("ab", 10, 100.0, 0), ("cd", 10, 100.0, 5), ("ef", 10, 300.0, 0), ("g\n", 5, 900.0, 0)]
+        # Mean latency is 500/3 ms, every error costs two keystrokes more
+        weights = weak_bigrams(stats)
+        self.assertEqual(list(weights), ["ef", "cd"])
+        self.assertAlmostEqual(weights["ef"], 1.35)
+        self.assertAlmostEqual(weights["cd"], 1.2)
+        self.assertEqual(weak_bigrams([]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
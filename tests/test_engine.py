@@ -0,0 +1,177 @@
+import random
+import unittest
+
+from constants import Constants as const
+from document import Document
+from engine import TypingEngine, common_prefix_len
+from state_structure import Coord
+from statistics import KeystrokeLog
+
+
+class TypingEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = TypingEngine(doc=Document("ab\n  cd"))
+
+    def test_return_is_logged_as_line_break(self):
+        for char in ("a", "b", "\r", " ", " "):
+            self.engine.feed(char)
+        self.assertEqual(self.engine.cursor, (2, 2))
+        keys = list(self.engine.stat.log)
+        self.assertEqual([key.char for key in keys], ["a", "b", "\n", " ", " "])
+        self.assertEqual(keys[2].flag, KeystrokeLog.CORRECT)
+
+    def test_return_is_declined_inside_of_the_line(self):
+        self.engine.feed("a")
+        self.assertEqual(self.engine.feed("\r"), [])
+        self.assertEqual(self.engine.cursor, (1, 1))
+
+    def test_error_and_backspace(self):
+        self.engine.feed("x")
+        self.assertTrue(self.engine.storage.has_error())
+        self.engine.feed("\b")
+        self.assertFalse(self.engine.storage.has_error())
+        self.assertEqual(self.engine.cursor, (1, 0))
+
+    def test_correct_and_wrong_keys(self):
+        self.assertEqual(highlight(self.engine.feed("a")), {(1, 0): {const._CORRECT}})
+        self.assertEqual(highlight(self.engine.feed("x")), {(1, 1): {const._INCORRECT}})
+        # The right key after the error is wrong too until the error is fixed
+        self.engine.feed("\r")
+        self.assertEqual(self.engine.cursor, (2, 0))
+        self.assertEqual(highlight(self.engine.feed(" ")), {(2, 0): {const._INCORRECT}})
+        self.assertEqual(self.engine.stat.errors, 3)
+        self.assertEqual([key.flag for key in self.engine.stat.log],
+                         [KeystrokeLog.CORRECT, KeystrokeLog.WRONG, KeystrokeLog.WRONG, KeystrokeLog.WRONG])
+        self.assertEqual(list(self.engine.storage.errors), [(Coord(1, 1), Coord(1, 2)), (Coord(2, 0), Coord(2, 1))])
+
+    def test_backspace_across_the_line_start(self):
+        for char in "ab\r":
+            self.engine.feed(char)
+        self.assertEqual(self.engine.feed("\b"), [])
+        self.assertEqual(self.engine.cursor, (1, 2))
+        self.assertEqual(highlight(self.engine.feed("\b")), {})
+        self.assertEqual(self.engine.cursor, (1, 1))
+        self.assertEqual(self.engine.storage.pos.good.right, (1, 1))
+        # Nothing to erase at the beginning of the text
+        self.engine.feed("\b")
+        self.assertEqual(self.engine.feed("\b"), [])
+        self.assertEqual((self.engine.cursor, len(self.engine.stat.log)), ((1, 0), 6))
+
+    def test_tab_is_expanded(self):
+        engine = TypingEngine(doc=Document("a\n" + const.TAB_SIZE_SYMBOLS * " " + "b\n  c"))
+        for char in "a\r\t":
+            engine.feed(char)
+        self.assertEqual(engine.cursor, (2, const.TAB_SIZE_SYMBOLS))
+        self.assertFalse(engine.storage.has_error())
+        engine.feed("b")
+        engine.feed("\r")
+        # Not enough spaces for the tab, it's a wrong key
+        self.assertEqual(highlight(engine.feed("\t")), {(3, 0): {const._INCORRECT}})
+        self.assertEqual(engine.cursor, (3, 1))
+
+    def test_return_on_the_last_line_is_ignored(self):
+        for char in "ab\r  cd":
+            self.engine.feed(char)
+        self.assertEqual(self.engine.cursor, (2, 4))
+        log_len = len(self.engine.stat.log)
+        for char in ("\r", "x"):
+            self.assertEqual(self.engine.feed(char), [])
+        self.assertEqual((self.engine.cursor, len(self.engine.stat.log)), ((2, 4), log_len))
+        self.assertEqual(self.engine.stat.errors, 0)
+
+
+def highlight(deltas) -> dict:
+    """ (line, col) -> highlighted states after the deltas """
+    cells = {}
+    for delta in deltas:
+        for col in range(delta.start, delta.end):
+            states = cells.setdefault((delta.line, col), set())
+            if delta.added:
+                states.add(delta.state)
+            else:
+                states.discard(delta.state)
+    return {cell: states for cell, states in cells.items() if states}
+
+
+class CommonPrefixTest(unittest.TestCase):
+
+    def test_matches_the_plain_comparison(self):
+        rng = random.Random(1)
+        text = "".join(rng.choice("ab") for _ in range(300))
+        for _ in range(500):
+            start = rng.randrange(20)
+            length = rng.randrange(300)
+            chars = list("x" * start + text[:length])
+            if length and rng.random() < 0.7:
+                # Mismatch at any distance from the start, galloping steps included
+                pos = start + rng.randrange(length)
+                chars[pos] = "c"
+            chars = "".join(chars)
+            expected = 0
+            while expected < min(len(text), len(chars) - start) and text[expected] == chars[start + expected]:
+                expected += 1
+            self.assertEqual(common_prefix_len(text, chars, start), expected, (start, length))
+
+    def test_empty(self):
+        self.assertEqual(common_prefix_len("", "abc", 0), 0)
+        self.assertEqual(common_prefix_len("abc", "abc", 3), 0)
+
+
+class FeedChunkTest(unittest.TestCase):
+    """ Chunk gives the same state, statistics, log and highlighting as its keys fed one by one """
+    TEXT = "int a;\n    b = a;\nend"
+
+    def assert_same(self, chunk: str, keys: str = None):
+        chunked = TypingEngine(doc=Document(self.TEXT))
+        one_by_one = TypingEngine(doc=Document(self.TEXT))
+        chunk_deltas = chunked.feed_chunk(chunk)
+        key_deltas = []
+        for key in (chunk if keys is None else keys):
+            key_deltas += one_by_one.feed(key)
+
+        self.assertEqual(chunked.storage.pos, one_by_one.storage.pos)
+        self.assertEqual(list(chunked.storage.errors), list(one_by_one.storage.errors))
+        self.assertEqual((chunked.stat.errors, chunked.stat.symbol_cnt, chunked.stat.word_cnt),
+                         (one_by_one.stat.errors, one_by_one.stat.symbol_cnt, one_by_one.stat.word_cnt))
+        self.assertEqual([key[1:] for key in chunked.stat.log], [key[1:] for key in one_by_one.stat.log])
+        self.assertEqual(highlight(chunk_deltas), highlight(key_deltas))
+        return chunked
+
+    def test_whole_text(self):
+        engine = self.assert_same(self.TEXT)
+        self.assertEqual(engine.cursor, (3, 3))
+        self.assertFalse(engine.storage.has_error())
+
+    def test_line_breaks(self):
+        self.assert_same("int a;\r\n    b", "int a;\n    b")
+        self.assert_same("int a;\r    b", "int a;\n    b")
+
+    def test_error_in_the_middle(self):
+        engine = self.assert_same("int x\ba;\n    b")
+        self.assertEqual(engine.stat.errors, 1)
+        self.assertFalse(engine.storage.has_error())
+
+    def test_error_which_is_not_fixed(self):
+        engine = self.assert_same("int x;\n    b")
+        self.assertTrue(engine.storage.has_error())
+        self.assertEqual(engine.cursor, (2, 5))
+
+    def test_backspace_over_the_line_start(self):
+        self.assert_same("int a;\n\b\n    b = a")
+
+    def test_tab_and_wrong_return(self):
+        self.assert_same("int a;\n\tb = a;\n")
+        self.assert_same("int a\n;")
+
+    def test_after_keys(self):
+        engine = TypingEngine(doc=Document(self.TEXT))
+        for key in "int":
+            engine.feed(key)
+        engine.feed_chunk(" a;\n    b")
+        self.assertEqual(engine.cursor, (2, 5))
+        self.assertEqual(engine.stat.symbol_cnt, 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
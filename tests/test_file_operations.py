@@ -0,0 +1,178 @@
+import os.path
+import unittest
+from types import SimpleNamespace
+
+from constants import Constants as const
+from document import Document, read_text
+from engine import TypingEngine
+from file_operations import CLexer, FileFilters, PythonLexer
+from state_structure import Coord
+
+TEST_C = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.c")
+
+
+class HideCommentsTest(unittest.TestCase):
+    """ Hiding and showing the comments keeps the typing state where it was """
+
+    def setUp(self):
+        self.doc = Document(read_text(TEST_C))
+        self.engine = TypingEngine(doc=self.doc)
+        # Parent without the text widget, only the document is changed
+        self.filters = FileFilters(SimpleNamespace(doc=self.doc, txt_engine=self.engine, text=None))
+        self.filters.check_file_ext(TEST_C)
+
+    def toggle(self):
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 1)
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 0)
+
+    def test_nothing_typed(self):
+        text = self.doc.text
+        self.toggle()
+        pos = self.engine.storage.pos
+        self.assertEqual(self.doc.text, text)
+        self.assertEqual((pos.good.left, pos.good.right, pos.bad.left, pos.bad.right), ((1, 0),) * 4)
+
+    def test_filtered_text_is_cached(self):
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 1)
+        filtered = self.filters.filtered
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 0)
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 1)
+        self.assertIs(self.filters.filtered, filtered)
+        # Another text of the document is filtered again
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 0)
+        self.doc.set_text(self.doc.text + "// tail\n")
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 1)
+        self.assertIsNot(self.filters.filtered, filtered)
+
+    def test_restored_spans(self):
+        self.assertEqual(self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 1), [])
+        removed = self.filters.filtered.removed
+        restored = self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 0)
+        self.assertEqual([self.doc.text[start:end] for start, end in restored], removed)
+
+    def test_typed_code(self):
+        # Cursor inside of the code line after the file header comment
+        line = next(line for line in range(1, self.doc.line_cnt + 1) if self.doc.get_line(line).startswith("#"))
+        self.engine.storage.save_state(const._CORRECT, Coord(line, 0), Coord(line, 0))
+        self.engine.storage.save_state(const._INCORRECT, Coord(line, 0), Coord(line, 0))
+        for char in self.doc.get_line(line)[:5]:
+            self.engine.feed(char)
+        self.engine.feed("~")
+        before = self.engine.storage.pos
+        before = (before.good.left, before.good.right, before.bad.left, before.bad.right)
+
+        self.toggle()
+        pos = self.engine.storage.pos
+        self.assertEqual((pos.good.left, pos.good.right, pos.bad.left, pos.bad.right), before)
+        self.assertEqual(self.engine.cursor, (line, 6))
+        self.assertTrue(self.engine.storage.has_error())
+
+    def test_typed_while_hidden(self):
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 1)
+        first_code = self.doc.get_line(1)
+        for char in first_code[:5]:
+            self.engine.feed(char)
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 0)
+        cursor = self.engine.cursor
+        self.assertEqual(self.doc.get_line(cursor.line)[:cursor.col], first_code[:5])
+        self.assertEqual(self.engine.storage.pos.good.left, (1, 0))
+
+    def errors(self):
+        return [(tuple(start), tuple(end)) for start, end in self.engine.storage.errors]
+
+    def test_wrong_key_while_hidden(self):
+        # Error in the comment line and in the code before the comments are hidden
+        self.engine.feed("~")
+        self.engine.feed("\b")
+        comment = self.doc.get_line(1)
+        for char in comment:
+            self.engine.feed(char)
+        self.engine.feed("\n")
+        self.engine.feed("~")
+        self.engine.feed("\b")
+        before = self.errors()
+        self.assertEqual(before, [((1, 0), (1, 1)), ((2, 0), (2, 1))])
+
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 1)
+        # The comment line is hidden, its error with it
+        self.assertEqual(self.errors(), [((1, 0), (1, 1))])
+        code = self.doc.get_line(1)
+        for char in code[:3]:
+            self.engine.feed(char)
+        self.engine.feed("~")
+        self.assertEqual(self.errors(), [((1, 0), (1, 1)), ((1, 3), (1, 4))])
+
+        self.filters.apply_filter(FileFilters.FILTER_COMMENTS, 0)
+        self.assertEqual(self.errors(), before + [((2, 3), (2, 4))])
+        self.assertEqual(self.engine.cursor, (2, 4))
+        self.assertEqual(self.doc.get_line(2)[:3], code[:3])
+        self.assertTrue(self.engine.storage.is_err_on_line(1))
+
+
+class CLexerTest(unittest.TestCase):
+
+    def strip(self, text: str):
+        filtered = FileFilters.strip_comments(text, CLexer())
+        self.assertEqual(filtered.original_text(), text)
+        return filtered.text, filtered.removed
+
+    def test_whole_line_comments_take_their_line(self):
+        self.assertEqual(self.strip("// only\n  /* two */ // three\ncode();"),
+                         ("code();", ["// only\n  /* two */ // three\n"]))
+
+    def test_trailing_comments_on_code_lines(self):
+        self.assertEqual(self.strip("int a; // c\nint b; /* d */\n"), ("int a;\nint b;\n", [" // c", " /* d */"]))
+
+    def test_markers_inside_of_strings(self):
+        text = 'char *s = "// not /* a */ comment"; char c = \'/\';'
+        self.assertEqual(self.strip(text), (text, []))
+
+    def test_escaped_quotes(self):
+        self.assertEqual(self.strip('s = "a\\"//b"; /* x */ y;'), ('s = "a\\"//b"; y;', [" /* x */"]))
+        self.assertEqual(self.strip("c = '\\''; // q"), ("c = '\\'';", [" // q"]))
+
+    def test_unterminated_block_comment(self):
+        self.assertEqual(self.strip("int a;\n/* open\nnever closed"), ("int a;\n", ["/* open\nnever closed"]))
+
+
+class PythonLexerTest(unittest.TestCase):
+
+    def test_comments_and_docstrings(self):
+        text = "a = '#'  # c\n'''doc\n'''\nx = '''not doc''' + 1\n"
+        filtered = FileFilters.strip_comments(text, PythonLexer())
+        self.assertEqual(filtered.text, "a = '#'\nx = '''not doc''' + 1\n")
+        self.assertEqual(filtered.original_text(), text)
+
+
+class OffsetMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.text = read_text(TEST_C)
+        self.filtered = FileFilters.strip_comments(self.text, CLexer())
+        self.offsets = self.filtered.offsets
+
+    def test_filtered_offsets_round_trip(self):
+        for offset in range(len(self.filtered.text) + 1):
+            for after_removed in (False, True):
+                original = self.offsets.to_original(offset, after_removed)
+                self.assertEqual(self.offsets.to_filtered(original), offset)
+
+    def test_kept_symbols_round_trip(self):
+        removed = set()
+        for original, _, piece in self.filtered.removed_ranges():
+            removed.update(range(original, original + len(piece)))
+        for offset in range(len(self.text)):
+            if offset not in removed:
+                filtered = self.offsets.to_filtered(offset)
+                self.assertEqual(self.text[offset], self.filtered.text[filtered])
+                self.assertEqual(self.offsets.to_original(filtered, after_removed=True), offset)
+
+    def test_border_maps_before_removed_text(self):
+        # test.c starts with a comment line, its start stays the session start
+        self.assertEqual(self.offsets.to_original(0), 0)
+        first_removed = next(self.filtered.removed_ranges())
+        self.assertEqual(self.offsets.to_original(0, after_removed=True), len(first_removed[2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os.path
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from unittest import mock
+
+import statistics
+from history import SessionHistory
+from statistics import KeystrokeLog, Statistics
+
+MS_NS = 1000000
+
+
+class SessionHistoryTest(unittest.TestCase):
+    """ Sessions go through the writer thread to a database in a temporary directory """
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.work_dir.name, "history.sqlite3")
+        self.history = SessionHistory(self.db_path)
+
+    def tearDown(self):
+        self.history.close()
+        self.work_dir.cleanup()
+
+    @staticmethod
+    def type(stat: Statistics, keys):
+        """ (ms, char, flag) keystrokes """
+        for ms, char, flag in keys:
+            with mock.patch.object(statistics.time, "perf_counter_ns", return_value=ms * MS_NS):
+                stat.record(char, 1, 0, flag)
+
+    def query(self, sql: str):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute(sql).fetchall()
+
+    def test_session_round_trip(self):
+        stat = Statistics()
+        self.history.start_session("test.c", filtered=True)
+        self.type(stat, [(0, "a", KeystrokeLog.CORRECT), (100, "x", KeystrokeLog.WRONG),
+                         (150, "\b", KeystrokeLog.BACKSPACE), (200, "b", KeystrokeLog.CORRECT)])
+        # Keystrokes are sent in parts
+        self.history.collect(stat)
+        self.type(stat, [(300, "c", KeystrokeLog.CORRECT), (5000, "d", KeystrokeLog.CORRECT)])
+        stat.errors = 1
+        self.history.finish_session(stat)
+        # Nothing is typed in this one, it doesn't get to the database
+        self.history.start_session("other.c")
+        self.history.finish_session(Statistics())
+        self.history.close()
+
+        self.assertEqual(self.query("SELECT file, filtered, errors, ended_at IS NOT NULL FROM sessions"),
+                         [("test.c", 1, 1, 1)])
+        self.assertEqual(self.query("SELECT seq, char, flag, latency_ns FROM keystrokes ORDER BY seq"),
+                         [(0, ord("a"), KeystrokeLog.CORRECT, None), (1, ord("x"), KeystrokeLog.WRONG, 100 * MS_NS),
+                          (2, ord("\b"), KeystrokeLog.BACKSPACE, 50 * MS_NS), (3, ord("b"), KeystrokeLog.CORRECT, 50 * MS_NS),
+                          (4, ord("c"), KeystrokeLog.CORRECT, 100 * MS_NS), (5, ord("d"), KeystrokeLog.CORRECT, 4700 * MS_NS)])
+        # Backspace breaks the bigram, the pause before "d" is too long for one
+        self.assertEqual(sorted(self.history.bigram_stats(min_count=1)), [("ax", 1, 100.0, 1), ("bc", 1, 100.0, 0)])
+        self.assertEqual(self.history.slowest_bigrams(limit=1, min_count=1)[0][0], "ax")
+        self.assertEqual([sessions for _, _, sessions in self.history.wpm_trend("test.c")], [1])
+
+    def test_keystrokes_overwritten_before_collect(self):
+        stat = Statistics(log_size=4)
+        self.history.start_session("test.c")
+        self.type(stat, [(ms, "a", KeystrokeLog.CORRECT) for ms in range(0, 600, 100)])
+        self.history.finish_session(stat)
+        self.history.close()
+        self.assertEqual(self.query("SELECT seq FROM keystrokes ORDER BY seq"), [(2,), (3,), (4,), (5,)])
+
+    def test_unwritable_database(self):
+        # Directory of the database can't be created under a file
+        blocker = os.path.join(self.work_dir.name, "file")
+        open(blocker, "w").close()
+        stat = Statistics()
+        with self.assertLogs("history", "WARNING"):
+            history = SessionHistory(os.path.join(blocker, "history.sqlite3"))
+            history.start_session("test.c")
+            self.type(stat, [(0, "a", KeystrokeLog.CORRECT)])
+            # Writer drains the queue without the database, close doesn't hang
+            history.close(stat)
+        self.assertFalse(history._writer.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
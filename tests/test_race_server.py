@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os.path
+import unittest
+from types import SimpleNamespace
+
+from document import read_text
+from race_load import Report, Typist
+from race_server import RaceServer
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+LIMIT = 1024
+
+
+class RaceProtocolTest(unittest.TestCase):
+    """ Players talk to the server on an ephemeral port, ticks are sent by the test """
+
+    def setUp(self):
+        self.server = RaceServer(TESTS_DIR)
+        self.text = read_text(os.path.join(TESTS_DIR, "test.c"))
+
+    def run_session(self, session):
+        async def main():
+            listener = await asyncio.start_server(self.server.handle_client, "127.0.0.1", 0, limit=LIMIT)
+            try:
+                await session(listener.sockets[0].getsockname()[1])
+            finally:
+                listener.close()
+                await listener.wait_closed()
+        asyncio.run(main())
+
+    @staticmethod
+    async def connect(port: int):
+        return await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+
+    @staticmethod
+    async def send(writer, message):
+        writer.write((message if isinstance(message, str) else json.dumps(message)).encode() + b"\n")
+        await writer.drain()
+
+    @staticmethod
+    async def receive(reader) -> dict:
+        return json.loads(await asyncio.wait_for(reader.readline(), 5))
+
+    async def barrier(self, reader, writer):
+        """ Messages are handled in order, the ones before are handled when the error of this one comes """
+        await self.send(writer, "barrier")
+        self.assertEqual((await self.receive(reader))["op"], "error")
+
+    async def join(self, port: int, name: str):
+        reader, writer = await self.connect(port)
+        await self.send(writer, {"op": "join", "race": "r1", "file": "test.c", "name": name})
+        return reader, writer, await self.receive(reader)
+
+    def test_join_and_progress(self):
+        async def session(port):
+            reader, writer, joined = await self.join(port, "alice")
+            self.assertEqual((joined["op"], joined["id"], joined["text"]), ("joined", 0, self.text))
+            other_reader, other_writer, _ = await self.join(port, "bob")
+            self.assertEqual(await self.receive(other_reader), {"op": "player", "id": 0, "name": "alice"})
+            self.assertEqual(await self.receive(reader), {"op": "player", "id": 1, "name": "bob"})
+
+            await self.send(writer, {"op": "keys", "seq": 1, "chars": self.text[:10]})
+            await self.send(writer, {"op": "keys", "seq": 2, "chars": "~"})
+            await self.barrier(reader, writer)
+            self.server.tick()
+            tick = await self.receive(other_reader)
+            self.assertEqual((tick["op"], tick["n"]), ("tick", 1))
+            player_id, progress, _, errors, seq, finished = tick["players"][0]
+            self.assertEqual((player_id, progress, errors, seq, finished),
+                             (0, 10 * 1000 // len(self.text), 1, 2, False))
+
+            writer.close()
+            self.assertEqual(await self.receive(other_reader), {"op": "left", "id": 0})
+            other_writer.close()
+        self.run_session(session)
+
+    def test_malformed_messages(self):
+        async def session(port):
+            reader, writer, _ = await self.join(port, "alice")
+            for message in ("not json", '{"no": "op"}', {"op": "keys", "seq": 1, "chars": 5},
+                            {"op": "keys", "seq": "1", "chars": "i"}, {"op": "join", "race": "r2", "file": "test.c"}):
+                await self.send(writer, message)
+                self.assertEqual((await self.receive(reader))["op"], "error", message)
+            # Connection is still there
+            await self.send(writer, {"op": "keys", "seq": 3, "chars": self.text[:2]})
+            await self.barrier(reader, writer)
+            self.server.tick()
+            self.assertEqual((await self.receive(reader))["players"][0][4], 3)
+            writer.close()
+        self.run_session(session)
+
+    def test_oversized_message(self):
+        async def session(port):
+            reader, writer, _ = await self.join(port, "alice")
+            await self.send(writer, {"op": "keys", "seq": 1, "chars": "x" * (2 * LIMIT)})
+            self.assertEqual(await self.receive(reader), {"op": "error", "message": "message is too long"})
+            await self.send(writer, {"op": "keys", "seq": 2, "chars": self.text[:1]})
+            await self.barrier(reader, writer)
+            self.server.tick()
+            player = (await self.receive(reader))["players"][0]
+            # Keys of the long message weren't typed
+            self.assertEqual((player[3], player[4]), (0, 2))
+            writer.close()
+        self.run_session(session)
+
+    def test_unknown_file(self):
+        async def session(port):
+            reader, writer = await self.connect(port)
+            await self.send(writer, {"op": "join", "race": "r1", "file": "nope.c"})
+            self.assertEqual((await self.receive(reader))["op"], "error")
+            writer.close()
+        self.run_session(session)
+
+    def test_load_typist_refused(self):
+        report = Report()
+
+        async def session(port):
+            args = SimpleNamespace(host="127.0.0.1", port=port, race_size=20, file="nope.c", tick_ms=10)
+            await Typist(0, args, report).run(0)
+        self.run_session(session)
+        self.assertEqual((report.connected, report.failed, report.keys), (1, 1, 0))
+        self.assertEqual(sum(report.refused.values()), 1)
+
+
+class LoadReportTest(unittest.TestCase):
+
+    def test_late_ticks_fail_the_run(self):
+        report = Report()
+        report.latencies = [0.1] * 100
+        report.tick_lags = [0.0] * 100
+        self.assertEqual(report.failures(250), [])
+        report.tick_lags[-2:] = [0.4, 0.4]
+        report.latencies[-2:] = [0.6, 0.6]
+        self.assertEqual(len(report.failures(250)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
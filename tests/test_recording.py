@@ -0,0 +1,65 @@
+import os.path
+import tempfile
+import unittest
+
+from document import read_text
+from recording import KIND_FILTER, MAGIC, MAGIC_V1, Recorder, Replayer, read_recording
+
+TEST_C = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.c")
+
+
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.work_dir.name, "session.rec")
+        self.text = read_text(TEST_C)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def record(self):
+        recorder = Recorder(self.path, TEST_C, self.text)
+        recorder.resize(40, 10)
+        for char in self.text[:3]:
+            recorder.key(char, char)
+        recorder.filter(1, 2, 7)
+        recorder.close()
+
+    def test_filter_restores_scroll(self):
+        self.record()
+        replayer = Replayer(self.path)
+        replayer.run()
+        self.assertEqual((replayer.viewport.shifted_hor, replayer.viewport.shifted_vert), (2, 7))
+        self.assertIsNotNone(replayer.txt_filter.filtered)
+        self.assertEqual(replayer.keys, 3)
+
+    def test_first_version_is_read(self):
+        recorder = Recorder(self.path, TEST_C, self.text)
+        recorder.key("/", "slash")
+        recorder.key("/", "slash")
+        # Filter event of the first version: no time delta and only the value
+        recorder._buf.append(KIND_FILTER)
+        recorder._buf.append(1)
+        recorder.close()
+        with open(self.path, "r+b") as file:
+            self.assertEqual(file.read(len(MAGIC)), MAGIC)
+            file.seek(0)
+            file.write(MAGIC_V1)
+
+        _, events = read_recording(self.path)
+        events = list(events)
+        self.assertEqual(events[-1].kind, KIND_FILTER)
+        self.assertIsNone(events[-1].scroll)
+        self.assertEqual(len(events), 3)
+
+    def test_recording_is_not_overwritten(self):
+        self.record()
+        size = os.path.getsize(self.path)
+        with self.assertRaises(FileExistsError):
+            Recorder(self.path, TEST_C, self.text)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+
+if __name__ == "__main__":
+    unittest.main()
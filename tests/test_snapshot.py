@@ -0,0 +1,85 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from corpus import prepare
+from document import Document, read_text
+from snapshot import SnapshotCache, dump, parse
+
+TEST_C = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.c")
+TEST_TXT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.txt")
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.realpath(os.path.join(self.work_dir.name, "test.c"))
+        shutil.copy(TEST_C, self.path)
+        self.cache = SnapshotCache(os.path.join(self.work_dir.name, "snapshots"))
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def assert_same(self, parsed, prepared):
+        self.assertEqual(parsed.entry, prepared.entry)
+        doc, expected = parsed.doc, prepared.doc
+        self.assertEqual((doc.text, doc.line_len, doc.line_start, doc.line_cnt, doc.max_line_len),
+                         (expected.text, expected.line_len, expected.line_start, expected.line_cnt,
+                          expected.max_line_len))
+        if prepared.filtered is None:
+            self.assertIsNone(parsed.filtered)
+            return
+        filtered, expected = parsed.filtered, prepared.filtered
+        self.assertEqual((filtered.text, filtered.removed), (expected.text, expected.removed))
+        self.assertEqual((filtered.offsets.filtered_start, filtered.offsets.original_start),
+                         (expected.offsets.filtered_start, expected.offsets.original_start))
+
+    def test_round_trip(self):
+        for path in (self.path, TEST_TXT):
+            prepared = prepare(path)
+            stat = os.stat(path)
+            self.assert_same(parse(dump(prepared, stat.st_mtime_ns, stat.st_size), stat.st_mtime_ns, stat.st_size),
+                             prepared)
+
+    def test_other_version_of_the_file(self):
+        prepared = prepare(self.path)
+        data = dump(prepared, 10, 20)
+        self.assertIsNone(parse(data, 11, 20))
+        self.assertIsNone(parse(data, 10, 21))
+        self.assertIsNone(parse(b"TCSNAP00" + data[8:], 10, 20))
+        with self.assertRaises(ValueError):
+            parse(data[:-1], 10, 20)
+
+    def test_cache_is_invalidated_by_mtime(self):
+        stat = os.stat(self.path)
+        self.cache.save_later(self.path, stat, Document(read_text(self.path)))
+        self.cache.wait()
+        self.assert_same(self.cache.load(self.path), prepare(self.path))
+
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertIsNone(self.cache.load(self.path))
+
+    def test_broken_snapshot_is_not_used(self):
+        stat = os.stat(self.path)
+        self.cache.save(prepare(self.path), stat)
+        snapshot_path = self.cache.snapshot_path(self.path)
+        with open(snapshot_path, "r+b") as file:
+            file.truncate(os.path.getsize(snapshot_path) - 1)
+        with self.assertLogs("snapshot", "WARNING"):
+            self.assertIsNone(self.cache.load(self.path, stat))
+
+    def test_prune_keeps_the_newest(self):
+        other = os.path.join(self.work_dir.name, "test.txt")
+        shutil.copy(TEST_TXT, other)
+        self.cache.max_bytes = 1
+        self.cache.save(prepare(other), os.stat(other))
+        stat = os.stat(self.path)
+        self.cache.save(prepare(self.path), stat)
+        self.assertEqual(os.listdir(self.cache.directory), [os.path.basename(self.cache.snapshot_path(self.path))])
+        self.assertIsNotNone(self.cache.load(self.path, stat))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from constants import Constants as const
+from document import Document
+from state import ErrorIndex, StateStorage
+from state_structure import Coord
+
+
+class ErrorIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ErrorIndex()
+
+    def spans(self):
+        return [(tuple(start), tuple(end)) for start, end in self.index]
+
+    def test_neighbour_errors_are_merged(self):
+        self.index.add(1, 0, 1)
+        self.index.add(1, 1, 2)
+        # Inside of the span
+        self.index.add(1, 1, 2)
+        self.assertEqual(self.spans(), [((1, 0), (1, 2))])
+        self.assertEqual(len(self.index), 1)
+
+    def test_spans_are_sorted(self):
+        self.index.add(3, 4, 5)
+        self.index.add(1, 6, 7)
+        self.index.add(1, 2, 3)
+        # Not merged with the span of the previous line
+        self.index.add(3, 0, 1)
+        self.assertEqual(self.spans(), [((1, 2), (1, 3)), ((1, 6), (1, 7)), ((3, 0), (3, 1)), ((3, 4), (3, 5))])
+
+    def test_has_line(self):
+        self.index.add(2, 3, 4)
+        self.index.add(2, 7, 9)
+        self.index.add(5, 0, 1)
+        self.assertEqual([line for line in range(1, 7) if self.index.has_line(line)], [2, 5])
+        self.assertEqual(list(self.index.on_line(2)), [(Coord(2, 3), Coord(2, 4)), (Coord(2, 7), Coord(2, 9))])
+        self.assertEqual(list(self.index.on_line(3)), [])
+
+    def test_clear(self):
+        self.index.add(1, 0, 1)
+        self.index.clear()
+        self.assertFalse(self.index.has_line(1))
+        self.assertEqual(len(self.index), 0)
+
+
+class StateStorageTest(unittest.TestCase):
+
+    def test_offsets_round_trip(self):
+        doc = Document("abc\ndef\nghi")
+        storage = StateStorage()
+        storage.save_state(const._CORRECT, Coord(1, 0), Coord(2, 1))
+        storage.save_state(const._INCORRECT, Coord(2, 1), Coord(2, 3))
+        storage.add_error(2, 1, 3)
+        borders, errors = storage.to_offsets(doc)
+        self.assertEqual((borders, errors), ([0, 5, 5, 7], [(5, 7)]))
+
+        other = StateStorage()
+        other.from_offsets(doc, borders, errors)
+        self.assertEqual(other.pos, storage.pos)
+        self.assertTrue(other.is_err_on_line(2))
+        self.assertTrue(other.has_error())
+
+
+if __name__ == "__main__":
+    unittest.main()
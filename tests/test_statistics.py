@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+
+import statistics
+from constants import Constants as const
+from statistics import KeystrokeLog, Statistics
+
+SEC_NS = 1000000000
+
+
+class KeystrokeLogTest(unittest.TestCase):
+
+    def test_ring_keeps_the_last_keystrokes(self):
+        log = KeystrokeLog(3)
+        for i, char in enumerate("abcde"):
+            log.append(i, char, 1, i, KeystrokeLog.CORRECT)
+        self.assertEqual((log.total, len(log)), (5, 3))
+        self.assertEqual([key.char for key in log], ["c", "d", "e"])
+        self.assertEqual(log.get(3), (3, "d", 1, 3, KeystrokeLog.CORRECT))
+        log.clear()
+        self.assertEqual(list(log), [])
+
+
+class RollingWindowTest(unittest.TestCase):
+    """ Keystrokes come at the given moments, the window is const.ROLLING_WINDOW_SEC long """
+
+    def record(self, stat: Statistics, seconds, flag: int = KeystrokeLog.CORRECT):
+        for second in seconds:
+            with mock.patch.object(statistics.time, "perf_counter_ns", return_value=int(second * SEC_NS)):
+                stat.record("a", 1, 0, flag)
+
+    def test_window_moves(self):
+        self.assertEqual(const.ROLLING_WINDOW_SEC, 10)
+        stat = Statistics()
+        self.record(stat, range(11))
+        # 11 symbols in 10 seconds
+        self.assertAlmostEqual(stat.rolling_wpm, 11 / 5 * 6)
+        self.assertAlmostEqual(stat.mean_latency_ms, 1000)
+
+        # Keystrokes of the first 2 seconds are out of the window
+        self.record(stat, [12])
+        self.assertAlmostEqual(stat.rolling_wpm, 10 / 5 * 6)
+        self.assertAlmostEqual(stat.mean_latency_ms, 10000 / 9)
+
+    def test_wrong_keys_are_not_speed(self):
+        stat = Statistics()
+        self.record(stat, [0, 1])
+        self.record(stat, [2, 3, 4], KeystrokeLog.WRONG)
+        self.assertAlmostEqual(stat.rolling_wpm, 2 / 5 * 15)
+        self.assertAlmostEqual(stat.mean_latency_ms, 1000)
+
+    def test_window_of_overwritten_keystrokes(self):
+        stat = Statistics(log_size=4)
+        self.record(stat, [0, 0.1, 0.2, 0.3, 0.4, 0.5])
+        # Only the keystrokes which are still in the log are in the window
+        self.assertAlmostEqual(stat.rolling_wpm, 4 / 5 / (0.3 / 60))
+        self.assertEqual(stat.latency.total()[0], 0)
+        self.assertEqual(sum(stat.latency.total()), 5)
+
+    def test_reset(self):
+        stat = Statistics()
+        self.record(stat, [0, 1, 2])
+        stat.reset()
+        self.assertEqual((stat.rolling_wpm, stat.mean_latency_ms, len(stat.log)), (0, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Timing spans of the keystroke handling, exported as Chrome trace events.
+Open the file in chrome://tracing or https://ui.perfetto.dev
+
+    python main.py --trace trace.json
+    TYPING_TRACE=trace.json python main.py
+
+Disabled tracer hands out one shared empty span, so the instrumented code
+costs a method call and a 'with' per span.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+from constants import Constants as const
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_tracer", "_name", "_start")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self._tracer = tracer
+        self._name = name
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer.add(self._name, self._start, time.perf_counter_ns())
+        return False
+
+
+class Tracer:
+    """
+    Keeps the last 'capacity' spans in memory. Keystroke latency is the time from
+    the key event to the end of the frame which drew it, see key_started() and frame_drawn().
+    """
+
+    def __init__(self, path: str = None, capacity: int = const.TRACE_MAX_SPANS):
+        self.path = path
+        self.enabled = path is not None
+        self.logger = logging.getLogger(__name__)
+        # (name, start ns, end ns)
+        self._spans = deque(maxlen=capacity)
+        self._pending_keys = []
+        self.latencies_ns = deque(maxlen=const.TRACE_LATENCY_KEYS)
+        self._origin_ns = time.perf_counter_ns()
+        self._tid = threading.get_ident()
+
+    @classmethod
+    def from_env(cls, path: str = None) -> "Tracer":
+        """ Path from the command line wins over the environment variable """
+        return cls(path or os.environ.get(const.TRACE_ENV) or None)
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name: str, start_ns: int, end_ns: int):
+        self._spans.append((name, start_ns, end_ns))
+
+    def key_started(self):
+        if self.enabled:
+            self._pending_keys.append(time.perf_counter_ns())
+
+    def frame_drawn(self):
+        if not self._pending_keys:
+            return
+        now = time.perf_counter_ns()
+        self.latencies_ns.extend(now - start for start in self._pending_keys)
+        self._pending_keys.clear()
+
+    def latency_ms(self) -> Optional[Tuple[float, float]]:
+        """ p50 and p99 of the last keystrokes latency """
+        if not self.latencies_ns:
+            return None
+        values = sorted(self.latencies_ns)
+        return (values[len(values) // 2] / 1e6,
+                values[min(len(values) - 1, int(len(values) * 0.99))] / 1e6)
+
+    def events(self) -> list:
+        pid = os.getpid()
+        return [{"name": name, "cat": "typing", "ph": "X", "pid": pid, "tid": self._tid,
+                 "ts": (start - self._origin_ns) / 1000, "dur": (end - start) / 1000}
+                for name, start, end in self._spans]
+
+    def save(self):
+        if not self.enabled:
+            return
+        import json
+        try:
+            with open(self.path, "w") as file:
+                json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, file)
+        except OSError as err:
+            self.logger.warning("Trace is not saved: %s", err)
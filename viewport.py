@@ -0,0 +1,163 @@
+"""
+Viewport model for the text focus shifting. Visible rows/columns and the
+trigger thresholds are cached and recalculated only when the widget is
+resized or its font is changed, so every scroll decision is a few integer
+comparisons without any Tk call.
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from constants import Constants as const
+from document import Document
+
+
+@dataclass
+class ViewShift:
+    """ What the frontend has to do with its view: scroll for units and/or move horizontally to a fraction """
+    x_units: int = 0
+    y_units: int = 0
+    x_moveto: Optional[float] = None
+
+
+class Viewport:
+
+    def __init__(self, trigger: int = const.DEFAULT_SHIFT_FOCUS_TRIGGER):
+        self.logger = logging.getLogger(__name__)
+        self.trigger = trigger
+        self.valid = False
+        self.visible_cols = 0
+        self.visible_rows = 0
+        self.shifted_hor = 0
+        self.shifted_vert = 0
+        self._right_lvl = self._left_lvl = self._bottom_lvl = self._top_lvl = 0
+
+    def invalidate(self):
+        self.valid = False
+
+    def resize(self, visible_cols: int, visible_rows: int):
+        """ Recalculate thresholds for the left, right, top and bottom sides inside the window """
+        self.visible_cols = visible_cols
+        self.visible_rows = visible_rows
+        self._right_lvl = int(math.floor(visible_cols * (1 - self.trigger / 100)))
+        self._left_lvl = math.ceil(visible_cols * self.trigger / 100)
+        self._bottom_lvl = int(math.floor(visible_rows * (1 - self.trigger / 100)))
+        self._top_lvl = math.ceil(visible_rows * self.trigger / 100)
+        self.valid = True
+
+    def reset_scroll(self):
+        self.shifted_hor = self.shifted_vert = 0
+
+    def shift(self, column: int, line: int, event_key: str, doc: Document) -> ViewShift:
+        view_shift = ViewShift()
+        symbols_per_curr_line = doc.get_line_len(line)
+        visible_cols, visible_rows = self.visible_cols, self.visible_rows
+
+        # Top and bottom shifts for the 2 events:
+        # 1 - end of the line when event_key='Enter' to go to the next line.
+        # 2 - Beginning of the line. event_key='Backspace' to go to the prev line.
+        #     Line can be empty!
+        if column == 0 or column == symbols_per_curr_line:
+            win_up_shift = math.floor(self.shifted_vert + visible_rows / 2 - line)
+            line_cnt = doc.line_cnt
+
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"First line: 0\n"
+                                  f"-\n"
+                                  f"-\n"
+                                  f"{self.shifted_vert} + (can up for {win_up_shift})[\n"
+                                  f"...\n"
+                                  f"top level   : {self._top_lvl}\n"
+                                  f"...\n"
+                                  f"active line : {line}\n"
+                                  f"...\n"
+                                  f"bottom level: {self._bottom_lvl}\n"
+                                  f"...\n"
+                                  f"]  {visible_rows + self.shifted_vert}\n"
+                                  f"-\n"
+                                  f"Last line: {line_cnt} \n\n")
+
+            # Check bottom border
+            if ((line - self.shifted_vert) >= self._bottom_lvl) and (self.shifted_vert + visible_rows < line_cnt):
+                win_down_shift = int(line - self.shifted_vert - visible_rows / 2) % (line_cnt - visible_rows)
+                view_shift.y_units = win_down_shift
+                self.shifted_vert += win_down_shift
+                self.logger.debug("Shifted down %d", win_down_shift)
+
+            # Check top border
+            elif self.shifted_vert >= win_up_shift and (line - self.shifted_vert <= self._top_lvl):
+                self.shifted_vert -= win_up_shift
+                view_shift.y_units = -win_up_shift
+                self.logger.debug("Shifted top: %d", win_up_shift)
+
+        self.logger.debug("Start: ... %d ... [ ..%d....%d....%d..] %d ... END %d", self.shifted_hor,
+                          self._left_lvl, column, self._right_lvl, visible_cols, symbols_per_curr_line)
+        # Calc right border
+        win_left_shift = math.floor(self.shifted_hor + visible_rows / 2 - column)
+
+        # Check for special conditions
+
+        # End of line and we type Return
+        if event_key == "Return":
+            view_shift.x_moveto = 0
+            self.shifted_hor = 0
+            return view_shift
+
+        # Begin of line and we type BackSpace
+        if event_key == "BackSpace" and column == 0:
+            shift = doc.get_line_len(line - 1) - self._left_lvl
+            if shift > 0:
+                # One more symbol for the cursor at the end of the longest line, see App.max_symbols_per_line
+                view_shift.x_moveto = shift / (doc.max_line_len + 1)
+                self.shifted_hor = shift
+            else:
+                self.shifted_hor = 0
+            return view_shift
+
+        # Check left and right borders
+
+        # Right border
+        if (column - self.shifted_hor) >= self._right_lvl:
+            r_shift = 0
+            # Empty line can get here only if the viewport is (almost) zero columns wide,
+            # e.g. before the widget is mapped. There is nothing to shift then.
+            if symbols_per_curr_line:
+                r_shift = math.floor((column - (self.shifted_hor + visible_cols / 2)) % symbols_per_curr_line)
+            else:
+                self.logger.warning("Can't shift right: %d %d %d", self.shifted_hor, visible_cols, column)
+
+            view_shift.x_units = r_shift
+            self.shifted_hor += r_shift
+            self.logger.debug("Shifted right %d", r_shift)
+
+        # Left border
+        elif (self.shifted_hor >= 1) and (win_left_shift > 0) and (column - self.shifted_hor <= self._left_lvl):
+            self.shifted_hor -= win_left_shift
+            view_shift.x_units = -win_left_shift
+            self.logger.debug("Shifted left: %d", win_left_shift)
+
+        return view_shift
+
+    def jump(self, column: int, line: int, doc: Document) -> ViewShift:
+        """
+        Cursor moved for many symbols at once (e.g. pasted text). If it left the
+        trigger levels, its line and column are brought to the middle of the view.
+        """
+        view_shift = ViewShift()
+        if not self._top_lvl < line - self.shifted_vert < self._bottom_lvl:
+            top = max(0, min(line - self.visible_rows // 2, doc.line_cnt - self.visible_rows))
+            view_shift.y_units = top - self.shifted_vert
+            self.shifted_vert = top
+
+        if column < self._right_lvl:
+            # Fits without the horizontal scroll
+            left = 0
+        elif not self._left_lvl < column - self.shifted_hor < self._right_lvl:
+            left = column - self.visible_cols // 2
+        else:
+            left = self.shifted_hor
+        view_shift.x_units = left - self.shifted_hor
+        self.shifted_hor = left
+        return view_shift